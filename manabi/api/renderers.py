@@ -1,4 +1,5 @@
-from rest_framework.renderers import TemplateHTMLRenderer
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer, TemplateHTMLRenderer
 
 
 class ModelViewSetHTMLRenderer(TemplateHTMLRenderer):
@@ -8,3 +9,30 @@ class ModelViewSetHTMLRenderer(TemplateHTMLRenderer):
         if response.exception:
             data['status_code'] = response.status_code
         return context
+
+
+def _json_list_pieces(chunks):
+    renderer = JSONRenderer()
+    yield b'['
+    first_chunk = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not first_chunk:
+            yield b','
+        # Each chunk's rendered items, without the chunk's own brackets.
+        yield renderer.render(chunk)[1:-1]
+        first_chunk = False
+    yield b']'
+
+
+class StreamingJSONListResponse(StreamingHttpResponse):
+    '''
+    Streams a JSON list, rendering it a chunk at a time from `chunks`, an
+    iterable of lists of serialized items. The result is the same as
+    rendering all the items as one list with `JSONRenderer`.
+    '''
+    def __init__(self, chunks, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super(StreamingJSONListResponse, self).__init__(
+            _json_list_pieces(chunks), **kwargs)
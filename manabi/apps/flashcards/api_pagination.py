@@ -0,0 +1,110 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
+
+from manabi.apps.flashcards.models.constants import (
+    SYNC_MAX_PAGE_SIZE,
+    SYNC_PAGE_SIZE,
+)
+
+
+def _encode_cursor(modified_at, fact_id):
+    return base64.urlsafe_b64encode(
+        json.dumps([modified_at.isoformat(), fact_id]))
+
+
+def _decode_cursor(cursor):
+    try:
+        modified_at, fact_id = json.loads(base64.urlsafe_b64decode(
+            cursor.encode('ascii')))
+        modified_at = parse_datetime(modified_at)
+        fact_id = int(fact_id)
+    except (TypeError, ValueError, UnicodeError):
+        modified_at = None
+    if modified_at is None:
+        raise ValidationError("Invalid cursor.")
+    return modified_at, fact_id
+
+
+def encode_changes_cursor(positions):
+    return base64.urlsafe_b64encode(json.dumps({
+        kind: [change_txid, id_]
+        for kind, (change_txid, id_) in positions.iteritems()
+    }, sort_keys=True))
+
+
+def decode_changes_cursor(cursor, kinds):
+    '''
+    Returns the positions in a cursor from `encode_changes_cursor`, for
+    the changes of `kinds`.
+    '''
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(
+            cursor.encode('ascii')))
+        return {
+            kind: (int(change_txid), int(id_))
+            for kind, (change_txid, id_) in positions.iteritems()
+            if kind in kinds
+        }
+    except (AttributeError, TypeError, ValueError, UnicodeError):
+        raise ValidationError("Invalid cursor.")
+
+
+def get_page_size(request):
+    page_size = request.query_params.get('page_size')
+    if page_size is None:
+        return SYNC_PAGE_SIZE
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise ValidationError("Invalid page_size value.")
+    if page_size < 1:
+        raise ValidationError("Invalid page_size value.")
+    return min(page_size, SYNC_MAX_PAGE_SIZE)
+
+
+def wants_fact_sync_page(request):
+    return (
+        'cursor' in request.query_params
+        or 'page_size' in request.query_params
+    )
+
+
+def fact_sync_page(request, facts):
+    '''
+    Returns a page of `facts` in the order they were last changed, and the
+    URL of the next page (or `None` on the last page).
+
+    Paginates on a cursor of the last fact's modification time and ID
+    (which the fact table's `(deck, modified_at, id)` index serves), passed as the `cursor` query
+    parameter, so a client can sync a deck's facts incrementally by
+    following `next` and storing the last one it got. Pages don't shift
+    when facts change in between, unlike with offsets.
+    '''
+    page_size = get_page_size(request)
+
+    facts = facts.order_by('modified_at', 'id')
+
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        modified_at, fact_id = _decode_cursor(cursor)
+        facts = facts.filter(
+            Q(modified_at__gt=modified_at)
+            | Q(modified_at=modified_at, id__gt=fact_id)
+        )
+
+    page = list(facts[:page_size + 1])
+    if len(page) <= page_size:
+        return page, None
+
+    page = page[:page_size]
+    next_url = replace_query_param(
+        request.build_absolute_uri(),
+        'cursor',
+        _encode_cursor(page[-1].modified_at, page[-1].id),
+    )
+    return page, next_url
@@ -6,6 +6,7 @@ from manabi.apps.flashcards import api_views
 urlpatterns = [
     # url(r'^next_cards_for_review/$', api.NextCardsForReview.as_view()),
     url(r'^undo_card_review/$', api_views.UndoCardReviewView.as_view()),
+    url(r'^changes/$', api_views.ChangesView.as_view()),
     # url(r'^cards/(?P<card>\w+)/$', api.Card.as_view(), name='api_card'),
     # url(r'^cards/(?P<card>\w+)/review/$', api.CardReview.as_view(), name='api_card_review'),
 
@@ -18,6 +18,7 @@ from rest_framework.views import APIView
 from rest_framework_extensions.cache.mixins import cache_response
 import pytz
 
+from manabi.api.renderers import StreamingJSONListResponse
 from manabi.api.viewsets import MultiSerializerViewSetMixin
 from manabi.apps.featured_decks.models import get_featured_decks
 from manabi.apps.flashcards.models import (
@@ -32,14 +33,39 @@ from manabi.apps.flashcards.api_filters import (
     review_availabilities_filters,
     next_cards_to_review_filters,
 )
+from manabi.apps.flashcards.api_pagination import (
+    decode_changes_cursor,
+    encode_changes_cursor,
+    fact_sync_page,
+    get_page_size,
+    wants_fact_sync_page,
+)
 from manabi.apps.flashcards.models.card_review import (
+    BulkCardReview,
     CardReview,
 )
+from manabi.apps.flashcards.models.changes import (
+    CHANGE_KINDS,
+    changes_since,
+)
+from manabi.apps.flashcards.models.deck_counts import (
+    CARD_COUNT,
+    SUBSCRIBER_COUNT,
+    deck_counts,
+)
+from manabi.apps.flashcards.models.synchronization import (
+    SubscriberSyncProgress,
+)
 from manabi.apps.flashcards.permissions import (
     DeckSynchronizationPermission,
     IsOwnerPermission,
 )
 from manabi.apps.flashcards.serializers import (
+    BulkCardReviewSerializer,
+    BulkFactEditSerializer,
+    ChangedCardSerializer,
+    ChangedDeckSerializer,
+    ChangedFactSerializer,
     CardReviewSerializer,
     CardSerializer,
     DetailedCardSerializer,
@@ -52,6 +78,7 @@ from manabi.apps.flashcards.serializers import (
     SharedDeckSerializer,
     SuggestedSharedDecksSerializer,
     SynchronizedDeckSerializer,
+    serialize_card_listing,
 )
 from manabi.apps.manabi_auth.serializers import UserSerializer
 
@@ -66,6 +93,29 @@ class _DeckMixin(object):
         })
         return context
 
+    def _facts_response(self, facts, serializer_class, context=None):
+        '''
+        Lists `facts`, streamed as one JSON list built a chunk of facts at
+        a time. Or, when a `cursor` or `page_size` is given, as one page of
+        them in the order they were last changed (see `fact_sync_page`).
+        '''
+        context = context or {}
+        facts = facts.select_related('deck')
+        facts = facts.prefetch_active_card_templates()
+
+        if wants_fact_sync_page(self.request):
+            page, next_url = fact_sync_page(self.request, facts)
+            return Response({
+                'results': serializer_class(
+                    page, many=True, context=context).data,
+                'next': next_url,
+            })
+
+        return StreamingJSONListResponse(
+            serializer_class(chunk, many=True, context=context).data
+            for chunk in facts.in_chunks()
+        )
+
     @detail_route()
     def subscribers(self, request, pk=None):
         deck = self.get_object()
@@ -93,26 +143,32 @@ class DeckViewSet(_DeckMixin, viewsets.ModelViewSet):
     @detail_route()
     def cards(self, request, pk=None):
         deck = self.get_object()
-        cards = Card.objects.of_deck(deck)
-        return Response(CardSerializer(cards, many=True).data)
+        cards = Card.objects.of_deck(deck).order_by('id')
+        return Response(serialize_card_listing(cards))
 
     @detail_route()
-    def facts(self, request, pk=None):
+    def sync_progress(self, request, pk=None):
+        '''
+        How far along copying this deck's facts to its subscribers is, or
+        `null` when nothing's under way.
+        '''
         deck = self.get_object()
-        facts = Fact.objects.deck_facts(deck)
-        facts = facts.select_related('deck')
-        facts = facts.prefetch_active_card_templates()
+        return Response({
+            'sync_progress': SubscriberSyncProgress(deck.id).as_dict(),
+        })
 
+    @detail_route()
+    def facts(self, request, pk=None):
+        deck = self.get_object()
         deck_serializer = DeckSerializer(deck)
 
-        serializer = DetailedFactSerializer(
-            facts,
-            many=True,
+        return self._facts_response(
+            Fact.objects.deck_facts(deck),
+            DetailedFactSerializer,
             context={
                 'deck_data': deck_serializer.data,
             },
         )
-        return Response(serializer.data)
 
 
 class SynchronizedDeckViewSet(viewsets.ModelViewSet):
@@ -159,13 +215,8 @@ class SharedDeckViewSet(_DeckMixin, viewsets.ReadOnlyModelViewSet):
     @detail_route()
     def facts(self, request, pk=None):
         deck = self.get_object()
-        facts = Fact.objects.deck_facts(deck)
-        facts = facts.select_related('deck')
-        facts = facts.prefetch_active_card_templates()
-
-        return Response(
-            FactSerializer(facts, many=True).data
-        )
+        return self._facts_response(
+            Fact.objects.deck_facts(deck), FactSerializer)
 
     def get_queryset(self):
         decks = Deck.objects.filter(active=True, shared=True)
@@ -211,6 +262,26 @@ class FactViewSet(MultiSerializerViewSetMixin, viewsets.ModelViewSet):
         facts = facts.prefetch_related('card_set')
         return facts
 
+    @list_route(methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_edit(self, request):
+        '''
+        Edits many facts at once. Subscribers' copies are updated in the
+        background.
+        '''
+        input_serializer = BulkFactEditSerializer(
+            data=request.data, many=True)
+        if not input_serializer.is_valid():
+            return Response(input_serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        facts = Fact.objects.filter(deck__owner=request.user, active=True)
+        try:
+            facts = facts.bulk_edit(input_serializer.validated_data)
+        except Fact.DoesNotExist:
+            raise Http404
+
+        return Response(FactSerializer(facts, many=True).data)
+
     # TODO Special code for getting a specific object, for speed.
 
 
@@ -320,7 +391,11 @@ class CardViewSet(viewsets.ModelViewSet):
     permissions_classes = [IsOwnerPermission]
 
     def get_queryset(self):
-        return Card.objects.of_user(self.request.user)
+        return Card.objects.of_user(self.request.user).select_related('fact')
+
+    def list(self, request, *args, **kwargs):
+        cards = self.filter_queryset(self.get_queryset()).order_by('id')
+        return Response(serialize_card_listing(cards))
 
     @detail_route(methods=['post'], permission_classes=[IsAuthenticated])
     def reviews(self, request, pk=None):
@@ -335,6 +410,28 @@ class CardViewSet(viewsets.ModelViewSet):
             return Response(input_serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
 
+    @list_route(methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_reviews(self, request):
+        '''
+        Applies a list of reviews made offline, oldest first, all at once.
+        '''
+        input_serializer = BulkCardReviewSerializer(
+            data=request.data, many=True)
+        if not input_serializer.is_valid():
+            return Response(input_serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        bulk_card_review = BulkCardReview(
+            request.user, input_serializer.validated_data)
+        try:
+            cards = bulk_card_review.apply_reviews()
+        except Card.DoesNotExist:
+            raise Http404
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(CardSerializer(cards, many=True).data)
+
 
 class UndoCardReviewView(APIView):
     permission_classes = [IsAuthenticated]
@@ -346,3 +443,46 @@ class UndoCardReviewView(APIView):
             return Response("Nothing to undo.", status=status.HTTP_404_NOT_FOUND)
 
         return Response(CardSerializer(card).data)
+
+
+class ChangesView(APIView):
+    '''
+    The user's decks, facts and cards which changed since `cursor`,
+    including deactivated ones as tombstones. Omit `cursor` to start from
+    the beginning. Follow the returned `cursor` while `has_more`, then
+    keep it for the next sync.
+    '''
+    permission_classes = [IsAuthenticated]
+
+    serializer_classes = {
+        'decks': ChangedDeckSerializer,
+        'facts': ChangedFactSerializer,
+        'cards': ChangedCardSerializer,
+    }
+
+    def get(self, request, format=None):
+        positions = None
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            positions = decode_changes_cursor(cursor, CHANGE_KINDS)
+
+        changes, positions, has_more = changes_since(
+            request.user, positions, page_size=get_page_size(request))
+
+        deck_ids = [deck.id for deck in changes['decks'] if deck.active]
+        context = {
+            'request': request,
+            'card_counts': deck_counts(deck_ids, CARD_COUNT),
+            'subscriber_counts': deck_counts(deck_ids, SUBSCRIBER_COUNT),
+        }
+        data = {
+            kind: self.serializer_classes[kind](
+                changes[kind], many=True, context=context,
+            ).data
+            for kind in CHANGE_KINDS
+        }
+        data.update({
+            'cursor': encode_changes_cursor(positions),
+            'has_more': has_more,
+        })
+        return Response(data)
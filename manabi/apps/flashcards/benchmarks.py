@@ -0,0 +1,357 @@
+'''
+Timings and query counts for the review hot paths, against synthetic
+users with large decks.
+
+Run them with the `benchmark_review_paths` management command, which
+prints the results as JSON so that runs can be compared across commits.
+'''
+
+import itertools
+import random
+import uuid
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from manabi.apps.flashcards.api_views import FactViewSet
+from manabi.apps.flashcards.models import (
+    PRODUCTION,
+    RECOGNITION,
+    BuriedFact,
+    Card,
+    CardHistory,
+    Deck,
+    Fact,
+    NextCardsForReview,
+    ReviewAvailabilities,
+)
+from manabi.apps.flashcards.models.constants import (
+    ALL_GRADES,
+    DEFAULT_TIME_ZONE,
+    GRADE_EASY,
+    GRADE_GOOD,
+    GRADE_HARD,
+    GRADE_NONE,
+    MAX_NEW_CARD_ORDINAL,
+)
+from manabi.apps.flashcards.models.deck_counts import _deck_counts_key
+from manabi.apps.flashcards.models.review_queue_snapshot import (
+    ReviewQueueSnapshot,
+    _snapshot_key,
+)
+from manabi.apps.flashcards.models.synchronization import BULK_BATCH_SIZE
+from manabi.apps.flashcards.serializers import (
+    CardSerializer,
+    NextCardsForReviewSerializer,
+    ReviewAvailabilitiesSerializer,
+    serialize_card_listing,
+)
+from manabi.apps.manabi_redis.models import redis
+from manabi.apps.utils.benchmarking import Benchmarks, time_rounds
+
+BENCHMARK_CARD_TEMPLATES = [PRODUCTION, RECOGNITION]
+
+BENCHMARK_USERNAME_PREFIX = 'benchmark-'
+
+_KANA = u'あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん'
+
+BenchmarkFixtures = namedtuple(
+    'BenchmarkFixtures', ['reviewer', 'author', 'shared_deck'])
+
+
+def _create_user(role):
+    return User.objects.create_user(
+        '{}{}-{}'.format(
+            BENCHMARK_USERNAME_PREFIX, role, uuid.uuid4().hex[:12]),
+        'benchmark@example.com',
+    )
+
+
+def _random_kana(rng, length):
+    return u''.join(rng.choice(_KANA) for _ in xrange(length))
+
+
+def _random_schedule(rng, now):
+    '''
+    Returns the fields of a card somewhere along in its learning, and the
+    `CardHistory` fields of the reviews that got it there (oldest first).
+
+    About a third of cards are new, and the rest are split between
+    failed, young and mature ones, a fraction of which are due.
+    '''
+    state = rng.random()
+    if state < 0.35:
+        return {}, []
+
+    ease_factor = rng.uniform(1.3, 3.0)
+    if state < 0.45:
+        grade = GRADE_NONE
+        interval = timedelta(minutes=10)
+    elif state < 0.75:
+        grade = rng.choice([GRADE_HARD, GRADE_GOOD, GRADE_EASY])
+        interval = timedelta(minutes=rng.randrange(10, 60 * 24 * 19))
+    else:
+        grade = rng.choice([GRADE_HARD, GRADE_GOOD, GRADE_EASY])
+        interval = timedelta(days=rng.randrange(20, 365))
+
+    last_reviewed_at = now - timedelta(
+        seconds=interval.total_seconds() * rng.uniform(0.1, 1.5))
+
+    review_count = rng.randint(1, 8)
+    histories = []
+    reviewed_at, history_interval = last_reviewed_at, interval
+    for index in xrange(review_count):
+        histories.append({
+            'response': grade if index == 0 else GRADE_GOOD,
+            'reviewed_at': reviewed_at,
+            'ease_factor': ease_factor,
+            'interval': history_interval,
+            'was_new': index == review_count - 1,
+        })
+        history_interval = timedelta(
+            seconds=history_interval.total_seconds() / ease_factor)
+        reviewed_at -= history_interval
+    histories.reverse()
+
+    schedule = {
+        'ease_factor': ease_factor,
+        'interval': interval,
+        'due_at': last_reviewed_at + interval,
+        'last_reviewed_at': last_reviewed_at,
+        'last_review_grade': grade,
+        'review_count': review_count,
+    }
+    if grade == GRADE_NONE:
+        schedule['last_failed_at'] = last_reviewed_at
+    return schedule, histories
+
+
+def _create_facts(rng, deck, count, now=None, synchronized_with=None):
+    '''
+    Bulk-creates `count` facts in `deck` with a card per benchmark
+    template. Their cards get review histories as of `now` if it's given,
+    otherwise they're all new.
+
+    `synchronized_with` is an optional list of shared facts to subscribe
+    the new facts to, one each.
+    '''
+    created_facts = []
+    for start in xrange(0, count, BULK_BATCH_SIZE):
+        facts = Fact.objects.bulk_create([
+            Fact(
+                deck=deck,
+                synchronized_with=(
+                    synchronized_with[index] if synchronized_with else None),
+                new_fact_ordinal=rng.randrange(MAX_NEW_CARD_ORDINAL),
+                expression=_random_kana(rng, rng.randint(2, 6)),
+                reading=_random_kana(rng, rng.randint(2, 8)),
+                meaning=_random_kana(rng, rng.randint(4, 16)),
+            )
+            for index in xrange(start, min(start + BULK_BATCH_SIZE, count))
+        ])
+
+        cards, card_histories = [], []
+        for fact, template in itertools.product(
+            facts, BENCHMARK_CARD_TEMPLATES,
+        ):
+            schedule, histories = (
+                _random_schedule(rng, now) if now else ({}, []))
+            cards.append(Card(
+                owner_id=deck.owner_id,
+                deck=deck,
+                fact=fact,
+                template=template,
+                new_card_ordinal=rng.randrange(MAX_NEW_CARD_ORDINAL),
+                **schedule
+            ))
+            card_histories.append(histories)
+        Card.objects.bulk_create(cards)
+
+        CardHistory.objects.bulk_create(
+            (
+                CardHistory(card=card, **history)
+                for card, histories in itertools.izip(cards, card_histories)
+                for history in histories
+            ),
+            batch_size=BULK_BATCH_SIZE,
+        )
+
+        created_facts.extend(facts)
+    return created_facts
+
+
+def create_benchmark_fixtures(card_count=10000, seed=0):
+    '''
+    Creates a reviewer with about `card_count` cards, half in a deck of
+    their own and half in a subscription to another user's shared deck.
+
+    Everything is bulk-created, so no signals fire and no jobs get queued.
+    '''
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    fact_count = max(1, card_count // (2 * len(BENCHMARK_CARD_TEMPLATES)))
+
+    author = _create_user('author')
+    shared_deck = Deck.objects.create(
+        owner=author,
+        name='Benchmark Shared Deck',
+        shared=True,
+        shared_at=now,
+    )
+    shared_facts = _create_facts(rng, shared_deck, fact_count)
+
+    reviewer = _create_user('reviewer')
+    subscriber_deck = Deck.objects.create(
+        owner=reviewer,
+        name=shared_deck.name,
+        synchronized_with=shared_deck,
+    )
+    _create_facts(
+        rng, subscriber_deck, fact_count,
+        now=now, synchronized_with=shared_facts)
+
+    own_deck = Deck.objects.create(owner=reviewer, name='Benchmark Deck')
+    _create_facts(rng, own_deck, fact_count, now=now)
+
+    BuriedFact.objects.backfill(user=reviewer)
+
+    return BenchmarkFixtures(
+        reviewer=reviewer,
+        author=author,
+        shared_deck=shared_deck,
+    )
+
+
+########################################################################
+# Benchmarks
+#
+# Each takes the fixtures and the number of rounds it'll be run for, does
+# any setup, and returns a function which runs one round.
+
+BENCHMARKS = Benchmarks()
+benchmark = BENCHMARKS.register
+
+
+@benchmark
+def next_cards_for_review(fixtures, rounds):
+    def run():
+        # Measure building the queue, not serving it from a snapshot.
+        # (Invalidating would wait for a commit which never comes.)
+        redis.delete(ReviewQueueSnapshot(fixtures.reviewer).key)
+        NextCardsForReviewSerializer(NextCardsForReview(
+            fixtures.reviewer, 7, time_zone=DEFAULT_TIME_ZONE)).data
+    return run
+
+
+@benchmark
+def review_availabilities(fixtures, rounds):
+    def run():
+        ReviewAvailabilitiesSerializer(ReviewAvailabilities(
+            fixtures.reviewer, time_zone=DEFAULT_TIME_ZONE)).data
+    return run
+
+
+@benchmark
+def card_review(fixtures, rounds):
+    cards = itertools.cycle(
+        Card.objects.of_user(fixtures.reviewer).available()
+        .filter(due_at__isnull=False).order_by('due_at')[:rounds]
+    )
+    grades = itertools.cycle(ALL_GRADES)
+
+    def run():
+        next(cards).review(next(grades))
+    return run
+
+
+@benchmark
+def deck_subscribe(fixtures, rounds):
+    subscribers = iter([_create_user('subscriber') for _ in xrange(rounds)])
+
+    def run():
+        fixtures.shared_deck.subscribe(next(subscribers))
+    return run
+
+
+@benchmark
+def deck_card_counts(fixtures, rounds):
+    decks = Deck.objects.filter(
+        Q(owner=fixtures.reviewer) | Q(id=fixtures.shared_deck.id))
+
+    def run():
+        decks.card_counts()
+    return run
+
+
+@benchmark
+def card_list_serializer(fixtures, rounds):
+    cards = (
+        Card.objects.of_user(fixtures.reviewer)
+        .select_related('fact').order_by('id')
+    )
+
+    def run():
+        CardSerializer(cards, many=True).data
+    return run
+
+
+@benchmark
+def card_list_fast_path(fixtures, rounds):
+    cards = Card.objects.of_user(fixtures.reviewer).order_by('id')
+
+    def run():
+        serialize_card_listing(cards)
+    return run
+
+
+@benchmark
+def fact_list(fixtures, rounds):
+    view = FactViewSet.as_view({'get': 'list'})
+    request_factory = APIRequestFactory()
+
+    def run():
+        request = request_factory.get('/api/flashcards/facts/')
+        force_authenticate(request, user=fixtures.reviewer)
+        view(request).render()
+    return run
+
+
+def delete_benchmark_redis_keys():
+    '''
+    Deletes what the benchmarks stored in Redis for the synthetic users
+    and their decks (review queue snapshots and deck counts), which
+    rolling back the database doesn't undo. Call it before the rollback.
+    '''
+    user_ids = list(
+        User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX)
+        .values_list('id', flat=True)
+    )
+    deck_ids = Deck.objects.filter(owner_id__in=user_ids).values_list(
+        'id', flat=True)
+
+    keys = (
+        [_snapshot_key(user_id) for user_id in user_ids]
+        + [_deck_counts_key(deck_id) for deck_id in deck_ids]
+    )
+    if keys:
+        redis.delete(*keys)
+
+
+def run_benchmarks(fixtures, names=None, rounds=5, warmup_rounds=1):
+    '''
+    Runs the benchmarks named in `names` (or all of them). Returns an
+    ordered dict of benchmark names to their timings (in seconds) and
+    query counts per round.
+    '''
+    return OrderedDict(
+        (name, time_rounds(
+            benchmark_func(fixtures, rounds + warmup_rounds),
+            rounds=rounds,
+            warmup_rounds=warmup_rounds,
+            count_queries=True,
+        ))
+        for name, benchmark_func in BENCHMARKS.selected(names)
+    )
@@ -13,6 +13,7 @@ from manabi.apps.flashcards.signals import (
     fact_grid_updated,
     post_card_reviewed,
     card_active_field_changed,
+    cards_active_field_changed,
 )
 from models.fields import FieldContent
 
@@ -40,3 +41,9 @@ def nuke_human_readable_field(sender, instance, created, **kwargs):
 @receiver(pre_delete, sender=Card, dispatch_uid='deck_review_stats_cpd')
 def nuke_deck_review_stats_namespace(sender, instance, **kwargs):
     invalidate_namespace(deck_review_stats_namespace(instance.deck))
+
+@receiver(cards_active_field_changed, dispatch_uid='deck_review_stats_cafc_bulk')
+def nuke_deck_review_stats_namespaces(sender, instances, **kwargs):
+    decks = {card.deck_id: card.deck for card in instances}
+    for deck in decks.values():
+        invalidate_namespace(deck_review_stats_namespace(deck))
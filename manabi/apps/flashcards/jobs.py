@@ -0,0 +1,16 @@
+from django_rq import job
+
+from manabi.apps.flashcards.models import synchronization
+
+
+@job
+def copy_facts_to_subscriber_decks(
+    shared_deck_id, fact_ids, subscriber_deck_ids,
+):
+    synchronization.copy_facts_to_subscriber_decks(
+        shared_deck_id, fact_ids, subscriber_deck_ids)
+
+
+@job
+def propagate_pending_fact_edits(deck_id):
+    synchronization.propagate_pending_fact_edits(deck_id)
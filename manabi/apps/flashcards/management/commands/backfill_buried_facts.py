@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from manabi.apps.flashcards.models import BuriedFact
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the materialized fact burials from card reviews, '
+        'correcting any that bulk updates left stale. Run it regularly.'
+    )
+
+    def handle(self, *args, **options):
+        count = BuriedFact.objects.backfill()
+        self.stdout.write("Buried {} facts.".format(count))
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+from django.db import transaction
+
+from manabi.apps.flashcards.benchmarks import (
+    BENCHMARKS,
+    create_benchmark_fixtures,
+    delete_benchmark_redis_keys,
+    run_benchmarks,
+)
+from manabi.apps.utils.benchmarking import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Times the review hot paths against synthetic large decks and '
+        'prints the results as JSON. The synthetic data is rolled back '
+        'afterward, and what it left in Redis is deleted. Since nothing '
+        'commits, work deferred until commit (transaction.on_commit) '
+        'never runs and is excluded from the timings.'
+    )
+    benchmarks = BENCHMARKS
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--cards', type=int, default=10000)
+
+    def run_benchmarks(self, names, **options):
+        with transaction.atomic():
+            try:
+                fixtures = create_benchmark_fixtures(
+                    card_count=options['cards'], seed=options['seed'])
+                results = run_benchmarks(
+                    fixtures,
+                    names=names,
+                    rounds=options['rounds'],
+                    warmup_rounds=options['warmup_rounds'],
+                )
+            finally:
+                delete_benchmark_redis_keys()
+                transaction.set_rollback(True)
+
+        return OrderedDict([
+            ('cards', options['cards']),
+            ('seed', options['seed']),
+            ('excluded', (
+                'Work deferred until commit (transaction.on_commit) never '
+                'runs, since the synthetic data is rolled back.'
+            )),
+            ('results', results),
+        ])
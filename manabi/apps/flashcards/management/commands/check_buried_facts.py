@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from manabi.apps.flashcards.models import BuriedFact
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the materialized fact burials against burials computed '
+        'from card reviews.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+
+        inconsistent_user_count = 0
+        for user in users.iterator():
+            missing, extra = BuriedFact.objects.inconsistencies(user)
+            if not (missing or extra):
+                continue
+            inconsistent_user_count += 1
+            self.stdout.write(
+                "User {}: missing facts {}, extra facts {}".format(
+                    user.id, sorted(missing), sorted(extra)))
+
+        if inconsistent_user_count:
+            raise CommandError(
+                "{} users have inconsistent buried facts.".format(
+                    inconsistent_user_count))
+        self.stdout.write("Buried facts are consistent.")
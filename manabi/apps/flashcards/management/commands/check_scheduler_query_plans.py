@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from manabi.apps.flashcards.query_plans import check_scheduler_query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks that the scheduler's bucket queries can use the partial "
+        "indexes made for them (with sorts and sequential scans switched "
+        "off, so not that the planner would choose them). Checks the user "
+        "with the lowest ID who has cards, unless user IDs are given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+        else:
+            users = users.filter(card__isnull=False).distinct()[:1]
+
+        problem_count = 0
+        for user in users:
+            for problem in check_scheduler_query_plans(user):
+                problem_count += 1
+                self.stdout.write(
+                    "User {}: bucket {} can't use {} without sorting:\n{}"
+                    .format(
+                        user.id, problem.bucket, problem.expected_index,
+                        problem.plan))
+
+        if problem_count:
+            raise CommandError(
+                "{} scheduler queries can't use their indexes.".format(
+                    problem_count))
+        self.stdout.write("Scheduler queries can use their indexes.")
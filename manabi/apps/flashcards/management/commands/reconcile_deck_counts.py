@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from manabi.apps.flashcards.models.deck_counts import (
+    RECONCILE_CHUNK_SIZE,
+    reconcile_deck_counts,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Recounts the card and subscriber counts kept in Redis for decks, '
+        'and corrects any which have drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('deck_ids', nargs='*', type=int)
+        parser.add_argument(
+            '--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE,
+            help='How many decks to recount per query.')
+
+    def handle(self, *args, **options):
+        mismatches = reconcile_deck_counts(
+            deck_ids=options['deck_ids'] or None,
+            chunk_size=options['chunk_size'],
+        )
+
+        for deck_id, (stored, actual) in sorted(mismatches.iteritems()):
+            self.stdout.write(
+                "Deck {}: had {}, corrected to {}".format(
+                    deck_id, stored, actual))
+        self.stdout.write(
+            "Corrected the counts of {} decks.".format(len(mismatches)))
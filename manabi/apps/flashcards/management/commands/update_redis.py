@@ -1,29 +1,105 @@
-from django.core.management.base import BaseCommand
-
-from manabi.apps.flashcards.models.constants import (
-    GRADE_NONE, GRADE_HARD, GRADE_GOOD, GRADE_EASY,
-    MAX_NEW_CARD_ORDINAL, EASE_FACTOR_MODIFIERS,
-    YOUNG_FAILURE_INTERVAL, MATURE_FAILURE_INTERVAL,
-    MATURE_INTERVAL_MIN, GRADE_EASY_BONUS_FACTOR,
-    DEFAULT_EASE_FACTOR, INTERVAL_FUZZ_MAX,
-    ALL_GRADES, GRADE_NAMES)
-from manabi.apps.flashcards.models import Card
-from manabi.apps.manabi_redis.models import redis
-
+from timeit import default_timer
 
+from django.core.management.base import BaseCommand, CommandError
 
-def active_cards():
-    pass
+from manabi.apps.flashcards.models.redis_models import (
+    REBUILD_CHUNK_SIZE,
+    rebuild_redis,
+    remove_stale_keys,
+)
+from manabi.apps.manabi_redis.models import redis
 
 
-def update_redis():
-    for card in Card.objects.all():
-        card.redis.update_all()
+def _checkpoint_key(min_owner_id, max_owner_id):
+    return 'update_redis:checkpoint:{}-{}'.format(
+        min_owner_id or '', max_owner_id or '')
 
 
 class Command(BaseCommand):
+    help = (
+        "Rebuilds the flashcards data kept in Redis from the database, one "
+        "user at a time in owner ID order. Owner ID ranges can be run in "
+        "parallel as separate shards, and each shard checkpoints its "
+        "progress so it can be resumed. Afterwards, deletes what's left in "
+        "Redis for decks and users (in the shard) without cards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'flush', nargs='?', choices=['flush'],
+            help='Flush the whole Redis database first.')
+        parser.add_argument(
+            '--min-owner-id', type=int,
+            help='Only rebuild users with IDs above this.')
+        parser.add_argument(
+            '--max-owner-id', type=int,
+            help='Only rebuild users with IDs up to this.')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help="Continue from this owner ID range's last checkpoint.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=REBUILD_CHUNK_SIZE,
+            help='How many cards to read per query.')
+        parser.add_argument(
+            '--report-every', type=int, default=100000,
+            help='Report throughput every this many cards.')
+
     def handle(self, *args, **options):
-        if args and args[0].lower() == 'flush':
+        if options['flush'] and options['resume']:
+            raise CommandError("Can't resume after flushing.")
+
+        min_owner_id = options['min_owner_id']
+        max_owner_id = options['max_owner_id']
+        checkpoint_key = _checkpoint_key(min_owner_id, max_owner_id)
+
+        if options['flush']:
             redis.flushdb()
-        update_redis()
 
+        if options['resume']:
+            checkpoint = redis.get(checkpoint_key)
+            if checkpoint is not None:
+                min_owner_id = int(checkpoint)
+                self.stdout.write(
+                    "Resuming after owner {}.".format(min_owner_id))
+
+        progress = {'owners': 0, 'cards': 0, 'reported_cards': 0}
+        started_at = default_timer()
+
+        def report():
+            elapsed = default_timer() - started_at
+            self.stdout.write(
+                "{owners} users, {cards} cards in {elapsed:.1f}s "
+                "({rate:.0f} cards/s)".format(
+                    elapsed=elapsed,
+                    rate=progress['cards'] / elapsed if elapsed else 0,
+                    **progress))
+
+        def owner_rebuilt(owner_id, card_count):
+            redis.set(checkpoint_key, owner_id)
+            progress['owners'] += 1
+            progress['cards'] += card_count
+            if (
+                progress['cards'] - progress['reported_cards']
+                >= options['report_every']
+            ):
+                progress['reported_cards'] = progress['cards']
+                report()
+
+        rebuild_redis(
+            min_owner_id=min_owner_id,
+            max_owner_id=max_owner_id,
+            chunk_size=options['chunk_size'],
+            owner_rebuilt=owner_rebuilt,
+        )
+
+        redis.delete(checkpoint_key)
+        report()
+
+        if not options['flush']:
+            stale_key_count = remove_stale_keys(
+                min_owner_id=options['min_owner_id'],
+                max_owner_id=max_owner_id,
+                chunk_size=options['chunk_size'],
+            )
+            self.stdout.write(
+                "Deleted {} stale keys.".format(stale_key_count))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11a1 on 2017-02-04 21:12
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flashcards', '0040_deck_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuriedFact',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('buried_until', models.DateTimeField()),
+                ('fact', models.OneToOneField(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='burial', to='flashcards.Fact')),
+                ('owner', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='buriedfact',
+            index_together=set([('owner', 'buried_until')]),
+        ),
+    ]
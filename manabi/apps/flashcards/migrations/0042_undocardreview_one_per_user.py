@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11a1 on 2017-02-05 18:40
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def forwards(apps, schema_editor):
+    UndoCardReview = apps.get_model('flashcards', 'UndoCardReview')
+
+    latest_undo_ids = list(
+        UndoCardReview.objects
+        .order_by('user_id', '-timestamp', '-id')
+        .distinct('user_id')
+        .values_list('id', flat=True)
+    )
+    UndoCardReview.objects.exclude(id__in=latest_undo_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0041_buriedfact'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards),
+        migrations.AlterField(
+            model_name='undocardreview',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11a1 on 2017-02-06 23:05
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Partial indexes for the scheduler's buckets, each ordered the way its
+# bucket is (see `SchedulerMixin`), with ties broken by ID. Django 1.11
+# can't declare partial indexes on a model, hence the raw SQL.
+SCHEDULER_INDEXES = [
+    # New cards, by new card ordinal.
+    ('flashcards_card_new_by_ordinal',
+     '(owner_id, new_card_ordinal, id)',
+     'due_at IS NULL AND active AND NOT suspended'),
+    # Failed cards, due or not, by due date.
+    ('flashcards_card_failed_by_due_at',
+     '(owner_id, due_at, id)',
+     'last_review_grade = 0 AND active AND NOT suspended'),
+    # Due cards, by descending interval.
+    ('flashcards_card_scheduled_by_interval',
+     '(owner_id, interval, id)',
+     'due_at IS NOT NULL AND active AND NOT suspended'),
+    # Cards due soon (early review), by due date.
+    ('flashcards_card_scheduled_by_due_at',
+     '(owner_id, due_at, id)',
+     'due_at IS NOT NULL AND active AND NOT suspended'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0042_undocardreview_one_per_user'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX {} ON flashcards_card {} WHERE {}'.format(
+                name, columns, condition),
+            reverse_sql='DROP INDEX {}'.format(name),
+        )
+        for name, columns, condition in SCHEDULER_INDEXES
+    ]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11a1 on 2017-02-08 21:40
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Stamps `modified_at` on every insert and update which doesn't set it
+# itself, so that bulk updates, bulk inserts and raw SQL show up in the
+# changes feed too. `now()` is the transaction's start time, in UTC since
+# that's the connection's time zone.
+TOUCH_MODIFIED_AT_FUNCTION = '''
+CREATE FUNCTION flashcards_touch_modified_at() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.modified_at IS NULL THEN
+            NEW.modified_at := now();
+        END IF;
+    ELSIF NEW.modified_at IS NOT DISTINCT FROM OLD.modified_at THEN
+        NEW.modified_at := now();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+TRACKED_TABLES = [
+    'flashcards_card',
+    'flashcards_deck',
+    'flashcards_fact',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flashcards', '0044_card_scheduler_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='modified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='card',
+            index_together=set([('owner', 'due_at', 'active', 'suspended'), ('owner', 'modified_at', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='deck',
+            index_together=set([('owner', 'modified_at', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='fact',
+            index_together=set([('deck', 'modified_at', 'id')]),
+        ),
+        migrations.RunSQL(
+            TOUCH_MODIFIED_AT_FUNCTION,
+            reverse_sql='DROP FUNCTION flashcards_touch_modified_at()',
+        ),
+    ] + [
+        migrations.RunSQL(
+            '''
+            CREATE TRIGGER {0}_touch_modified_at
+            BEFORE INSERT OR UPDATE ON {0}
+            FOR EACH ROW EXECUTE PROCEDURE flashcards_touch_modified_at()
+            '''.format(table),
+            reverse_sql='DROP TRIGGER {0}_touch_modified_at ON {0}'.format(
+                table),
+        )
+        for table in TRACKED_TABLES
+    ]
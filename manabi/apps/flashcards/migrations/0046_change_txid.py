@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Same as in 0045, but also stamps `change_txid` with the ID of the
+# transaction making the change, which the changes feed pages by.
+TOUCH_MODIFIED_AT_FUNCTION = '''
+CREATE OR REPLACE FUNCTION flashcards_touch_modified_at() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.modified_at IS NULL THEN
+            NEW.modified_at := now();
+        END IF;
+    ELSIF NEW.modified_at IS NOT DISTINCT FROM OLD.modified_at THEN
+        NEW.modified_at := now();
+    END IF;
+    NEW.change_txid := txid_current();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+PREVIOUS_TOUCH_MODIFIED_AT_FUNCTION = '''
+CREATE OR REPLACE FUNCTION flashcards_touch_modified_at() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.modified_at IS NULL THEN
+            NEW.modified_at := now();
+        END IF;
+    ELSIF NEW.modified_at IS NOT DISTINCT FROM OLD.modified_at THEN
+        NEW.modified_at := now();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+# Copies the deck's owner onto facts as they're inserted or moved. Saves
+# which don't move a fact keep what's there, since the model's value can
+# be stale.
+SET_DECK_OWNER_FUNCTION = '''
+CREATE FUNCTION flashcards_fact_set_deck_owner() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF NEW.deck_id IS NOT DISTINCT FROM OLD.deck_id THEN
+            NEW.deck_owner_id := OLD.deck_owner_id;
+            RETURN NEW;
+        END IF;
+    END IF;
+    SELECT owner_id INTO NEW.deck_owner_id
+    FROM flashcards_deck WHERE id = NEW.deck_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+# Stamps what's already there once, without touching `modified_at`. Checks
+# constraints as it goes, since tables with pending deferred checks can't
+# be altered.
+BACKFILL = '''
+SET CONSTRAINTS ALL IMMEDIATE;
+
+ALTER TABLE flashcards_card DISABLE TRIGGER flashcards_card_touch_modified_at;
+UPDATE flashcards_card SET change_txid = txid_current();
+ALTER TABLE flashcards_card ENABLE TRIGGER flashcards_card_touch_modified_at;
+
+ALTER TABLE flashcards_deck DISABLE TRIGGER flashcards_deck_touch_modified_at;
+UPDATE flashcards_deck SET change_txid = txid_current();
+ALTER TABLE flashcards_deck ENABLE TRIGGER flashcards_deck_touch_modified_at;
+
+ALTER TABLE flashcards_fact DISABLE TRIGGER flashcards_fact_touch_modified_at;
+UPDATE flashcards_fact SET
+    change_txid = txid_current(),
+    deck_owner_id = flashcards_deck.owner_id
+FROM flashcards_deck
+WHERE flashcards_deck.id = flashcards_fact.deck_id;
+ALTER TABLE flashcards_fact ENABLE TRIGGER flashcards_fact_touch_modified_at;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flashcards', '0045_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='deck',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='fact',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='fact',
+            name='deck_owner',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunSQL(
+            TOUCH_MODIFIED_AT_FUNCTION,
+            reverse_sql=PREVIOUS_TOUCH_MODIFIED_AT_FUNCTION,
+        ),
+        migrations.RunSQL(
+            SET_DECK_OWNER_FUNCTION,
+            reverse_sql='DROP FUNCTION flashcards_fact_set_deck_owner()',
+        ),
+        migrations.RunSQL(
+            '''
+            CREATE TRIGGER flashcards_fact_set_deck_owner
+            BEFORE INSERT OR UPDATE ON flashcards_fact
+            FOR EACH ROW EXECUTE PROCEDURE flashcards_fact_set_deck_owner()
+            ''',
+            reverse_sql=(
+                'DROP TRIGGER flashcards_fact_set_deck_owner ON flashcards_fact'),
+        ),
+        migrations.AlterIndexTogether(
+            name='card',
+            index_together=set([('owner', 'due_at', 'active', 'suspended'), ('owner', 'change_txid', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='deck',
+            index_together=set([('owner', 'change_txid', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='fact',
+            index_together=set([('deck', 'modified_at', 'id'), ('deck_owner', 'change_txid', 'id')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Facts never edited before 0045 have no `modified_at`. Gives them their
+# creation time once, so deck fact listings can page by `modified_at`
+# alone (the trigger from 0045 keeps it set from then on). The trigger's
+# off meanwhile so this doesn't show up as a change to sync.
+BACKFILL = '''
+ALTER TABLE flashcards_fact DISABLE TRIGGER flashcards_fact_touch_modified_at;
+UPDATE flashcards_fact SET modified_at = created_at WHERE modified_at IS NULL;
+ALTER TABLE flashcards_fact ENABLE TRIGGER flashcards_fact_touch_modified_at;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0046_change_txid'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -1,6 +1,7 @@
 from manabi.apps.flashcards.models.cards import * #Card, CardHistory, CardStatistics
 from manabi.apps.flashcards.models.decks import *
 from manabi.apps.flashcards.models.facts import * #Fact, SharedFact
+from manabi.apps.flashcards.models.burying import BuriedFact
 from manabi.apps.flashcards.models.cardhistory import *
 from manabi.apps.flashcards.models.undo import *
 from manabi.apps.flashcards.models.review_availabilities import *
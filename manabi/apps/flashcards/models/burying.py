@@ -1,19 +1,300 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, models, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.query import QuerySet
+
+from manabi.apps.flashcards.models.constants import (
+    CARD_SPACE_FACTOR,
+    GRADE_NONE,
+    MIN_CARD_SPACE,
+)
+
+# Failed cards keep their facts buried until they're reviewed successfully.
+BURIED_INDEFINITELY = datetime(9999, 1, 1)
+
+BACKFILL_OWNER_BATCH_SIZE = 200
+
+BACKFILL_UPSERT_BATCH_SIZE = 2000
+
+
+def _sibling_ranks_ahead(order_by):
+    '''
+    Returns a pair of `Q`s for a subquery of a card's siblings, matching
+    the siblings which come before the (outer) card when ordering by
+    `order_by` and then by ID in the same direction: the first for when
+    the card's `order_by` field is set, the second for when it's NULL.
+
+    Like Postgres, NULLs come last in ascending order and first in
+    descending order.
+    '''
+    descending = order_by.startswith('-')
+    field = order_by.lstrip('-')
+    before = '__gt' if descending else '__lt'
+
+    tied_before = Q(**{
+        field: OuterRef(field),
+        'id' + before: OuterRef('id'),
+    })
+    null_tied_before = Q(**{
+        field + '__isnull': True,
+        'id' + before: OuterRef('id'),
+    })
+
+    if descending:
+        return (
+            Q(**{field + before: OuterRef(field)})
+            | tied_before
+            | Q(**{field + '__isnull': True}),
+            null_tied_before,
+        )
+    return (
+        Q(**{field + before: OuterRef(field)}) | tied_before,
+        Q(**{field + '__isnull': False}) | null_tied_before,
+    )
+
+
 def with_siblings_buried(cards, order_by=None):
     '''
-    Removes siblings from a queryset.
+    Removes siblings from a queryset, keeping the card of each fact which
+    comes first by `order_by` (then by ID), and orders the rest that way.
+
+    A card is kept unless a sibling in `cards` comes before it. Unlike
+    `DISTINCT ON (fact_id)`, this doesn't have to sort all of the cards by
+    fact first: Postgres can walk an index on the ordering, check each
+    card's siblings as it goes, and stop once a `LIMIT` is met.
     '''
-    from manabi.apps.flashcards.models import Card
+    siblings = cards.order_by().filter(fact_id=OuterRef('fact_id'))
 
     if order_by is None:
-        ordered_cards = cards.order_by('fact_id')
-    else:
-        ordered_cards = cards.order_by('fact_id', order_by)
+        return cards.annotate(
+            sibling_comes_before=Exists(
+                siblings.filter(id__lt=OuterRef('id'))),
+        ).filter(sibling_comes_before=False)
 
-    cards_with_burying_applied = ordered_cards.distinct('fact_id')
+    field = order_by.lstrip('-')
+    sibling_before, sibling_before_null = _sibling_ranks_ahead(order_by)
 
-    if order_by is None:
-        return cards_with_burying_applied
-    else:
-        return Card.objects.filter(
-            pk__in=cards_with_burying_applied,
-        ).order_by(order_by)
+    return cards.annotate(
+        sibling_comes_before=Exists(siblings.filter(sibling_before)),
+        sibling_comes_before_null=Exists(
+            siblings.filter(sibling_before_null)),
+    ).filter(
+        Q(**{field + '__isnull': False, 'sibling_comes_before': False})
+        | Q(**{field + '__isnull': True, 'sibling_comes_before_null': False})
+    ).order_by(order_by, order_by.replace(field, 'id'))
+
+
+def _card_buried_until(last_reviewed_at, interval, last_review_grade):
+    '''
+    Until when a card buries its fact. Mirrors `FactQuerySet.buried_from_cards`.
+    '''
+    if last_review_grade == GRADE_NONE:
+        return BURIED_INDEFINITELY
+
+    if last_reviewed_at is None or interval is None:
+        return None
+
+    return last_reviewed_at + min(
+        MIN_CARD_SPACE,
+        timedelta(seconds=CARD_SPACE_FACTOR * interval.total_seconds()),
+    )
+
+
+def _fact_buried_until(cards):
+    '''
+    `cards` are (last_reviewed_at, interval, last_review_grade) tuples for
+    the cards of a fact.
+    '''
+    buried_untils = [
+        buried_until for buried_until in
+        (_card_buried_until(*card) for card in cards)
+        if buried_until is not None
+    ]
+    if not buried_untils:
+        return None
+    return max(buried_untils)
+
+
+class BuriedFactQuerySet(QuerySet):
+    def of_user(self, user):
+        return self.filter(owner=user)
+
+    def buried_at(self, review_time=None):
+        return self.filter(buried_until__gte=(review_time or datetime.utcnow()))
+
+    def update_for_fact(self, fact_id, owner_id):
+        '''
+        Recomputes the burial of the given fact from its cards. Call this
+        whenever its cards' reviews change.
+        '''
+        from manabi.apps.flashcards.models import Card
+
+        buried_until = _fact_buried_until(
+            Card.objects.filter(fact_id=fact_id, owner_id=owner_id)
+            .values_list('last_reviewed_at', 'interval', 'last_review_grade')
+        )
+
+        if buried_until is None:
+            self.filter(fact_id=fact_id).delete()
+        else:
+            # An upsert, since `backfill` may be inserting it concurrently.
+            self._upsert([(fact_id, owner_id, buried_until)])
+
+    def backfill(self, review_time=None, user=None):
+        '''
+        Reconciles every burial (or just those of `user`) with the cards
+        which could currently bury their facts. Returns the number of
+        buried facts.
+
+        This is the reconcile step for whatever `update_for_fact` missed
+        (see `BuriedFact`). The `backfill_buried_facts` command runs it,
+        and is scheduled nightly by the deployment playbook.
+
+        Owners are reconciled `BACKFILL_OWNER_BATCH_SIZE` at a time, each
+        batch in its own transaction, so that only one batch's cards are
+        held in memory and row locks are short-lived.
+        '''
+        review_time = review_time or datetime.utcnow()
+
+        owner_ids = User.objects.order_by('id').values_list('id', flat=True)
+        if user is not None:
+            owner_ids = owner_ids.filter(id=user.id)
+
+        buried_count = 0
+        last_owner_id = None
+        while True:
+            batch = owner_ids
+            if last_owner_id is not None:
+                batch = batch.filter(id__gt=last_owner_id)
+            batch = list(batch[:BACKFILL_OWNER_BATCH_SIZE])
+            if not batch:
+                return buried_count
+
+            buried_count += self._backfill_owners(batch, review_time)
+            last_owner_id = batch[-1]
+
+    @transaction.atomic
+    def _backfill_owners(self, owner_ids, review_time):
+        '''
+        Upserts the burials of `owner_ids` computed from their cards, and
+        deletes the rows of their facts which aren't buried anymore.
+        Leaves rows which are already correct untouched.
+        '''
+        from manabi.apps.flashcards.models import Card
+
+        # Locking the rows first makes reviews which are updating them
+        # commit before the cards are read.
+        stale_fact_ids = set(
+            self.filter(owner_id__in=owner_ids).select_for_update()
+            .values_list('fact_id', flat=True)
+        )
+
+        cards = Card.objects.filter(
+            Q(owner_id__in=owner_ids) & (
+                Q(last_review_grade=GRADE_NONE)
+                | Q(last_reviewed_at__gte=review_time - MIN_CARD_SPACE)
+            )
+        ).order_by().values_list(
+            'fact_id', 'owner_id',
+            'last_reviewed_at', 'interval', 'last_review_grade',
+        )
+
+        fact_cards = {}
+        for fact_id, owner_id, last_reviewed_at, interval, grade in (
+            cards.iterator()
+        ):
+            fact_cards.setdefault((fact_id, owner_id), []).append(
+                (last_reviewed_at, interval, grade))
+
+        burials = []
+        for (fact_id, owner_id), cards in fact_cards.iteritems():
+            buried_until = _fact_buried_until(cards)
+            if buried_until is None or buried_until < review_time:
+                continue
+            burials.append((fact_id, owner_id, buried_until))
+            stale_fact_ids.discard(fact_id)
+
+        for start in xrange(0, len(burials), BACKFILL_UPSERT_BATCH_SIZE):
+            self._upsert(burials[start:start + BACKFILL_UPSERT_BATCH_SIZE])
+
+        if stale_fact_ids:
+            self.filter(fact_id__in=stale_fact_ids).delete()
+
+        return len(burials)
+
+    def _upsert(self, burials):
+        '''
+        `burials` are (fact_id, owner_id, buried_until) tuples.
+        '''
+        if not burials:
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO {table} (fact_id, owner_id, buried_until)
+                VALUES {values}
+                ON CONFLICT (fact_id) DO UPDATE SET
+                    owner_id = EXCLUDED.owner_id,
+                    buried_until = EXCLUDED.buried_until
+                WHERE ({table}.owner_id, {table}.buried_until)
+                    IS DISTINCT FROM (EXCLUDED.owner_id, EXCLUDED.buried_until)
+                '''.format(
+                    table=self.model._meta.db_table,
+                    values=', '.join(['(%s, %s, %s)'] * len(burials)),
+                ),
+                [value for burial in burials for value in burial],
+            )
+
+    def inconsistencies(self, user, review_time=None):
+        '''
+        Compares the materialized burials of `user` against those computed
+        from their cards. Returns a 2-tuple of sets of fact IDs: those
+        missing from the materialized burials, and those wrongly in them.
+        '''
+        from manabi.apps.flashcards.models import Fact
+
+        review_time = review_time or datetime.utcnow()
+
+        materialized = set(
+            self.of_user(user).buried_at(review_time)
+            .values_list('fact_id', flat=True)
+        )
+        computed = set(
+            Fact.objects.buried_from_cards(user, review_time=review_time)
+            .values_list('id', flat=True)
+        )
+        return (computed - materialized, materialized - computed)
+
+
+class BuriedFact(models.Model):
+    '''
+    Materialized burial of facts due to their cards' recent reviews (or
+    failures), so that checking for it is a range lookup.
+
+    Kept up to date on review, undo and (un)suspension. Rows whose
+    `buried_until` has passed are simply ignored.
+
+    Paths which change cards or facts in bulk without signals, like
+    `FactQuerySet.change_card_templates`, `propagate_fact_edits` and
+    subscriber copies, don't recompute burials. For now that's safe,
+    because they only set `active`, edit fact text or create unreviewed
+    cards, and burials depend only on cards' reviews. Any new path that
+    changes `last_reviewed_at`, `interval` or `last_review_grade` must
+    call `update_for_fact`. Otherwise, burials stay wrong until the next
+    review of the fact or until `backfill` runs.
+    '''
+    objects = BuriedFactQuerySet.as_manager()
+
+    owner = models.ForeignKey(User, editable=False)
+    fact = models.OneToOneField(
+        'flashcards.Fact', related_name='burial', editable=False)
+    buried_until = models.DateTimeField()
+
+    class Meta:
+        app_label = 'flashcards'
+        index_together = [
+            ['owner', 'buried_until'],
+        ]
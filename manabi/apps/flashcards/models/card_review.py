@@ -1,7 +1,22 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+from cachecow.cache import invalidate_namespace
+from django.db import transaction
 from humanize.time import naturaldelta
 
+from manabi.apps.flashcards.cachenamespaces import deck_review_stats_namespace
+from manabi.apps.flashcards.models.cardhistory import CardHistory
+from manabi.apps.flashcards.models.cards import Card
+from manabi.apps.flashcards.models.constants import (
+    REVIEW_CLOCK_SKEW_ALLOWANCE,
+)
+from manabi.apps.flashcards.models.repetitionscheduler import (
+    RepetitionBatch,
+    repetition_algo_dispatcher,
+)
+from manabi.apps.flashcards.models.undo import UndoCardReview
+
 
 class CardReview(object):
     def __init__(self, card, grade):
@@ -29,3 +44,110 @@ class CardReview(object):
         if due_in < timedelta(minutes=1):
             return "in less than a minute"
         return u"in {}".format(naturaldelta(due_in, months=True))
+
+
+class BulkCardReview(object):
+    '''
+    Applies reviews that were queued up offline, in the order they were
+    made, in one transaction.
+
+    `reviews` is a list of dicts with `card_id`, `grade` and `reviewed_at`
+    keys. Each review is scheduled as of its own `reviewed_at`, so cards
+    end up where reviewing them online at those times would have put them.
+
+    Unlike calling `Card.review` for each one, card histories are inserted
+    together, each card is saved once, and only the last review goes on
+    the undo stack.
+    '''
+    def __init__(self, user, reviews):
+        self.user = user
+        self.reviews = reviews
+
+    @transaction.atomic
+    def apply_reviews(self):
+        '''
+        Returns the reviewed cards.
+
+        Raises `Card.DoesNotExist` if a review is for a card that isn't
+        the user's, and `ValueError` if a review is older than its card's
+        last review, or is in the future (beyond
+        `REVIEW_CLOCK_SKEW_ALLOWANCE`).
+        '''
+        from manabi.apps.flashcards.signals import post_cards_reviewed
+
+        if not self.reviews:
+            return []
+
+        latest_reviewed_at = datetime.utcnow() + REVIEW_CLOCK_SKEW_ALLOWANCE
+        for review in self.reviews:
+            if review['reviewed_at'] > latest_reviewed_at:
+                raise ValueError(
+                    "Review of card {} at {} is in the future.".format(
+                        review['card_id'], review['reviewed_at']))
+
+        card_ids = {review['card_id'] for review in self.reviews}
+
+        # Siblings are loaded too, so that sibling spacing takes the
+        # earlier reviews in this batch into account.
+        fact_cards = list(
+            Card.objects.of_user(self.user).filter(
+                fact_id__in=Card.objects.of_user(self.user).filter(
+                    id__in=card_ids).values('fact_id'),
+            ).select_related('deck', 'fact')
+        )
+        cards_by_id = {card.id: card for card in fact_cards}
+        if not card_ids.issubset(cards_by_id):
+            raise Card.DoesNotExist(
+                "Cards not found: {}".format(
+                    sorted(card_ids - set(cards_by_id))))
+
+        batch = RepetitionBatch(
+            (card.id, card.fact_id, card.last_reviewed_at)
+            for card in fact_cards)
+
+        reviewed_cards = OrderedDict()
+        card_histories = []
+        for review in self.reviews:
+            card = cards_by_id[review['card_id']]
+            grade, reviewed_at = review['grade'], review['reviewed_at']
+
+            if card.last_reviewed_at and reviewed_at < card.last_reviewed_at:
+                raise ValueError(
+                    "Review of card {} at {} is older than its last "
+                    "review.".format(card.id, reviewed_at))
+
+            # The undo stack holds the card as it was before its review.
+            card_snapshot = UndoCardReview.objects.card_snapshot(card)
+            was_new = card.is_new
+
+            repetition_algo = repetition_algo_dispatcher(
+                card, grade, **batch.repetition_algo_kwargs(card, reviewed_at))
+            card._apply_review(
+                grade, reviewed_at, repetition_algo._next_repetition())
+            batch.card_reviewed(card)
+
+            card_histories.append(CardHistory(
+                card=card,
+                response=grade,
+                reviewed_at=reviewed_at,
+                was_new=was_new,
+                ease_factor=card.ease_factor,
+                interval=card.interval,
+            ))
+            reviewed_cards[card.id] = card
+
+        CardHistory.objects.bulk_create(card_histories)
+
+        UndoCardReview.objects.add_undo(card_histories[-1], card_snapshot)
+
+        reviewed_cards = reviewed_cards.values()
+        for card in reviewed_cards:
+            card.save(update_fields=Card.REVIEW_FIELDS)
+
+        decks = {card.deck_id: card.deck for card in reviewed_cards}
+        for deck in decks.values():
+            invalidate_namespace(deck_review_stats_namespace(deck))
+
+        post_cards_reviewed.send(Card, instances=reviewed_cards)
+
+        return reviewed_cards
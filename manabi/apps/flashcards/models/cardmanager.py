@@ -1,74 +1,88 @@
+from collections import namedtuple
 from datetime import datetime, timedelta
 from itertools import chain
+from operator import or_
 
 from django.db import models
 from django.db.models.query import QuerySet
-from django.db.models import Min, Count
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    Min,
+    Q,
+    Value,
+    When,
+)
 
 from manabi.apps.flashcards.models.constants import GRADE_NONE, MATURE_INTERVAL_MIN
 from manabi.apps.flashcards.models.burying import with_siblings_buried
 
 
+# Ties are broken by ID, in the same direction, as `with_siblings_buried`
+# does.
+
+def _due_at_sort_key(card):
+    return (card.due_at, card.id)
+
+
+def _descending_interval_sort_key(card):
+    # Postgres puts NULLs first when sorting in descending order.
+    if card.interval is None:
+        return (0, 0, -card.id)
+    return (1, -card.interval.total_seconds(), -card.id)
+
+
+def _new_card_ordinal_sort_key(card):
+    # ...and last when sorting in ascending order.
+    return (
+        card.new_card_ordinal is None, card.new_card_ordinal, card.id)
+
+
+def _id_sort_key(card):
+    return card.id
+
+
+# `cards` is a SchedulerMixin method which returns the bucket's eligible
+# cards, already ordered. `sort_key` reproduces that ordering in Python.
+# `is_new` buckets are capped by the new cards limit.
+NextCardsBucket = namedtuple(
+    'NextCardsBucket', ['name', 'cards', 'sort_key', 'is_new'])
+
+
 class SchedulerMixin(object):
     '''
     Methods for retrieving the next cards that are ready to be reviewed.
-    '''
 
-    def _next_failed_due_cards(
-        self, initial_query, count, review_time, buried_facts,
-        **kwargs
-    ):
-        if not count:
-            return []
+    The cards are chosen from a prioritized series of "buckets" (failed and
+    due, due, failed and not due, new, ...). See `_next_card_buckets`.
+    '''
 
-        cards = initial_query.failed().due(
+    def _failed_due_cards(self, initial_query, review_time, **kwargs):
+        return initial_query.failed().due(
             review_time=review_time,
             order_by='due_at',
         )
 
-        return cards[:count]
-
-    def _next_not_failed_due_cards(
-        self,
-        initial_query,
-        count,
-        review_time,
-        buried_facts,
-        **kwargs
-    ):
+    def _not_failed_due_cards(self, initial_query, review_time, **kwargs):
         '''
-        Returns the first [count] cards from initial_query which are due,
-        weren't failed the last review, and taking spacing of cards from
-        the same fact into account.
+        Cards from initial_query which are due, weren't failed the last
+        review, and taking spacing of cards from the same fact into account.
 
         Disregards fact burial status.
-
-        review_time should be datetime.utcnow()
         '''
-        if not count:
-            return []
-
-        cards = initial_query.exclude(
-            last_review_grade=GRADE_NONE,
-        ).due(review_time=review_time, order_by='-interval')
-
         #TODO-OLD Also get cards that aren't quite due yet, but will be soon,
         # and depending on their maturity
         # (i.e. only mature cards due soon).
         # Figure out some kind of way to prioritize these too.
+        return initial_query.exclude(
+            last_review_grade=GRADE_NONE,
+        ).due(review_time=review_time, order_by='-interval')
 
-        return cards[:count]
-
-    def _next_failed_not_due_cards(
-        self, initial_query, count, review_time, buried_facts,
-        **kwargs
-    ):
+    def _failed_not_due_cards(self, initial_query, review_time, **kwargs):
         '''
         Disregards fact burial status.
         '''
-        if not count:
-            return []
-
         #TODO-OLD prioritize certain failed cards, not just by due date
         # We'll show failed cards even if they've been reviewed recently.
         # This is because failed cards are set to be shown 'soon' and not
@@ -80,48 +94,24 @@ class SchedulerMixin(object):
         # FIXME: This is excluding the card itself. Scenario: one card in the fact; fail this card; now this card doesn't show up here due to being counted as a sibling of itself having been reviewed recently! HMMMM....
         # Maybe to fix this, add a failed-and-buried card func? I think that works.
         # For now, I'm going to ignore buried facts here instead.
-        cards = with_siblings_buried(cards, 'due_at')
-
-        return cards[:count]
-
-    def _next_new_cards(
-        self,
-        initial_query,
-        count,
-        review_time,
-        buried_facts,
-        include_new_buried_siblings=False,
-        learn_more=False,  # DEPRECATED?
-        new_cards_limit=None,
-        **kwargs
-    ):
-        from manabi.apps.flashcards.models.cards import CARD_TEMPLATE_CHOICES
-        from manabi.apps.flashcards.models.facts import Fact
-
-        count = min(count, new_cards_limit)
-
-        if not count:
-            return []
+        return with_siblings_buried(cards, 'due_at')
 
+    def _new_cards(self, initial_query, buried_facts, **kwargs):
         cards = initial_query.filter(due_at__isnull=True)
         cards = cards.exclude(fact__in=buried_facts)
-        cards = with_siblings_buried(cards, 'new_card_ordinal')
-        cards = list(cards[:count])
+        return with_siblings_buried(cards, 'new_card_ordinal')
 
-        # Add spaced cards if in early review/learn more mode and we haven't
-        # supplied enough.
-        if (include_new_buried_siblings or learn_more) and len(cards) < count:
-            buried_cards = initial_query.filter(due_at__isnull=True)
-            buried_cards = buried_cards.exclude(pk__in=cards)
-            buried_cards = buried_cards.order_by('new_card_ordinal')
-            cards.extend(list(buried_cards[:count - len(cards)]))
-
-        return cards
+    def _new_buried_sibling_cards(self, initial_query, **kwargs):
+        '''
+        New cards regardless of sibling spacing. Used to top up the new
+        cards in early review/learn more mode.
+        '''
+        cards = initial_query.filter(due_at__isnull=True)
+        return cards.order_by('new_card_ordinal', 'id')
 
-    def _next_due_soon_cards(
+    def _due_soon_cards(
         self,
         initial_query,
-        count,
         review_time,
         buried_facts,
         early_review_began_at=None,
@@ -130,9 +120,6 @@ class SchedulerMixin(object):
         '''
         Used for early review. Ordered by due date.
         '''
-        if not count:
-            return []
-
         cards = initial_query.exclude(last_review_grade=GRADE_NONE)
         cards = cards.not_due(review_time=review_time)
 
@@ -142,14 +129,11 @@ class SchedulerMixin(object):
         priority_cutoff = review_time - timedelta(minutes=60)
         staler_cards = cards.filter(last_reviewed_at__gt=priority_cutoff)
         staler_cards = staler_cards.exclude(fact__in=buried_facts)
-        staler_cards = staler_cards.order_by('due_at')
-
-        return staler_cards[:count]
+        return staler_cards.order_by('due_at', 'id')
 
-    def _next_due_soon_cards2(
+    def _due_soon_cards2(
         self,
         initial_query,
-        count,
         review_time,
         buried_facts,
         early_review_began_at=None,
@@ -158,9 +142,6 @@ class SchedulerMixin(object):
         '''
         Due soon, not yet, but next in the future.
         '''
-        if not count:
-            return []
-
         cards = initial_query.exclude(last_review_grade=GRADE_NONE)
         cards = cards.filter(due_at__gt=review_time)
 
@@ -172,15 +153,11 @@ class SchedulerMixin(object):
             last_reviewed_at__isnull=False,
             last_reviewed_at__lte=priority_cutoff)
         fresher_cards = fresher_cards.exclude(fact__in=buried_facts)
-        fresher_cards = fresher_cards.order_by('due_at')
+        return fresher_cards.order_by('due_at', 'id')
 
-        return fresher_cards[:count]
-
-    def _next_buried_cards(
+    def _buried_cards(
         self,
         initial_query,
-        count,
-        review_time,
         buried_facts,
         early_review_began_at=None,
         **kwargs
@@ -188,44 +165,86 @@ class SchedulerMixin(object):
         '''
         Cards buried due to sibling review.
         '''
-        if not count:
-            return []
-
         cards = initial_query.filter(fact__in=buried_facts)
 
         if early_review_began_at is not None:
             cards = cards.exclude(last_reviewed_at__gte=early_review_began_at)
 
-        return cards[:count]
+        return cards.order_by('id')
 
-    def _next_card_funcs(
-            self,
-            early_review=False,
-            learn_more=False,
+    def _next_card_buckets(
+        self,
+        early_review=False,
+        learn_more=False,
+        include_new_buried_siblings=False,
     ):
+        '''
+        Returns the `NextCardsBucket`s to draw from, in priority order.
+        '''
         if early_review and learn_more:
             raise ValueError("Cannot set both early_review and learn_more together.")
 
-        card_funcs = [
-            self._next_failed_due_cards,        # due, failed
-            self._next_not_failed_due_cards,    # due, not failed
-            self._next_failed_not_due_cards,    # failed, not due
+        new_buckets = [
+            NextCardsBucket(
+                'new', self._new_cards, _new_card_ordinal_sort_key, True),
         ]
+        # Add spaced cards if in early review/learn more mode and we haven't
+        # supplied enough.
+        if include_new_buried_siblings or learn_more:
+            new_buckets.append(NextCardsBucket(
+                'new_buried_siblings', self._new_buried_sibling_cards,
+                _new_card_ordinal_sort_key, True))
 
-        if early_review:
-            card_funcs.extend([
-                self._next_due_soon_cards,
-                self._next_due_soon_cards2, # Due soon, not yet, but next in the future.
-                self._next_buried_cards,
-            ])
-        elif learn_more:
+        if learn_more:
             # TODO: Only new cards, and ignore spacing.
             # Unless we don't need learn_more anymore...
-            card_funcs = [self._next_new_cards]
+            return new_buckets
+
+        buckets = [
+            NextCardsBucket(
+                'failed_due', self._failed_due_cards,
+                _due_at_sort_key, False),
+            NextCardsBucket(
+                'not_failed_due', self._not_failed_due_cards,
+                _descending_interval_sort_key, False),
+            NextCardsBucket(
+                'failed_not_due', self._failed_not_due_cards,
+                _due_at_sort_key, False),
+        ]
+
+        if early_review:
+            buckets.extend([
+                NextCardsBucket(
+                    'due_soon', self._due_soon_cards,
+                    _due_at_sort_key, False),
+                # Due soon, not yet, but next in the future.
+                NextCardsBucket(
+                    'due_soon2', self._due_soon_cards2,
+                    _due_at_sort_key, False),
+                NextCardsBucket(
+                    'buried', self._buried_cards, _id_sort_key, False),
+            ])
         else:
-            card_funcs.extend([self._next_new_cards]) # New cards at end.
+            buckets.extend(new_buckets) # New cards at end.
+
+        return buckets
 
-        return card_funcs
+    def _next_cards_initial_queries(self, user, deck, excluded_ids, now):
+        '''
+        Returns the (unevaluated) user cards and buried facts querysets
+        which every bucket is drawn from.
+        '''
+        from manabi.apps.flashcards.models.facts import Fact
+
+        user_cards = self.common_filters(
+            user, deck=deck, excluded_ids=excluded_ids)
+
+        buried_facts = Fact.objects.buried(
+            user, review_time=now, excluded_card_ids=excluded_ids)
+        if deck is not None:
+            buried_facts = buried_facts.deck_facts(deck)
+
+        return user_cards, buried_facts
 
     def next_cards(
         self,
@@ -240,7 +259,8 @@ class SchedulerMixin(object):
         learn_more=False,
     ):
         '''
-        Returns `count` cards to be reviewed, in order.
+        Returns a list of `count` cards to be reviewed, in order, with their
+        facts already fetched.
         count should not be any more than a short session of cards
         set `early_review` to True for reviewing cards early
         (following any due cards)
@@ -260,57 +280,166 @@ class SchedulerMixin(object):
         (#TODO-OLD consider changing this to have a separate option)
 
         `new_cards_limit` is an integer.
-        '''
-        from manabi.apps.flashcards.models.facts import Fact
 
+        This takes a single query: the top `count` cards of every bucket are
+        selected together, each flagged with the buckets it belongs to, and
+        then the buckets are drained in priority order in Python. Since each
+        bucket's top `count` is a prefix of its full ordering, this gives the
+        same result as querying one bucket at a time (see
+        `_cascading_next_cards`).
+        '''
         #TODO-OLD somehow spread some new cards into the early review
         # cards if early_review==True
-        #TODO-OLD use args instead, like *kwargs etc for these funcs
         now = datetime.utcnow()
+        new_cards_limit = new_cards_limit or 0
 
-        card_funcs = self._next_card_funcs(
+        buckets = self._next_card_buckets(
             early_review=early_review,
             learn_more=learn_more,
+            include_new_buried_siblings=include_new_buried_siblings,
         )
 
-        user_cards = self.common_filters(
-            user, deck=deck, excluded_ids=excluded_ids)
+        user_cards, buried_facts = self._next_cards_initial_queries(
+            user, deck, excluded_ids, now)
 
-        buried_facts = Fact.objects.buried(
-            user, review_time=now, excluded_card_ids=excluded_ids)
-        if deck is not None:
-            buried_facts = buried_facts.deck_facts(deck)
+        bucket_filters = []
+        bucket_flags = {}
+        for bucket in buckets:
+            limit = count
+            if bucket.is_new:
+                limit = min(count, new_cards_limit)
+            if not limit:
+                continue
+
+            bucket_card_ids = bucket.cards(
+                user_cards,
+                review_time=now,
+                buried_facts=buried_facts,
+                early_review_began_at=early_review_began_at,
+            ).values('pk')[:limit]
+
+            bucket_filters.append(Q(pk__in=bucket_card_ids))
+            bucket_flags[_bucket_flag(bucket)] = Case(
+                When(pk__in=bucket_card_ids, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+
+        if not bucket_filters:
+            return []
+
+        candidates = list(
+            self.model.objects
+            .filter(reduce(or_, bucket_filters))
+            .annotate(**bucket_flags)
+            .select_related('fact')
+        )
+
+        next_cards = []
+        new_card_ids = set()
+        cards_left = count
+
+        for bucket in buckets:
+            if not cards_left:
+                break
+
+            bucket_cards = sorted(
+                (
+                    card for card in candidates
+                    if getattr(card, _bucket_flag(bucket), False)
+                ),
+                key=bucket.sort_key,
+            )
+
+            if bucket.is_new:
+                # New buckets share one allowance, and later ones only top up
+                # the earlier ones.
+                bucket_cards = [
+                    card for card in bucket_cards
+                    if card.id not in new_card_ids
+                ]
+                bucket_cards = bucket_cards[:max(0, min(
+                    cards_left, new_cards_limit - len(new_card_ids)))]
+                new_card_ids.update(card.id for card in bucket_cards)
+            else:
+                bucket_cards = bucket_cards[:cards_left]
+
+            next_cards.extend(bucket_cards)
+            cards_left -= len(bucket_cards)
+
+        #FIXME add new cards into the mix when there's a defined
+        # new card per day limit
+        #for now, we'll add new ones to the end
+        return next_cards
+
+    def _cascading_next_cards(
+        self,
+        user,
+        count,
+        deck=None,
+        new_cards_limit=None,
+        excluded_ids=[],
+        early_review=False,
+        early_review_began_at=None,
+        include_new_buried_siblings=False,
+        learn_more=False,
+    ):
+        '''
+        Reference implementation of `next_cards` which queries one bucket
+        at a time, stopping once `count` cards are found. Returns an
+        iterator of cards.
+
+        Kept for verifying `next_cards` against; don't use it for serving
+        requests.
+        '''
+        now = datetime.utcnow()
+        new_cards_limit = new_cards_limit or 0
+
+        buckets = self._next_card_buckets(
+            early_review=early_review,
+            learn_more=learn_more,
+            include_new_buried_siblings=include_new_buried_siblings,
+        )
+
+        user_cards, buried_facts = self._next_cards_initial_queries(
+            user, deck, excluded_ids, now)
 
+        new_cards = []
         cards_left = count
         card_queries = []
 
-        for card_func in card_funcs:
+        for bucket in buckets:
             if not cards_left:
                 break
 
-            cards = card_func(
+            cards = bucket.cards(
                 user_cards,
-                cards_left,
-                now,
-                early_review=early_review,
-                early_review_began_at=early_review_began_at,
-                include_new_buried_siblings=include_new_buried_siblings,
-                learn_more=learn_more,
+                review_time=now,
                 buried_facts=buried_facts,
-                new_cards_limit=new_cards_limit,
+                early_review_began_at=early_review_began_at,
             )
 
+            if bucket.is_new:
+                limit = min(cards_left, new_cards_limit - len(new_cards))
+                if limit <= 0:
+                    continue
+                cards = list(cards.exclude(pk__in=new_cards)[:limit])
+                new_cards.extend(cards)
+            else:
+                cards = list(cards[:cards_left])
+
             cards_left -= len(cards)
 
             if len(cards):
                 card_queries.append(cards)
 
-        #FIXME add new cards into the mix when there's a defined
-        # new card per day limit
-        #for now, we'll add new ones to the end
         return chain(*card_queries)
 
 
+def _bucket_flag(bucket):
+    return 'in_{}_bucket'.format(bucket.name)
+
+
 class SchedulerFiltersMixin(object):
     def failed(self):
         return self.filter(last_review_grade=GRADE_NONE)
@@ -396,6 +525,51 @@ class CommonFiltersMixin(object):
             new_cards = new_cards.exclude(fact_id__in=buried_fact_ids)
         return new_cards.count()
 
+    def availability_counts(self, buried_fact_ids=None, review_time=None):
+        '''
+        Counts this queryset's due, not-yet-due and new cards by kind, all
+        in one aggregate query. Used for `ReviewAvailabilities` and their
+        prompts.
+
+        Counts suffixed `_fact_count` have siblings buried: they count one
+        card per fact, as `due().count()` and `new_count` do.
+        `unburied_new_fact_count` also leaves out `buried_fact_ids`.
+        '''
+        if review_time is None:
+            review_time = datetime.utcnow()
+
+        due = Q(due_at__isnull=False, due_at__lte=review_time)
+        not_failed = ~Q(last_review_grade=GRADE_NONE)
+        young = Q(
+            last_reviewed_at__isnull=False,
+            interval__isnull=False,
+            interval__lt=MATURE_INTERVAL_MIN,
+        )
+        mature = Q(interval__gte=MATURE_INTERVAL_MIN)
+        new = Q(last_reviewed_at__isnull=True)
+
+        unburied_new = new
+        # (Checking the type first avoids evaluating a queryset.)
+        if isinstance(buried_fact_ids, QuerySet) or buried_fact_ids:
+            unburied_new &= ~Q(fact_id__in=buried_fact_ids)
+
+        def count_cards(condition):
+            return Count(Case(When(condition, then='id')))
+
+        def count_facts(condition):
+            return Count(Case(When(condition, then='fact_id')), distinct=True)
+
+        return self.aggregate(
+            due_count=count_cards(due),
+            not_due_count=count_cards(Q(due_at__gt=review_time)),
+            new_count=count_cards(new),
+            failed_due_fact_count=count_facts(
+                Q(last_review_grade=GRADE_NONE) & due),
+            mature_due_fact_count=count_facts(mature & due & not_failed),
+            young_due_fact_count=count_facts(young & due & not_failed),
+            unburied_new_fact_count=count_facts(unburied_new),
+        )
+
     def approx_new_count(self, user=None, deck=None):
         '''
         Approximates how many new cards are actually available to review.
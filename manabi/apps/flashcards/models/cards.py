@@ -7,7 +7,10 @@ from datetime import (
 from cachecow.decorators import cached_function
 from django.contrib.auth.models import User
 from django.core.cache import cache
-from django.db import models
+from django.db import (
+    models,
+    transaction,
+)
 from django.db.models import (
     Avg,
     Count,
@@ -49,6 +52,20 @@ class Card(models.Model):
     '''
     objects = CardQuerySet.as_manager()
 
+    # The fields that reviewing a card changes.
+    REVIEW_FIELDS = [
+        'ease_factor',
+        'last_ease_factor',
+        'interval',
+        'last_interval',
+        'due_at',
+        'last_due_at',
+        'last_review_grade',
+        'last_reviewed_at',
+        'last_failed_at',
+        'review_count',
+    ]
+
     # Denormalized fields:
     owner = models.ForeignKey(User, editable=False)
     deck = models.ForeignKey('flashcards.Deck', db_index=True)
@@ -79,11 +96,20 @@ class Card(models.Model):
 
     suspended = models.BooleanField(default=False, db_index=True)
 
+    # Set by a database trigger whenever the card is inserted or updated
+    # (see migrations 0045 and 0046), for syncing changes to clients.
+    modified_at = models.DateTimeField(null=True, blank=True, editable=False)
+    change_txid = models.BigIntegerField(null=True, editable=False)
+
     class Meta:
         app_label = 'flashcards'
         index_together = [
             ['owner', 'due_at', 'active', 'suspended'],
+            ['owner', 'change_txid', 'id'],
         ]
+        # The scheduler's buckets also have partial indexes, which Django
+        # can't declare here. They're created in migration 0044, and
+        # `flashcards.query_plans` checks that the buckets use them.
 
     def __unicode__(self):
         return u'{} | {} [{}]'.format(self.fact.expression, self.fact.meaning, self.template)
@@ -101,7 +127,7 @@ class Card(models.Model):
         Returns a new Card object. Copies for the purpose of subscribing.
         '''
         return Card(
-            owner=target_fact.owner,
+            owner_id=target_fact.deck.owner_id,
             deck=target_fact.deck,
             fact=target_fact,
             template=self.template,
@@ -118,7 +144,7 @@ class Card(models.Model):
     @property
     def siblings(self):
         '''Returns the other cards from this card's fact.'''
-        return self.fact.card_set.exclude(id=self.id)
+        return Card.objects.filter(fact_id=self.fact_id).exclude(id=self.id)
 
     @property
     def first_reviewed_at(self):
@@ -279,32 +305,6 @@ class Card(models.Model):
             reps[grade] = repetition_algo.next_repetition()
         return reps
 
-    def _update_statistics(self, grade, reviewed_at,
-                           duration=None, question_duration=None):
-        '''
-        Updates this card's stats. Call this for each review,
-        before applying the new review. After applying the new review,
-        some other CardHistory fields can be filled in. The reason we do
-        this in 2 parts is that our undo system needs to know about this
-        object, but it creates the undo object before the card object gets
-        updated with the new review stats, so that we can rollback to it.
-
-        See the `self.review` docstring for info on `duration`
-        and `question_duration`.
-        '''
-        from cardhistory import CardHistory
-
-        #TODO-OLD update CardStatistics
-        was_new = self.is_new
-
-        card_history_item = CardHistory(
-            card=self, response=grade, reviewed_at=reviewed_at, was_new=was_new)
-        card_history_item.save()
-
-        self.review_count += 1
-
-        return card_history_item
-
     def _apply_updated_schedule(self, next_repetition):
         '''
         Updates this card's scheduling with values for the next repetition.
@@ -322,6 +322,21 @@ class Card(models.Model):
 
         # self.redis.update_ease_factor()
 
+    def _apply_review(self, grade, reviewed_at, next_repetition):
+        '''
+        Updates this card's fields (without saving) for a review graded
+        `grade`, given its computed `next_repetition`.
+        '''
+        self._apply_updated_schedule(next_repetition)
+
+        self.last_review_grade = grade
+        self.last_reviewed_at  = reviewed_at
+
+        if grade == GRADE_NONE:
+            self.last_failed_at = reviewed_at
+
+        self.review_count += 1
+
     def review(self, grade, duration=None, question_duration=None):
         '''
         Commits a review rated with `grade`.
@@ -334,6 +349,7 @@ class Card(models.Model):
         `duration` is the same, but for each entire duration of viewing
         this card (so, the time taken for the front and back of the card.)
         '''
+        from cardhistory import CardHistory
         from manabi.apps.flashcards.signals import pre_card_reviewed, post_card_reviewed
 
         pre_card_reviewed.send(self, instance=self)
@@ -341,32 +357,30 @@ class Card(models.Model):
         reviewed_at = datetime.utcnow()
         was_new = self.is_new
 
-        # Update this card's statistics
-        card_history_item = self._update_statistics(
-            grade, reviewed_at,
-            duration=duration, question_duration=question_duration)
-
-        # Create Undo stack item
-        UndoCardReview.objects.add_undo(card_history_item)
+        # Taken before the review is applied, so that undo can roll back
+        # to it.
+        card_snapshot = UndoCardReview.objects.card_snapshot(self)
 
-        # Compute and apply updated card repetition values.
+        # Compute and apply updated card repetition values, skipping the
+        # short-lived cache that repetition previews go through.
         repetition_algo = repetition_algo_dispatcher(
             self, grade, reviewed_at=reviewed_at)
-        repetition_algo.next_repetition.delete_cache(repetition_algo)
-        next_repetition = repetition_algo.next_repetition()
-        self._apply_updated_schedule(next_repetition)
+        self._apply_review(
+            grade, reviewed_at, repetition_algo._next_repetition())
+
+        # One insert for the history, one upsert for the undo and one
+        # update of just the review fields.
+        with transaction.atomic():
+            card_history_item = CardHistory.objects.create(
+                card=self,
+                response=grade,
+                reviewed_at=reviewed_at,
+                was_new=was_new,
+                ease_factor=self.ease_factor,
+                interval=self.interval,
+            )
+            UndoCardReview.objects.add_undo(card_history_item, card_snapshot)
+            self.save(update_fields=self.REVIEW_FIELDS)
 
-        self.last_review_grade = grade
-        self.last_reviewed_at  = reviewed_at
-
-        if grade == GRADE_NONE:
-            self.last_failed_at = reviewed_at
-
-        # Finish up the card history item record
-        card_history_item.ease_factor = self.ease_factor
-        card_history_item.interval    = self.interval
-        card_history_item.save()
-
-        self.save()
         # self.redis.after_review()
-        post_card_reviewed.send(self, instance=self)
+        post_card_reviewed.send(self, instance=self, was_new=was_new)
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models import Q
+
+from manabi.apps.flashcards.models.constants import SYNC_PAGE_SIZE
+
+CHANGE_KINDS = ['decks', 'facts', 'cards']
+
+
+def _changed_objects(user):
+    from manabi.apps.flashcards.models import Card, Deck, Fact
+
+    return OrderedDict([
+        ('decks', (
+            Deck.objects.filter(owner=user)
+            .select_related('owner', 'synchronized_with__owner')
+        )),
+        ('facts', (
+            Fact.objects.filter(deck_owner=user)
+            .prefetch_active_card_templates()
+        )),
+        ('cards', Card.objects.filter(owner=user).select_related('fact')),
+    ])
+
+
+def settled_change_txid():
+    '''
+    Returns the ID of the oldest transaction still in progress. Changes
+    stamped with earlier transaction IDs are all committed (or rolled
+    back), and any change yet to commit will be stamped with this ID or a
+    later one.
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()[0]
+
+
+def changes_since(user, positions=None, page_size=SYNC_PAGE_SIZE):
+    '''
+    Returns the decks, facts and cards of `user` which changed since
+    `positions`, as a dict of lists by kind (`CHANGE_KINDS`), along with
+    the positions to continue from and whether there are more changes
+    ready.
+
+    A database trigger stamps every insert and update with the ID of the
+    transaction which made it, in `change_txid` (see migration 0046).
+    Changes come in order of that and then ID, which the
+    `(owner, change_txid, id)` indexes serve, up to `page_size` of each
+    kind at a time. `positions` maps each kind to the `(change_txid, id)`
+    of the last change already seen of it, or is `None` to start over.
+    Deactivated (soft-deleted) objects are included as changes, so that
+    clients can delete them.
+
+    Transactions don't commit in the order of their IDs, so only changes
+    from before the oldest transaction still in progress are returned
+    (see `settled_change_txid`). Everything which commits later has a
+    later transaction ID, so the positions never pass over a change, even
+    one from a long-running job.
+    '''
+    positions = dict(positions or {})
+    settled_txid = settled_change_txid()
+
+    changes = {}
+    has_more = False
+    for kind, objects in _changed_objects(user).iteritems():
+        objects = objects.filter(
+            change_txid__lt=settled_txid,
+        ).order_by('change_txid', 'id')
+
+        position = positions.get(kind)
+        if position is not None:
+            change_txid, id_ = position
+            objects = objects.filter(
+                Q(change_txid__gt=change_txid)
+                | Q(change_txid=change_txid, id__gt=id_)
+            )
+
+        page = list(objects[:page_size + 1])
+        if len(page) > page_size:
+            page = page[:page_size]
+            has_more = True
+
+        changes[kind] = page
+        if page:
+            positions[kind] = (page[-1].change_txid, page[-1].id)
+
+    return changes, positions, has_more
@@ -69,4 +69,24 @@ CARD_SPACE_FACTOR = .1 # * interval, used for card spacing if greater than MIN_C
 
 LATEST_SHARED_DECKS_LIMIT = 100
 
+# How many facts a streamed fact listing serializes at a time.
+FACT_LISTING_CHUNK_SIZE = 500
+
+# Page sizes for syncing facts (and cards and decks) by modification time.
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_PAGE_SIZE = 5000
+
 DEFAULT_TIME_ZONE = pytz.timezone('America/New_York')
+
+# How many upcoming cards a review queue snapshot holds, and how long it
+# can be served from before it's rebuilt.
+REVIEW_QUEUE_SNAPSHOT_SIZE = 50
+REVIEW_QUEUE_SNAPSHOT_TIMEOUT = timedelta(minutes=10)
+
+# How long a deck's card and subscriber counts are kept in Redis, in case
+# an invalidation was missed.
+DECK_COUNTS_TIMEOUT = timedelta(days=1)
+
+# How far in the future a review synced from a client can claim to have
+# happened, to allow for the client's clock running a little fast.
+REVIEW_CLOCK_SKEW_ALLOWANCE = timedelta(minutes=5)
@@ -0,0 +1,156 @@
+from django.db import transaction
+from django.db.models import Count
+
+from manabi.apps.flashcards.models.constants import DECK_COUNTS_TIMEOUT
+from manabi.apps.manabi_redis.models import redis
+
+CARD_COUNT = 'card_count'
+SUBSCRIBER_COUNT = 'subscriber_count'
+COUNTS = [CARD_COUNT, SUBSCRIBER_COUNT]
+
+RECONCILE_CHUNK_SIZE = 1000
+
+
+def _deck_counts_key(deck_id):
+    return 'deck_counts:{}'.format(deck_id)
+
+
+def _counts_from_database(deck_ids):
+    '''
+    Returns a dict mapping each of `deck_ids` to its counts: available
+    cards, and active subscriber decks. One grouped query per count.
+    '''
+    from manabi.apps.flashcards.models import Card, Deck
+
+    counts = {
+        deck_id: {count: 0 for count in COUNTS} for deck_id in deck_ids
+    }
+
+    card_counts = (
+        Card.objects.available()
+        .filter(deck_id__in=deck_ids)
+        .values_list('deck_id')
+        .annotate(Count('id'))
+        .order_by()
+    )
+    for deck_id, card_count in card_counts:
+        counts[deck_id][CARD_COUNT] = card_count
+
+    subscriber_counts = (
+        Deck.objects
+        .filter(synchronized_with_id__in=deck_ids, active=True)
+        .values_list('synchronized_with_id')
+        .annotate(Count('id'))
+        .order_by()
+    )
+    for deck_id, subscriber_count in subscriber_counts:
+        counts[deck_id][SUBSCRIBER_COUNT] = subscriber_count
+
+    return counts
+
+
+def _store_counts(counts):
+    pipe = redis.pipeline()
+    for deck_id, counts_of_deck in counts.iteritems():
+        key = _deck_counts_key(deck_id)
+        pipe.hmset(key, counts_of_deck)
+        pipe.expire(key, DECK_COUNTS_TIMEOUT)
+    pipe.execute()
+
+
+def deck_counts(deck_ids, count):
+    '''
+    Returns a dict mapping each of `deck_ids` to its `count` (`CARD_COUNT`
+    or `SUBSCRIBER_COUNT`).
+
+    Reads a Redis hash per deck, in one round trip. Decks whose counts
+    were invalidated (see `invalidate_deck_counts`) or expired get
+    recounted together and stored again.
+    '''
+    deck_ids = list(deck_ids)
+
+    pipe = redis.pipeline(transaction=False)
+    for deck_id in deck_ids:
+        pipe.hget(_deck_counts_key(deck_id), count)
+    stored_counts = pipe.execute()
+
+    counts = {
+        deck_id: int(stored_count)
+        for deck_id, stored_count in zip(deck_ids, stored_counts)
+        if stored_count is not None
+    }
+
+    uncounted_deck_ids = [
+        deck_id for deck_id in deck_ids if deck_id not in counts]
+    if uncounted_deck_ids:
+        recounted = _counts_from_database(uncounted_deck_ids)
+        _store_counts(recounted)
+        counts.update({
+            deck_id: counts_of_deck[count]
+            for deck_id, counts_of_deck in recounted.iteritems()
+        })
+
+    return counts
+
+
+def invalidate_deck_counts(deck_ids):
+    '''
+    Call whenever a deck's available cards or active subscriber decks
+    change. `None`s in `deck_ids` are skipped.
+
+    The counts are deleted once the current transaction commits. Deleting
+    them before would let a concurrent request recount from before the
+    change and store that for `DECK_COUNTS_TIMEOUT`. (A recount already
+    underway when the transaction commits can still store a stale count,
+    which `reconcile_deck_counts` or the timeout corrects.)
+    '''
+    keys = [
+        _deck_counts_key(deck_id) for deck_id in set(deck_ids)
+        if deck_id is not None
+    ]
+    if keys:
+        transaction.on_commit(lambda: redis.delete(*keys))
+
+
+def reconcile_deck_counts(deck_ids=None, chunk_size=RECONCILE_CHUNK_SIZE):
+    '''
+    Recounts the decks with `deck_ids` (or all of them) from the database,
+    and stores counts for those which have any stored. Returns a dict
+    mapping the IDs of the decks whose stored counts were wrong to their
+    `(stored, actual)` counts.
+    '''
+    from manabi.apps.flashcards.models import Deck
+
+    decks = Deck.objects.order_by('id')
+    if deck_ids is not None:
+        decks = decks.filter(id__in=deck_ids)
+    deck_ids = list(decks.values_list('id', flat=True))
+
+    mismatches = {}
+    for start in xrange(0, len(deck_ids), chunk_size):
+        chunk = deck_ids[start:start + chunk_size]
+
+        pipe = redis.pipeline(transaction=False)
+        for deck_id in chunk:
+            pipe.hmget(_deck_counts_key(deck_id), COUNTS)
+        stored_counts = dict(zip(chunk, pipe.execute()))
+
+        actual_counts = _counts_from_database(chunk)
+
+        for deck_id in chunk:
+            stored = stored_counts[deck_id]
+            if all(stored_count is None for stored_count in stored):
+                continue
+            stored = {
+                count: None if stored_count is None else int(stored_count)
+                for count, stored_count in zip(COUNTS, stored)
+            }
+            if stored != actual_counts[deck_id]:
+                mismatches[deck_id] = (stored, actual_counts[deck_id])
+
+        _store_counts({
+            deck_id: actual_counts[deck_id]
+            for deck_id in chunk if deck_id in mismatches
+        })
+
+    return mismatches
@@ -11,17 +11,28 @@ from django.db import (
     models,
     transaction,
 )
-from django.db.models import Avg, Count, Q
+from django.db.models import Avg
 from django.db.models.query import QuerySet
 
 from manabi.apps.books.models import Textbook
 from manabi.apps.flashcards.cachenamespaces import deck_review_stats_namespace
-from manabi.apps.flashcards.models import cards
 from manabi.apps.flashcards.models.constants import (
     DEFAULT_EASE_FACTOR,
     LATEST_SHARED_DECKS_LIMIT,
 )
-from manabi.apps.flashcards.models.synchronization import copy_facts_to_subscribers
+from manabi.apps.flashcards.models.deck_counts import (
+    CARD_COUNT,
+    SUBSCRIBER_COUNT,
+    deck_counts,
+    invalidate_deck_counts,
+)
+from manabi.apps.flashcards.models.review_queue_snapshot import (
+    invalidate_review_queue_snapshot,
+)
+from manabi.apps.flashcards.models.synchronization import (
+    copy_facts_to_subscribers,
+    copy_facts_to_subscribers_in_background,
+)
 from manabi.apps.manabi_redis.models import redis
 
 
@@ -62,36 +73,18 @@ class DeckQuerySet(QuerySet):
 
     def card_counts(self):
         '''
-        Returns a dict mapping deck ID to card count for that deck.
+        Returns a dict mapping deck ID to available card count for that
+        deck.
         '''
-        counts = cards.Card.objects.available().filter(
-            Q(deck__in=self) | Q(deck__subscriber_decks__in=self),
-        ).distinct().values('deck_id').annotate(card_count=Count('deck_id'))
-        per_deck_counts = {
-            deck_id: 0
-            for deck_id in self.values_list('id', flat=True).iterator()
-        }
-        per_deck_counts.update({
-            count['deck_id']: count['card_count'] for count in counts
-        })
-        return per_deck_counts
+        return deck_counts(self.values_list('id', flat=True), CARD_COUNT)
 
     def subscriber_counts(self):
         '''
-        Returns a dict mapping deck ID to subscriber count for that deck.
+        Returns a dict mapping deck ID to active subscriber count for that
+        deck.
         '''
-        counts = self.model.objects.filter(
-            Q(synchronized_with__in=self) | Q(subscriber_decks__in=self),
-        ).distinct().filter(
-            active=True,
-            synchronized_with__isnull=True,
-        ).values('synchronized_with_id').annotate(
-            subscriber_count=Count('synchronized_with_id'),
-        )
-        return {
-            count['synchronized_with_id']: count['subscriber_count']
-            for count in counts
-        }
+        return deck_counts(
+            self.values_list('id', flat=True), SUBSCRIBER_COUNT)
 
 
 class Deck(models.Model):
@@ -109,6 +102,8 @@ class Deck(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     modified_at = models.DateTimeField(auto_now=True, editable=False)
+    # Set by a database trigger (see migration 0046).
+    change_txid = models.BigIntegerField(null=True, editable=False)
 
     # whether this is a publicly shared deck
     shared = models.BooleanField(default=False, blank=True)
@@ -128,6 +123,9 @@ class Deck(models.Model):
     class Meta:
         app_label = 'flashcards'
         ordering = ('name',)
+        index_together = [
+            ['owner', 'change_txid', 'id'],
+        ]
         #TODO-OLD unique_together = (('owner', 'name'), )
 
     @property
@@ -181,6 +179,8 @@ class Deck(models.Model):
             fact.subscriber_facts.clear()
         self.facts.update(active=False)
 
+        invalidate_deck_counts([self.id, self.synchronized_with_id])
+
     @property
     def has_subscribers(self):
         '''
@@ -204,7 +204,8 @@ class Deck(models.Model):
         self.shared_at = datetime.datetime.utcnow()
         self.save(update_fields=['shared', 'shared_at'])
 
-        copy_facts_to_subscribers(self.facts.filter(active=True))
+        copy_facts_to_subscribers_in_background(
+            self.facts.filter(active=True))
 
     @transaction.atomic
     def unshare(self):
@@ -265,13 +266,16 @@ class Deck(models.Model):
 
         copy_facts_to_subscribers(self.facts.all(), subscribers=[user])
 
+        # The new cards were bulk-created, without signals.
+        invalidate_review_queue_snapshot(user.id)
+
         return deck
 
     def card_count(self):
-        return cards.Card.objects.of_deck(self).available().count()
+        return deck_counts([self.id], CARD_COUNT)[self.id]
 
     def subscriber_count(self):
-        return self.subscriber_decks.count()
+        return deck_counts([self.id], SUBSCRIBER_COUNT)[self.id]
 
     def subscribers(self):
         return User.objects.filter(
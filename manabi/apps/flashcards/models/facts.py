@@ -4,15 +4,31 @@ import random
 from django.db.models import Prefetch
 from django.db.models.query import QuerySet
 from django.contrib.auth.models import User
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.db.models import Q, F
 from django.utils.functional import cached_property
 from natto import MeCab
 
 from constants import MAX_NEW_CARD_ORDINAL
-from manabi.apps.flashcards.signals import fact_suspended, fact_unsuspended
-from manabi.apps.flashcards.models.constants import GRADE_NONE, MIN_CARD_SPACE, CARD_SPACE_FACTOR
-from manabi.apps.flashcards.models.synchronization import copy_facts_to_subscribers
+from manabi.apps.flashcards.signals import (
+    fact_deleted,
+    fact_suspended,
+    fact_unsuspended,
+)
+from manabi.apps.flashcards.models.constants import (
+    CARD_SPACE_FACTOR,
+    FACT_LISTING_CHUNK_SIZE,
+    GRADE_NONE,
+    MIN_CARD_SPACE,
+)
+from manabi.apps.flashcards.models.synchronization import (
+    SYNCHRONIZED_FACT_FIELDS,
+    _delay_after_commit,
+    copy_facts_to_subscribers_in_background,
+    queue_fact_edit_propagation,
+    update_facts_from_values,
+)
+from manabi.apps.furigana.jobs import precompute_furigana
 from manabi.apps.twitter_usages.jobs import harvest_tweets
 
 
@@ -33,6 +49,29 @@ class FactQuerySet(QuerySet):
     def buried(self, user, review_time=None, excluded_card_ids=[]):
         '''
         Facts with cards buried due to siblings.
+
+        Reads the materialized `BuriedFact`s. Equivalent to
+        `buried_from_cards`.
+        '''
+        from manabi.apps.flashcards.models import BuriedFact, Card
+
+        buried = Q(id__in=(
+            BuriedFact.objects.of_user(user).buried_at(review_time)
+            .values('fact_id')
+        ))
+
+        if excluded_card_ids:
+            # Sibling is currently in the client-side review queue.
+            buried |= Q(id__in=(
+                Card.objects.filter(owner=user, id__in=excluded_card_ids)
+                .values('fact_id')
+            ))
+
+        return self.filter(buried)
+
+    def buried_from_cards(self, user, review_time=None, excluded_card_ids=[]):
+        '''
+        Facts with cards buried due to siblings, computed from the cards.
         '''
         if review_time is None:
             review_time = datetime.utcnow()
@@ -53,6 +92,188 @@ class FactQuerySet(QuerySet):
             )
         )
 
+    def bulk_edit(self, edits):
+        '''
+        Applies `edits`, dicts of a fact `id` and any of the
+        `SYNCHRONIZED_FACT_FIELDS`, to facts in this queryset. Saves them
+        with an `UPDATE` per batch rather than per fact, forking them from
+        what they're synchronized with as `Fact.save` would, and queues up
+        propagating them to subscribers.
+
+        Raises `Fact.DoesNotExist` if any of the facts aren't in this
+        queryset. Returns the edited facts.
+        '''
+        edits_by_fact_id = {}
+        for edit in edits:
+            edits_by_fact_id.setdefault(edit['id'], {}).update(edit)
+
+        facts = list(
+            self.filter(id__in=edits_by_fact_id)
+            .select_related('synchronized_with')
+            .order_by('id')
+        )
+        if len(facts) != len(edits_by_fact_id):
+            raise self.model.DoesNotExist(
+                "Some of the facts to edit don't exist.")
+
+        modified_at = datetime.utcnow()
+        for fact in facts:
+            edit = edits_by_fact_id[fact.id]
+            for field in SYNCHRONIZED_FACT_FIELDS:
+                if field in edit:
+                    setattr(fact, field, edit[field])
+            fact.modified_at = modified_at
+            fact.forked = fact.forked or fact.diverged_from_synchronized()
+
+        update_facts_from_values(facts)
+        queue_fact_edit_propagation(facts)
+
+        edited_expressions = list({
+            fact.expression for fact in facts
+            if 'expression' in edits_by_fact_id[fact.id]
+        })
+        if edited_expressions:
+            _delay_after_commit(precompute_furigana, edited_expressions)
+
+        return facts
+
+    @transaction.atomic
+    def change_card_templates(self, activated=(), deactivated=()):
+        '''
+        Activates and deactivates the cards of these facts with the given
+        card templates (like `'kanji_writing'`), creating missing cards for
+        activated templates. Subscribers' unforked copies of these facts
+        get the same changes, except to cards they've already reviewed.
+
+        Takes one `UPDATE` for the activations, one for the deactivations
+        and one `INSERT ... SELECT` for the missing cards however many
+        facts and subscribers there are, so this works deck-wide too.
+        '''
+        from manabi.apps.flashcards.models import Card, Deck
+        from manabi.apps.flashcards.signals import cards_active_field_changed
+
+        activated_template_ids = sorted({
+            _card_template_string_to_id(template) for template in activated
+        })
+        deactivated_template_ids = sorted({
+            _card_template_string_to_id(template) for template in deactivated
+        })
+        if set(activated_template_ids) & set(deactivated_template_ids):
+            raise ValueError(
+                "Can't both activate and deactivate a card template.")
+
+        fact_ids = list(self.values_list('id', flat=True))
+        if not fact_ids:
+            return
+
+        cards = Card.objects.filter(
+            Q(fact_id__in=fact_ids) |
+            Q(
+                fact__synchronized_with_id__in=fact_ids,
+                fact__forked=False,
+                last_reviewed_at__isnull=True,
+            )
+        )
+
+        activated_card_ids = list(cards.filter(
+            template__in=activated_template_ids, active=False,
+        ).values_list('id', flat=True))
+        Card.objects.filter(id__in=activated_card_ids).update(active=True)
+
+        deactivated_card_ids = list(cards.filter(
+            template__in=deactivated_template_ids, active=True,
+        ).values_list('id', flat=True))
+        Card.objects.filter(id__in=deactivated_card_ids).update(active=False)
+
+        created_card_ids = []
+        if activated_template_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    '''
+                    INSERT INTO {card_table}
+                        (owner_id, deck_id, fact_id, template, active,
+                         review_count, new_card_ordinal, suspended)
+                    SELECT
+                        deck.owner_id, fact.deck_id, fact.id,
+                        card_template.id, true, 0,
+                        floor(random() * %(max_new_card_ordinal)s)::integer,
+                        false
+                    FROM {fact_table} fact
+                    JOIN {deck_table} deck ON deck.id = fact.deck_id
+                    CROSS JOIN unnest(%(template_ids)s::smallint[])
+                        AS card_template (id)
+                    WHERE
+                        (
+                            fact.id = ANY(%(fact_ids)s)
+                            OR (
+                                fact.synchronized_with_id = ANY(%(fact_ids)s)
+                                AND NOT fact.forked
+                            )
+                        )
+                        AND NOT EXISTS (
+                            SELECT 1 FROM {card_table} existing_card
+                            WHERE
+                                existing_card.fact_id = fact.id
+                                AND existing_card.template = card_template.id
+                        )
+                    ORDER BY fact.id, card_template.id
+                    RETURNING id
+                    '''.format(
+                        card_table=Card._meta.db_table,
+                        deck_table=Deck._meta.db_table,
+                        fact_table=self.model._meta.db_table,
+                    ),
+                    {
+                        'max_new_card_ordinal': MAX_NEW_CARD_ORDINAL,
+                        'template_ids': activated_template_ids,
+                        'fact_ids': fact_ids,
+                    },
+                )
+                created_card_ids = [card_id for card_id, in cursor.fetchall()]
+
+        changed_cards = list(Card.objects.filter(
+            id__in=activated_card_ids + deactivated_card_ids + created_card_ids,
+        ).select_related('deck'))
+        if changed_cards:
+            # Neither the updates nor the insert send signals.
+            cards_active_field_changed.send(Card, instances=changed_cards)
+
+    def set_active_card_templates(self, card_templates):
+        '''
+        Makes `card_templates` the only active card templates of these
+        facts. See `change_card_templates`.
+        '''
+        from manabi.apps.flashcards.models import CARD_TEMPLATE_CHOICES
+
+        card_templates = set(card_templates)
+        self.change_card_templates(
+            activated=card_templates,
+            deactivated={
+                _card_template_id_to_string(template_id)
+                for template_id, _ in CARD_TEMPLATE_CHOICES
+            } - card_templates,
+        )
+
+    def in_chunks(self, chunk_size=FACT_LISTING_CHUNK_SIZE):
+        '''
+        Yields lists of up to `chunk_size` facts at a time, in ID order,
+        with one keyset-paginated query per chunk (plus whatever's
+        prefetched for it). For going through big decks without holding
+        all of their facts.
+        '''
+        last_id = None
+        while True:
+            facts = self.order_by('id')
+            if last_id is not None:
+                facts = facts.filter(id__gt=last_id)
+            chunk = list(facts[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_id = chunk[-1].id
+
     def prefetch_active_card_templates(self):
         '''
         Puts the active card templates into `available_cards`.
@@ -112,6 +333,13 @@ class Fact(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     modified_at = models.DateTimeField(blank=True, null=True)
 
+    # Set by database triggers (see migration 0046), for syncing changes
+    # to clients. `deck_owner` is the deck's, so that a user's changed
+    # facts can be found across their decks by index.
+    change_txid = models.BigIntegerField(null=True, editable=False)
+    deck_owner = models.ForeignKey(
+        User, null=True, editable=False, db_index=False, related_name='+')
+
     suspended = models.BooleanField(default=False)
 
     def roll_ordinal(self):
@@ -123,11 +351,44 @@ class Fact(models.Model):
         self.new_fact_ordinal = random.randrange(0, MAX_NEW_CARD_ORDINAL)
         return True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        fact = super(Fact, cls).from_db(db, field_names, values)
+        fact._loaded_values = dict(zip(field_names, values))
+        return fact
+
+    def _edited_synchronized_fields(self, update_fields=None):
+        '''
+        Which of the `SYNCHRONIZED_FACT_FIELDS` this save would change,
+        going by what was loaded from the database (or all of them, if
+        that isn't known).
+        '''
+        fields = set(SYNCHRONIZED_FACT_FIELDS)
+        if update_fields is not None:
+            fields &= set(update_fields)
+
+        loaded_values = getattr(self, '_loaded_values', {})
+        return {
+            field for field in fields
+            if field not in loaded_values
+            or loaded_values[field] != getattr(self, field)
+        }
+
+    def diverged_from_synchronized(self):
+        if self.synchronized_with is None:
+            return False
+        return any(
+            getattr(self.synchronized_with, field) != getattr(self, field)
+            for field in SYNCHRONIZED_FACT_FIELDS
+        )
+
     def save(self, update_fields=None, *args, **kwargs):
         '''
         Set a random sorting index for new cards.
 
-        Propagates changes down to subscriber facts.
+        Queues up propagating changes down to subscriber facts (see
+        `queue_fact_edit_propagation`), and queues up caching the furigana
+        for a changed expression so it's ready when the fact is next shown.
         '''
         self.modified_at = datetime.utcnow()
         also_update_fields = {'modified_at'}
@@ -135,18 +396,13 @@ class Fact(models.Model):
         if self.roll_ordinal():
             also_update_fields.add('new_fact_ordinal')
 
+        edited_fields = self._edited_synchronized_fields(update_fields)
+
+        # Only looks at what this is synchronized with when it's edited.
         if (
             not self.forked and
-            (
-                update_fields is None or
-                set(update_fields) & {'expression', 'reading', 'meaning'}
-            ) and
-            self.synchronized_with is not None and
-            (
-                self.synchronized_with.expression != self.expression or
-                self.synchronized_with.reading != self.reading or
-                self.synchronized_with.meaning != self.meaning
-            )
+            edited_fields and
+            self.diverged_from_synchronized()
         ):
             self.forked = True
             also_update_fields.add('forked')
@@ -158,17 +414,19 @@ class Fact(models.Model):
 
         super(Fact, self).save(update_fields=update_fields, *args, **kwargs)
 
-        if update_fields is None or (
-            set(update_fields) & {'expression', 'reading', 'meaning'}
-        ):
-            self.syncing_subscriber_facts.update(
-                expression=self.expression,
-                reading=self.reading,
-                meaning=self.meaning,
-            )
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+        }
+
+        if edited_fields and not is_new:
+            queue_fact_edit_propagation([self])
+
+        if 'expression' in edited_fields:
+            _delay_after_commit(precompute_furigana, [self.expression])
 
         if is_new and self.deck.shared:
-            copy_facts_to_subscribers([self])
+            copy_facts_to_subscribers_in_background([self])
 
         if is_new:
             harvest_tweets.delay(self)
@@ -179,6 +437,7 @@ class Fact(models.Model):
         self.save(update_fields=['active'])
 
         self.new_syncing_subscriber_facts.update(active=False)
+        fact_deleted.send(sender=self, instance=self)
         self.subscriber_facts.clear()
 
     @property
@@ -220,73 +479,11 @@ class Fact(models.Model):
 
     def set_active_card_templates(self, card_templates):
         '''
-        Creates or updates associated `Card`s.
+        Creates or updates associated `Card`s, and those of subscribers.
         '''
-        from manabi.apps.flashcards.models import Card
-
-        template_ids = {
-            _card_template_string_to_id(template)
-            for template in card_templates
-        }
-
-        for activated_card in (
-            self.card_set.filter(template__in=template_ids)
-        ):
-            activated_card.activate()
-
-        for deactivated_card in (
-            self.card_set.exclude(template__in=template_ids)
-        ):
-            deactivated_card.deactivate()
-
-        existing_template_ids = set(self.card_set.values_list(
-            'template', flat=True))
-
-        for template_id in template_ids - existing_template_ids:
-            Card.objects.create(
-                deck=self.deck,
-                fact=self,
-                template=template_id,
-                new_card_ordinal=Card.random_card_ordinal(),
-            )
-
-        self._set_active_card_templates_for_subscribers(template_ids)
-
-    @transaction.atomic
-    def _set_active_card_templates_for_subscribers(self, template_ids):
-        from manabi.apps.flashcards.models import Card
-
-        subscriber_cards = Card.objects.filter(
-            fact__in=self.syncing_subscriber_facts,
-        )
-        new_subscriber_cards = subscriber_cards.filter(
-            last_reviewed_at__isnull=True,
-        )
-
-        new_subscriber_cards.filter(
-            template__in=template_ids,
-        ).update(active=True)
-        new_subscriber_cards.exclude(
-            template__in=template_ids,
-        ).update(active=False)
-
-        for template_id in template_ids:
-            facts_without_template = self.syncing_subscriber_facts.exclude(
-                card__in=subscriber_cards.filter(template=template_id),
-            )
-
-            missing_cards = [
-                Card(
-                    deck_id=deck_id,
-                    fact_id=fact_id,
-                    template=template_id,
-                    new_card_ordinal=Card.random_card_ordinal(),
-                )
-                for fact_id, deck_id in
-                facts_without_template.values_list('id', 'deck_id').iterator()
-            ]
-
-            Card.objects.bulk_create(missing_cards)
+        Fact.objects.filter(id=self.id).set_active_card_templates(
+            card_templates)
+        self.__dict__.pop('active_card_templates', None)
 
     @transaction.atomic
     def move_to_deck(self, deck):
@@ -298,7 +495,7 @@ class Fact(models.Model):
         self.save(update_fields=['deck', 'synchronized_with'])
 
         if self.deck.shared:
-            copy_facts_to_subscribers([self])
+            copy_facts_to_subscribers_in_background([self])
 
     @transaction.atomic
     def suspend(self):
@@ -326,6 +523,10 @@ class Fact(models.Model):
     class Meta:
         app_label = 'flashcards'
         unique_together = (('deck', 'synchronized_with'),)
+        index_together = [
+            ['deck', 'modified_at', 'id'],
+            ['deck_owner', 'change_txid', 'id'],
+        ]
 
     def __unicode__(self):
         return unicode(self.id)
@@ -22,7 +22,7 @@ def _generate_interval(min_duration, max_duration):
     return timedelta(days=random.uniform(min_duration, max_duration))
 
 
-def initial_interval(deck, grade, do_fuzz=True):
+def initial_interval(grade, do_fuzz=True):
     '''
     Generates an initial interval duration for a new card that's been reviewed.
     '''
@@ -21,13 +21,20 @@ class NewCardsLimit(object):
         buffered_new_cards_count=0,
         time_zone=None,
         buried_fact_ids=None,
+        learned_today_count=None,
     ):
+        '''
+        `learned_today_count` can be given if it's already known (e.g. from
+        a `ReviewQueueSnapshot`), to save querying for it. It shouldn't
+        include `buffered_new_cards_count`.
+        '''
         self.user = user
         self.new_cards_per_day_limit_override = (
             new_cards_per_day_limit_override)
         self.buffered_new_cards_count = buffered_new_cards_count
         self.time_zone = time_zone
         self.buried_fact_ids = buried_fact_ids
+        self._learned_today_count = learned_today_count
 
     @property
     @lru_cache(maxsize=None)
@@ -37,12 +44,16 @@ class NewCardsLimit(object):
     @property
     @lru_cache(maxsize=None)
     def learned_today_count(self):
-        return (
-            CardHistory.objects
-            .of_day_for_user(self.user, self.time_zone or DEFAULT_TIME_ZONE)
-            .filter(was_new=True)
-            .count()
-        ) + self.buffered_new_cards_count
+        learned_today_count = self._learned_today_count
+        if learned_today_count is None:
+            learned_today_count = (
+                CardHistory.objects
+                .of_day_for_user(
+                    self.user, self.time_zone or DEFAULT_TIME_ZONE)
+                .filter(was_new=True)
+                .count()
+            )
+        return learned_today_count + self.buffered_new_cards_count
 
     @property
     @lru_cache(maxsize=None)
@@ -4,6 +4,9 @@ from manabi.apps.flashcards.models import (
 from manabi.apps.flashcards.models.new_cards_limit import (
     NewCardsLimit,
 )
+from manabi.apps.flashcards.models.review_queue_snapshot import (
+    ReviewQueueSnapshot,
+)
 
 
 class ReviewInterstitial(object):
@@ -16,6 +19,7 @@ class ReviewInterstitial(object):
         time_zone=None,
         new_cards_limit=None,
         buffered_new_cards_count=None,
+        buried_fact_ids=None,
     ):
         '''
         `new_cards_limit` is an instance of `NewCardsLimit.`
@@ -32,6 +36,7 @@ class ReviewInterstitial(object):
             time_zone=time_zone,
             new_cards_limit=new_cards_limit,
             buffered_new_cards_count=buffered_new_cards_count,
+            buried_fact_ids=buried_fact_ids,
         )
 
 
@@ -48,32 +53,65 @@ class NextCardsForReview(object):
         excluded_card_ids=set(),
         time_zone=None,
     ):
-        new_cards_limit = NewCardsLimit(
-            user,
-            new_cards_per_day_limit_override=new_cards_per_day_limit_override,
-        )
+        buried_fact_ids = None
+        learned_today_count = None
 
-        next_cards = Card.objects.next_cards(
-            user,
-            count,
-            excluded_ids=excluded_card_ids,
-            deck=deck,
-            early_review=early_review,
-            early_review_began_at=early_review_began_at,
-            include_new_buried_siblings=include_new_buried_siblings,
-            new_cards_limit=new_cards_limit.next_new_cards_limit,
-        )
+        if early_review:
+            new_cards_limit = NewCardsLimit(
+                user,
+                new_cards_per_day_limit_override=(
+                    new_cards_per_day_limit_override),
+            )
 
-        card_ids = [card.id for card in next_cards]
+            next_cards = Card.objects.next_cards(
+                user,
+                count,
+                excluded_ids=excluded_card_ids,
+                deck=deck,
+                early_review=early_review,
+                early_review_began_at=early_review_began_at,
+                include_new_buried_siblings=include_new_buried_siblings,
+                new_cards_limit=new_cards_limit.next_new_cards_limit,
+            )
+        else:
+            next_cards, buried_fact_ids, learned_today_count = (
+                self._next_cards_from_snapshot(
+                    user,
+                    count,
+                    deck=deck,
+                    include_new_buried_siblings=include_new_buried_siblings,
+                    new_cards_per_day_limit_override=(
+                        new_cards_per_day_limit_override),
+                    excluded_card_ids=excluded_card_ids,
+                )
+            )
 
-        # FIXME don't need 2 queries here...
-        self.cards = Card.objects.filter(pk__in=card_ids)
+            new_cards_limit = NewCardsLimit(
+                user,
+                new_cards_per_day_limit_override=(
+                    new_cards_per_day_limit_override),
+                learned_today_count=learned_today_count,
+            )
+
+        # A card may come up in more than one bucket (e.g. early review of
+        # buried cards), but should only be shown once.
+        self.cards = []
+        card_ids = set()
+        for card in next_cards:
+            if card.id in card_ids:
+                continue
+            self.cards.append(card)
+            card_ids.add(card.id)
 
         excluded_card_ids.update(card_ids)
         buffered_new_cards_count = len([
             card for card in self.cards if card.is_new
         ])
 
+        if buried_fact_ids is not None:
+            buried_fact_ids = buried_fact_ids | {
+                card.fact_id for card in self.cards}
+
         self.interstitial = ReviewInterstitial(
             user,
             deck=deck,
@@ -82,4 +120,25 @@ class NextCardsForReview(object):
             buffered_new_cards_count=buffered_new_cards_count,
             new_cards_per_day_limit_override=new_cards_per_day_limit_override,
             new_cards_limit=new_cards_limit,
+            buried_fact_ids=buried_fact_ids,
         )
+
+    def _next_cards_from_snapshot(self, user, count, excluded_card_ids, **kwargs):
+        '''
+        Returns the next cards, buried fact IDs and count of new cards
+        learned today, from the user's `ReviewQueueSnapshot` if it's fresh,
+        or else rebuilding it.
+        '''
+        snapshot = ReviewQueueSnapshot(user, **kwargs)
+
+        page = snapshot.page(count, excluded_card_ids=excluded_card_ids)
+        if page is None:
+            return snapshot.rebuild(count, excluded_card_ids=excluded_card_ids)
+
+        card_ids, buried_fact_ids, learned_today_count = page
+        cards_by_id = Card.objects.select_related('fact').in_bulk(card_ids)
+        cards = [
+            cards_by_id[card_id] for card_id in card_ids
+            if card_id in cards_by_id
+        ]
+        return cards, buried_fact_ids, learned_today_count
@@ -1,6 +1,14 @@
-from manabi.apps.utils.utils import unix_time
+from itertools import groupby
+
+from django.db.models import Q
+
 from manabi.apps.manabi_redis.models import redis
 
+# The card columns which the rebuild reads.
+REBUILD_CARD_FIELDS = ['id', 'owner_id', 'deck_id', 'active', 'ease_factor']
+
+REBUILD_CHUNK_SIZE = 5000
+
 
 class RedisCard(object):
     def __init__(self, card):
@@ -58,7 +66,173 @@ class RedisCard(object):
         self.update_card_owner()
 
     def delete(self):
+        card = self.card
         deck_id = card.fact.deck_id
         redis.srem('cards:deck:%s' % deck_id, card.id)
         redis.zrem('ease_factor:deck:%s' % deck_id, card.id)
         redis.srem('cards:owner:%s' % card.fact.deck.owner_id, card.id)
+
+
+########################################################################
+# Rebuilding
+
+def _card_rows_by_owner(
+    owner_ids=None,
+    min_owner_id=None,
+    max_owner_id=None,
+    chunk_size=REBUILD_CHUNK_SIZE,
+):
+    '''
+    Streams `REBUILD_CARD_FIELDS` of cards ordered by owner and then ID,
+    one query per chunk of `chunk_size`, paginating on (owner ID, ID)
+    rather than by offset.
+
+    Owner IDs are bounded by `min_owner_id` (exclusive) and `max_owner_id`
+    (inclusive), when given.
+    '''
+    from manabi.apps.flashcards.models import Card
+
+    cards = Card.objects.order_by('owner_id', 'id')
+    if owner_ids is not None:
+        cards = cards.filter(owner_id__in=owner_ids)
+    if min_owner_id is not None:
+        cards = cards.filter(owner_id__gt=min_owner_id)
+    if max_owner_id is not None:
+        cards = cards.filter(owner_id__lte=max_owner_id)
+    cards = cards.values_list(*REBUILD_CARD_FIELDS)
+
+    after = Q()
+    while True:
+        rows = list(cards.filter(after)[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+
+        card_id, owner_id = rows[-1][:2]
+        after = (
+            Q(owner_id__gt=owner_id) | Q(owner_id=owner_id, id__gt=card_id))
+
+
+def _rebuild_owner(pipe, owner_id, rows):
+    '''
+    Queues up the replacement of everything `owner_id` has in Redis with
+    what's in `rows` (all of their cards).
+    '''
+    deck_ids = {row[2] for row in rows}
+
+    pipe.delete(*(
+        ['cards:deck:{0}'.format(deck_id) for deck_id in deck_ids]
+        + ['ease_factor:deck:{0}'.format(deck_id) for deck_id in deck_ids]
+        + ['cards:owner:%s' % owner_id]
+    ))
+
+    for row in rows:
+        # What `RedisCard.update_all` maintains.
+        card_id, _, deck_id, active, ease_factor = row
+        pipe.sadd('cards:deck:{0}'.format(deck_id), card_id)
+        if active and ease_factor:
+            pipe.zadd(
+                'ease_factor:deck:{0}'.format(deck_id), ease_factor, card_id)
+        pipe.sadd('cards:owner:%s' % owner_id, card_id)
+
+
+def rebuild_redis(
+    owner_ids=None,
+    min_owner_id=None,
+    max_owner_id=None,
+    chunk_size=REBUILD_CHUNK_SIZE,
+    owner_rebuilt=None,
+):
+    '''
+    Regenerates the `RedisCard` sets from the cards of the users with
+    `owner_ids` (default everyone), within the optional owner ID range
+    (see `_card_rows_by_owner`).
+
+    Users are rebuilt in owner ID order, each in a single pipelined
+    `MULTI` block so that readers never see their keys half-built. After
+    each, `owner_rebuilt(owner_id, card_count)` is called if given, e.g.
+    to checkpoint: a rebuild can be resumed from the last owner ID done by
+    passing it as `min_owner_id`. Disjoint owner ID ranges can be rebuilt
+    in parallel.
+    '''
+    pipe = redis.pipeline()
+    card_rows = _card_rows_by_owner(
+        owner_ids=owner_ids,
+        min_owner_id=min_owner_id,
+        max_owner_id=max_owner_id,
+        chunk_size=chunk_size,
+    )
+    for owner_id, owner_rows in groupby(card_rows, lambda row: row[1]):
+        owner_rows = list(owner_rows)
+        _rebuild_owner(pipe, owner_id, owner_rows)
+        pipe.execute()
+
+        if owner_rebuilt is not None:
+            owner_rebuilt(owner_id, len(owner_rows))
+
+
+def _scoped_keys(scope):
+    '''
+    Yields each key in Redis kept for a `scope` ('owner' or 'deck'), with
+    the scope's ID.
+    '''
+    patterns = ['cards:{}:*'.format(scope)]
+    if scope == 'deck':
+        patterns.append('ease_factor:deck:*')
+
+    for pattern in patterns:
+        for key in redis.scan_iter(match=pattern, count=1000):
+            try:
+                yield key, int(key.rsplit(':', 1)[1])
+            except ValueError:
+                continue
+
+
+def remove_stale_keys(
+    min_owner_id=None,
+    max_owner_id=None,
+    chunk_size=REBUILD_CHUNK_SIZE,
+):
+    '''
+    Deletes the `RedisCard` sets of decks which no longer have any cards
+    (e.g. emptied or deleted ones), and of users within the optional
+    owner ID range (see `_card_rows_by_owner`) who no longer have any.
+    `rebuild_redis` goes by cards, so it never reaches these.
+
+    Returns how many keys were deleted.
+
+    A card created in one of those decks while this runs can lose its
+    keys, until it's next updated or rebuilt.
+    '''
+    from manabi.apps.flashcards.models import Card
+
+    def in_owner_range(owner_id):
+        return (
+            (min_owner_id is None or owner_id > min_owner_id)
+            and (max_owner_id is None or owner_id <= max_owner_id)
+        )
+
+    deleted_count = 0
+    for scope, card_field, scope_filter in [
+        ('owner', 'owner_id', in_owner_range),
+        ('deck', 'deck_id', lambda deck_id: True),
+    ]:
+        keys = [
+            (key, scope_id) for key, scope_id in _scoped_keys(scope)
+            if scope_filter(scope_id)
+        ]
+        for start in xrange(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            scope_ids_with_cards = set(
+                Card.objects.filter(**{
+                    card_field + '__in': {scope_id for _, scope_id in chunk},
+                }).values_list(card_field, flat=True).distinct()
+            )
+            stale_keys = [
+                key for key, scope_id in chunk
+                if scope_id not in scope_ids_with_cards
+            ]
+            if stale_keys:
+                deleted_count += redis.delete(*stale_keys)
+    return deleted_count
@@ -38,6 +38,84 @@ def repetition_algo_dispatcher(card, *args, **kwargs):
     return cls(card, *args, **kwargs)
 
 
+class RepetitionBatch(object):
+    '''
+    Supplies `RepetitionAlgo`s with what they'd otherwise query for on
+    their own, for computing repetitions of many cards at once.
+
+    `fact_card_rows` are `(card_id, fact_id, last_reviewed_at)` for every
+    card of the facts whose cards will be scheduled. When one of those
+    cards is reviewed along the way, pass it to `card_reviewed` so that its
+    siblings see the new review time.
+    '''
+    def __init__(self, fact_card_rows):
+        self._last_reviewed_ats_by_fact = {}
+        for card_id, fact_id, last_reviewed_at in fact_card_rows:
+            self._last_reviewed_ats_by_fact.setdefault(
+                fact_id, {})[card_id] = last_reviewed_at
+
+        self._deck_average_ease_factors = {}
+
+    def card_reviewed(self, card):
+        self._last_reviewed_ats_by_fact.setdefault(
+            card.fact_id, {})[card.id] = card.last_reviewed_at
+
+    def _sibling_last_reviewed_at(self, card):
+        '''
+        Mirrors `card.siblings.latest('last_reviewed_at').last_reviewed_at`,
+        which sorts never-reviewed siblings first on Postgres.
+        '''
+        last_reviewed_ats = [
+            last_reviewed_at for card_id, last_reviewed_at
+            in self._last_reviewed_ats_by_fact.get(card.fact_id, {}).items()
+            if card_id != card.id
+        ]
+        if not last_reviewed_ats or None in last_reviewed_ats:
+            return None
+        return max(last_reviewed_ats)
+
+    def _deck_average_ease_factor(self, card):
+        if card.deck_id not in self._deck_average_ease_factors:
+            self._deck_average_ease_factors[card.deck_id] = (
+                card.deck.average_ease_factor())
+        return self._deck_average_ease_factors[card.deck_id]
+
+    def repetition_algo_kwargs(self, card, reviewed_at):
+        '''
+        Returns the keyword arguments to give `repetition_algo_dispatcher`
+        for reviewing `card` at `reviewed_at`, with any grade.
+        '''
+        kwargs = {'reviewed_at': reviewed_at}
+
+        if not card.is_new and card.due_at:
+            kwargs['percent_waited'] = _percent_waited(
+                card, reviewed_at, self._sibling_last_reviewed_at(card))
+
+        if card.is_new:
+            kwargs['deck_average_ease_factor'] = (
+                self._deck_average_ease_factor(card))
+
+        return kwargs
+
+
+def _percent_waited(card, reviewed_at, sibling_last_reviewed_at):
+    '''
+    See `RepetitionAlgo._percent_waited`.
+    '''
+    denominator = card.calculated_interval()
+
+    # Was this reviewed too soon after a sibling? How early?
+    # If not too early, still factor the delay into our return value.
+    if sibling_last_reviewed_at:
+        difference = card.due_at - sibling_last_reviewed_at
+
+        if abs(difference) <= card.sibling_spacing():
+            denominator += card.sibling_spacing()
+
+    return (timedelta_to_float(reviewed_at - card.last_reviewed_at)
+            / timedelta_to_float(denominator))
+
+
 class RepetitionAlgo(object):
     '''
     This base class represents the most general kind of card, which does
@@ -87,16 +165,22 @@ class RepetitionAlgo(object):
     # to be more aggressive.
     HARD_GRADE_PENALTY_EF = 1.2
 
-    def __init__(self, card, grade, reviewed_at=None):
+    def __init__(self, card, grade, reviewed_at=None,
+                 percent_waited=None, deck_average_ease_factor=None):
         '''
         Computes the next repetition for a card that is going to be (or has
         already been) reviewed.
 
         `reviewed_at` defaults to now.
+
+        `percent_waited` and `deck_average_ease_factor` can be given when
+        they're already known, to skip the queries behind them.
         '''
         self.card = card
         self.grade = grade
         self.reviewed_at = reviewed_at or datetime.utcnow()
+        self._percent_waited_value = percent_waited
+        self._deck_average_ease_factor_value = deck_average_ease_factor
 
     # Very short cache on this function, because it's something that gets
     # called potentially a bunch of times in one request, but even if the
@@ -114,6 +198,9 @@ class RepetitionAlgo(object):
         Returns an instance of `NextRepetition` containing the updated
         repetition values for this card.
         '''
+        return self._next_repetition()
+
+    def _next_repetition(self):
         interval = self._next_interval()
         ease_factor = self._next_ease_factor()
         due_at = self._next_due_at()
@@ -225,12 +312,11 @@ class RepetitionAlgo(object):
         next_due_at = self.reviewed_at + next_interval
         return next_due_at
 
-
-    def _time_waited(self):
-        '''
-        The time elapsed since last review.
-        '''
-        return self.reviewed_at - self.card.last_reviewed_at
+    def _deck_average_ease_factor(self):
+        if self._deck_average_ease_factor_value is None:
+            self._deck_average_ease_factor_value = (
+                self.card.deck.average_ease_factor())
+        return self._deck_average_ease_factor_value
 
     def _percent_waited(self):
         '''
@@ -256,23 +342,16 @@ class RepetitionAlgo(object):
         '''
         from cards import Card
 
-        denominator = self.card.calculated_interval()
-
-        # Was this reviewed too soon after a sibling? How early?
-        # If not too early, still factor the delay into our return value.
-        try:
-            sibling = self.card.siblings.latest('last_reviewed_at')
-            if sibling.last_reviewed_at:
-                difference = (self.card.due_at
-                              - sibling.last_reviewed_at)
-
-                if abs(difference) <= self.card.sibling_spacing():
-                    denominator += self.card.sibling_spacing()
-        except Card.DoesNotExist:
-            pass
+        if self._percent_waited_value is None:
+            try:
+                sibling_last_reviewed_at = self.card.siblings.latest(
+                    'last_reviewed_at').last_reviewed_at
+            except Card.DoesNotExist:
+                sibling_last_reviewed_at = None
 
-        return (timedelta_to_float(self._time_waited())
-                / timedelta_to_float(denominator))
+            self._percent_waited_value = _percent_waited(
+                self.card, self.reviewed_at, sibling_last_reviewed_at)
+        return self._percent_waited_value
 
     def _adjustment_curve(self, percentage):
         '''
@@ -351,7 +430,7 @@ class YoungCardAlgo(RepetitionAlgo):
         interval for "Easy" grades.
         '''
         return (self.card.interval
-                < initial_interval(self.card.fact.deck, GRADE_EASY))
+                < initial_interval(GRADE_EASY))
 
     def _next_interval(self, failure_interval=timedelta()):
         return super(YoungCardAlgo, self)._next_interval(
@@ -379,7 +458,7 @@ class MatureCardAlgo(RepetitionAlgo):
 class NewCardAlgo(RepetitionAlgo):
     def _next_interval(self, failure_interval=timedelta()):
         #FIXME, do_fuzz=do_fuzz)
-        interval = initial_interval(self.card.fact.deck, self.grade)
+        interval = initial_interval(self.grade)
 
         #TODO-OLD Lessen interval if reviewed too soon after a sibling card.
         return interval
@@ -389,7 +468,7 @@ class NewCardAlgo(RepetitionAlgo):
         # sibling's grade.
         #TODO-OLD don't add modifier if rated well soon after a sibling
         # Default to the average for this deck
-        ease_factor = (self.card.deck.average_ease_factor()
+        ease_factor = (self._deck_average_ease_factor()
                        + self.EASE_FACTOR_MODIFIERS[self.grade])
 
         # Boost it only for "Easy" grades.
@@ -417,7 +496,7 @@ class FailedCardAlgo(RepetitionAlgo):
 
     def _next_interval(self, failure_interval=timedelta()):
         #FIXME, do_fuzz=do_fuzz)
-        interval = initial_interval(self.card.fact.deck, self.grade)
+        interval = initial_interval(self.grade)
 
         #TODO-OLD lessen effect if reviewed successfully very soon after a
         # failed review.
@@ -1,7 +1,5 @@
 # -*- coding: utf-8 -*-
 
-from datetime import datetime
-
 from django.utils.lru_cache import lru_cache
 
 from manabi.apps.flashcards.models.constants import (
@@ -30,6 +28,7 @@ class ReviewAvailabilities(object):
         excluded_card_ids=set(),
         time_zone=None,
         new_cards_limit=None,
+        buried_fact_ids=None,
     ):
         '''
         `buffered_new_cards_count` are the count of new cards that the user
@@ -39,12 +38,16 @@ class ReviewAvailabilities(object):
         calculations.
 
         `new_cards_limit` is an instance of `NewCardsLimit.`
+
+        `buried_fact_ids` can be given if they're already known (taking
+        `excluded_card_ids` into account), to save querying for them.
         '''
         self.user = user
         self.time_zone = time_zone
         self.deck = deck
         self.excluded_card_ids = excluded_card_ids
         self._buffered_new_cards_count = buffered_new_cards_count
+        self._known_buried_fact_ids = buried_fact_ids
 
         self.new_cards_limit = (
             new_cards_limit or
@@ -71,20 +74,45 @@ class ReviewAvailabilities(object):
 
     @property
     @lru_cache(maxsize=None)
+    def _card_counts(self):
+        '''
+        Everything the availabilities and their prompts need to count, from
+        a single query. See `CardQuerySet.availability_counts`.
+        '''
+        return self.base_cards_queryset.availability_counts(
+            buried_fact_ids=self._buried_fact_ids)
+
+    @property
     def ready_for_review(self):
         if self.user.is_anonymous():
             return False
 
-        return (
-            self.base_cards_queryset
-                .of_user(self.user)
-                .due()
-                .exists()
-        )
+        return self._card_counts['due_count'] > 0
+
+    @property
+    def failed_due_count(self):
+        return self._card_counts['failed_due_fact_count']
+
+    @property
+    def mature_due_count(self):
+        '''
+        Excludes failed cards.
+        '''
+        return self._card_counts['mature_due_fact_count']
+
+    @property
+    def young_due_count(self):
+        '''
+        Excludes failed cards.
+        '''
+        return self._card_counts['young_due_fact_count']
 
     @property
     @lru_cache(maxsize=None)
     def _buried_fact_ids(self):
+        if self._known_buried_fact_ids is not None:
+            return self._known_buried_fact_ids
+
         return Fact.objects.buried(
             self.user, excluded_card_ids=self.excluded_card_ids,
         ).values_list('id', flat=True)
@@ -107,11 +135,7 @@ class ReviewAvailabilities(object):
         if self.user.is_anonymous():
             return 0
 
-        available_count = self.base_cards_queryset.new_count(
-            self.user,
-            including_buried=False,
-            buried_fact_ids=self._buried_fact_ids,
-        )
+        available_count = self._card_counts['unburied_new_fact_count']
 
         return max(
             0,
@@ -131,10 +155,7 @@ class ReviewAvailabilities(object):
         if self.next_new_cards_count > 0:
             return None
 
-        available_count = self.base_cards_queryset.new_count(
-            self.user,
-            including_buried=True,
-        )
+        available_count = self._card_counts['new_count']
 
         return max(
             0,
@@ -159,7 +180,7 @@ class ReviewAvailabilities(object):
         if (
             self.next_new_cards_count == 0
             and self.buried_new_cards_count == 0
-            and not self.base_cards_queryset.new(self.user).exists()
+            and self._card_counts['new_count'] == 0
         ):
             return None
         return (
@@ -180,9 +201,7 @@ class ReviewAvailabilities(object):
         if self.ready_for_review:
             return False
 
-        return self.base_cards_queryset.filter(
-            due_at__gt=datetime.utcnow(),
-        ).exists()
+        return self._card_counts['not_due_count'] > 0
 
     @property
     def invalidated_upon_card_failure(self):
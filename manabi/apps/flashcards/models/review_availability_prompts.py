@@ -32,8 +32,7 @@ def _failed_due(review_availabilities, secondary=False):
     '''
     Failed, due.
     '''
-    cards = review_availabilities.base_cards_queryset
-    count = cards.failed().due().count()
+    count = review_availabilities.failed_due_count
     if count == 0:
         return
     return (
@@ -46,8 +45,7 @@ def _mature_due(review_availabilities, secondary=False):
     '''
     Mature, due.
     '''
-    cards = review_availabilities.base_cards_queryset
-    count = cards.mature().due().excluding_failed().count()
+    count = review_availabilities.mature_due_count
     if count == 0:
         return
     return (
@@ -68,8 +66,7 @@ def _young_due(review_availabilities, secondary=False):
     '''
     Young, due, excluding failed cards.
     '''
-    cards = review_availabilities.base_cards_queryset
-    count = cards.young().due().excluding_failed().count()
+    count = review_availabilities.young_due_count
     if count == 0:
         return
     return (
@@ -83,8 +80,7 @@ def _failed_not_due(review_availabilities, secondary=False):
     '''
     Failed, not due.
     '''
-    cards = review_availabilities.base_cards_queryset
-    count = cards.failed().due().count()
+    count = review_availabilities.failed_due_count
     if count == 0:
         return
     return (
@@ -212,7 +208,7 @@ def _done_early_review_of_all_cards(review_availabilities, secondary=False):
 
 
 def review_availability_prompts(review_availabilities):
-    # Be sure to synchronize with Card manager's `_next_card_funcs`.
+    # Be sure to synchronize with Card manager's `_next_card_buckets`.
     prompt_funcs = [
         _failed_due,
         _mature_due,
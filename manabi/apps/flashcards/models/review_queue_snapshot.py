@@ -0,0 +1,331 @@
+import json
+from datetime import datetime
+
+from django.db import transaction
+
+from manabi.apps.flashcards.models.constants import (
+    DEFAULT_TIME_ZONE,
+    GRADE_NONE,
+    REVIEW_QUEUE_SNAPSHOT_SIZE,
+    REVIEW_QUEUE_SNAPSHOT_TIMEOUT,
+)
+from manabi.apps.manabi_redis.models import redis
+from manabi.apps.utils.time_utils import start_and_end_of_day
+from manabi.apps.utils.utils import unix_time
+
+SNAPSHOT_VERSION = 1
+
+# Indices into the `queue` entries.
+CARD_ID, FACT_ID, IS_NEW = range(3)
+
+
+class ReviewQueueSnapshot(object):
+    '''
+    A per-user snapshot of the upcoming review queue, kept in Redis so that
+    follow-up pages of `NextCardsForReview` during a review session don't
+    have to recompute it.
+
+    It holds the ordered upcoming cards (as card ID, fact ID, is new), the
+    buried fact IDs and the count of new cards learned today. Reviews and
+    undos update it in place.
+
+    A snapshot is stale (and gets rebuilt) when:
+        * it was built with different filters (deck etc.);
+        * it's older than `REVIEW_QUEUE_SNAPSHOT_TIMEOUT`, so that cards which
+          came due in the meantime get picked up;
+        * the review day it counted new cards for has ended;
+        * the client excludes cards that the snapshot doesn't know about;
+        * it has too few cards left to fill the requested page.
+
+    It's deleted outright when a review is failed (failed cards get
+    rescheduled into the queue), when an undo doesn't match the last review
+    it saw, and when cards are added, (de)activated or (un)suspended.
+
+    Updates and deletions wait for the transaction to commit, so that a
+    rolled back review doesn't leave the snapshot ahead of the database.
+
+    Siblings which were hidden behind a reviewed card in the due buckets
+    only surface once the snapshot is rebuilt.
+
+    Early review isn't snapshotted.
+    '''
+    def __init__(
+        self,
+        user,
+        deck=None,
+        include_new_buried_siblings=False,
+        new_cards_per_day_limit_override=None,
+    ):
+        self.user = user
+        self.deck = deck
+        self.include_new_buried_siblings = include_new_buried_siblings
+        self.new_cards_per_day_limit_override = (
+            new_cards_per_day_limit_override)
+
+    @property
+    def key(self):
+        return _snapshot_key(self.user.id)
+
+    @property
+    def filters(self):
+        return {
+            'deck_id': self.deck.id if self.deck is not None else None,
+            'include_new_buried_siblings': self.include_new_buried_siblings,
+            'new_cards_per_day_limit_override': (
+                self.new_cards_per_day_limit_override),
+        }
+
+    def _load(self):
+        data = redis.get(self.key)
+        if data is None:
+            return None
+        return json.loads(data)
+
+    def _is_stale(self, data, excluded_card_ids):
+        if data is None or data.get('version') != SNAPSHOT_VERSION:
+            return True
+        if data['filters'] != self.filters:
+            return True
+
+        now = unix_time(datetime.utcnow())
+        if now - data['built_at'] >= (
+            REVIEW_QUEUE_SNAPSHOT_TIMEOUT.total_seconds()
+        ):
+            return True
+        if now > data['day_ends_at']:
+            return True
+
+        known_card_ids = set(data['excluded_card_ids'])
+        known_card_ids.update(data['reviewed_card_ids'])
+        known_card_ids.update(entry[CARD_ID] for entry in data['queue'])
+        if not set(excluded_card_ids) <= known_card_ids:
+            return True
+
+        return False
+
+    def _page(self, data, count, excluded_card_ids):
+        '''
+        Returns up to `count` card IDs, buried fact IDs and learned today
+        count for the next page of cards.
+        '''
+        excluded_card_ids = set(excluded_card_ids)
+
+        # Cards in the client-side queue bury their facts.
+        buried_fact_ids = set(data['buried_fact_ids'])
+        buried_fact_ids.update(
+            entry[FACT_ID] for entry in data['queue']
+            if entry[CARD_ID] in excluded_card_ids
+        )
+
+        new_cards_left = (
+            data['new_cards_limit'] - data['new_cards_learned_since_built'])
+
+        card_ids = []
+        for entry in data['queue']:
+            if len(card_ids) == count:
+                break
+            if entry[CARD_ID] in excluded_card_ids:
+                continue
+            if entry[IS_NEW]:
+                if entry[FACT_ID] in buried_fact_ids or new_cards_left <= 0:
+                    continue
+                new_cards_left -= 1
+            card_ids.append(entry[CARD_ID])
+
+        learned_today_count = (
+            data['learned_today_count'] +
+            data['new_cards_learned_since_built']
+        )
+
+        return card_ids, buried_fact_ids, learned_today_count
+
+    def page(self, count, excluded_card_ids=set()):
+        '''
+        Returns a 3-tuple of the next `count` card IDs, the buried fact IDs
+        and the count of new cards learned today.
+
+        Returns `None` if the snapshot is stale or can't fill the page.
+        '''
+        data = self._load()
+        if self._is_stale(data, excluded_card_ids):
+            return None
+
+        page = self._page(data, count, excluded_card_ids)
+        if len(page[0]) < count:
+            return None
+        return page
+
+    def rebuild(self, count, excluded_card_ids=set()):
+        '''
+        Recomputes the snapshot from the database.
+
+        Returns a 3-tuple like `page`, except with `Card` instances in place
+        of card IDs.
+        '''
+        from manabi.apps.flashcards.models import Card, Fact
+        from manabi.apps.flashcards.models.new_cards_limit import (
+            NewCardsLimit,
+        )
+
+        new_cards_limit = NewCardsLimit(
+            self.user,
+            new_cards_per_day_limit_override=(
+                self.new_cards_per_day_limit_override),
+        )
+
+        cards = Card.objects.next_cards(
+            self.user,
+            REVIEW_QUEUE_SNAPSHOT_SIZE,
+            excluded_ids=excluded_card_ids,
+            deck=self.deck,
+            include_new_buried_siblings=self.include_new_buried_siblings,
+            new_cards_limit=new_cards_limit.next_new_cards_limit,
+        )
+
+        buried_facts = Fact.objects.buried(
+            self.user, excluded_card_ids=excluded_card_ids)
+        if self.deck is not None:
+            buried_facts = buried_facts.deck_facts(self.deck)
+
+        _, day_ends_at = start_and_end_of_day(self.user, DEFAULT_TIME_ZONE)
+
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'filters': self.filters,
+            'built_at': unix_time(datetime.utcnow()),
+            'day_ends_at': unix_time(day_ends_at),
+            'queue': [
+                [card.id, card.fact_id, card.is_new] for card in cards
+            ],
+            'excluded_card_ids': list(excluded_card_ids),
+            'reviewed_card_ids': [],
+            'buried_fact_ids': list(
+                set(buried_facts.values_list('id', flat=True))),
+            'learned_today_count': new_cards_limit.learned_today_count,
+            'new_cards_limit': new_cards_limit.next_new_cards_limit,
+            'new_cards_learned_since_built': 0,
+            'last_review': None,
+        }
+        _save(self.key, data)
+
+        card_ids, buried_fact_ids, learned_today_count = self._page(
+            data, count, excluded_card_ids)
+        cards_by_id = {card.id: card for card in cards}
+        return (
+            [cards_by_id[card_id] for card_id in card_ids],
+            buried_fact_ids,
+            learned_today_count,
+        )
+
+
+def _snapshot_key(user_id):
+    return 'review_queue_snapshot:user:{0}'.format(user_id)
+
+
+def _save(key, data, pipe=None):
+    if pipe is None:
+        pipe = redis
+
+    timeout = (
+        data['built_at']
+        + int(REVIEW_QUEUE_SNAPSHOT_TIMEOUT.total_seconds())
+        - unix_time(datetime.utcnow())
+    )
+    if timeout <= 0:
+        pipe.delete(key)
+    else:
+        pipe.setex(key, timeout, json.dumps(data))
+
+
+def _update(key, update_func):
+    '''
+    Atomically applies `update_func` to the stored snapshot, if any.
+
+    `update_func` modifies the snapshot data in place, or returns `False`
+    to have the snapshot deleted instead.
+    '''
+    def transaction(pipe):
+        data = pipe.get(key)
+        if data is None:
+            return
+        data = json.loads(data)
+
+        pipe.multi()
+        if (
+            data.get('version') != SNAPSHOT_VERSION
+            or update_func(data) is False
+        ):
+            pipe.delete(key)
+        else:
+            _save(key, data, pipe=pipe)
+
+    redis.transaction(transaction, key)
+
+
+def update_review_queue_snapshot_after_review(card, was_new):
+    # The card may change again before the transaction commits.
+    card_id, fact_id = card.id, card.fact_id
+    failed = card.last_review_grade == GRADE_NONE
+
+    def update(data):
+        if failed:
+            return False
+
+        position = None
+        entry = [card_id, fact_id, was_new]
+        for index, queued_entry in enumerate(data['queue']):
+            if queued_entry[CARD_ID] == card_id:
+                position = index
+                entry = data['queue'].pop(index)
+                break
+
+        fact_was_buried = fact_id in data['buried_fact_ids']
+        if not fact_was_buried:
+            data['buried_fact_ids'].append(fact_id)
+
+        if was_new:
+            data['new_cards_learned_since_built'] += 1
+
+        data['reviewed_card_ids'].append(card_id)
+        data['last_review'] = {
+            'entry': entry,
+            'position': position,
+            'fact_was_buried': fact_was_buried,
+            'was_new': was_new,
+        }
+
+    key = _snapshot_key(card.owner_id)
+    transaction.on_commit(lambda: _update(key, update))
+
+
+def update_review_queue_snapshot_after_undo(card):
+    card_id, fact_id = card.id, card.fact_id
+
+    def update(data):
+        last_review = data['last_review']
+        if (
+            last_review is None or
+            last_review['entry'][CARD_ID] != card_id
+        ):
+            return False
+
+        if last_review['position'] is not None:
+            data['queue'].insert(
+                last_review['position'], last_review['entry'])
+
+        if not last_review['fact_was_buried']:
+            data['buried_fact_ids'].remove(fact_id)
+
+        if last_review['was_new']:
+            data['new_cards_learned_since_built'] -= 1
+
+        data['reviewed_card_ids'].remove(card_id)
+        data['last_review'] = None
+
+    key = _snapshot_key(card.owner_id)
+    transaction.on_commit(lambda: _update(key, update))
+
+
+def invalidate_review_queue_snapshot(user_id):
+    key = _snapshot_key(user_id)
+    transaction.on_commit(lambda: redis.delete(key))
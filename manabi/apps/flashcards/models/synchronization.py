@@ -1,10 +1,30 @@
 import itertools
+from collections import defaultdict
+from datetime import timedelta
 
-from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from manabi.apps.flashcards.models.deck_counts import invalidate_deck_counts
+from manabi.apps.manabi_redis.models import redis
 
 
 BULK_BATCH_SIZE = 2000
 
+# How many subscriber decks each background copying job handles.
+SUBSCRIBER_DECK_BATCH_SIZE = 200
+
+SUBSCRIBER_SYNC_PROGRESS_TIMEOUT = int(timedelta(days=1).total_seconds())
+
+# The fact fields which syncing subscriber facts follow.
+SYNCHRONIZED_FACT_FIELDS = ['expression', 'reading', 'meaning']
+
+# How many facts each `UPDATE ... FROM (VALUES ...)` covers.
+FACT_EDIT_BATCH_SIZE = 500
+
+# In case a propagation job dies before it clears its deck's flag.
+FACT_EDIT_PROPAGATION_TIMEOUT = int(timedelta(minutes=10).total_seconds())
+
 
 def _subscriber_decks_already_with_facts(subscriber_decks, facts):
     from manabi.apps.flashcards.models import Fact
@@ -26,26 +46,112 @@ def _subscriber_deck_already_has_fact(
     )
 
 
-def _copy_facts_to_subscribers(facts, subscribers):
+def _copy_facts_to_subscriber_decks(facts, subscriber_decks):
     '''
     The meat-and-potatoes of the copy operation.
+
+    Copies with a single `INSERT ... SELECT` of the facts, joining the
+    shared facts to the subscriber decks minus the pairs which already
+    exist, chained to an `INSERT ... SELECT` of their cards. Nothing is
+    loaded into Python.
+
+    Gives the same results as `_copy_facts_to_subscriber_decks_in_python`.
+    '''
+    from manabi.apps.flashcards.models import Card, Deck, Fact
+
+    try:
+        fact_ids = list(facts.values_list('id', flat=True))
+    except AttributeError:
+        fact_ids = [fact.id for fact in facts]
+    subscriber_deck_ids = [deck.id for deck in subscriber_decks]
+    if not fact_ids or not subscriber_deck_ids:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            WITH copied_fact AS (
+                INSERT INTO {fact_table}
+                    (deck_id, synchronized_with_id, forked, new_fact_ordinal,
+                     active, expression, reading, meaning, created_at,
+                     modified_at, suspended)
+                SELECT
+                    subscriber_deck.id, shared_fact.id, false,
+                    shared_fact.new_fact_ordinal, shared_fact.active,
+                    shared_fact.expression, shared_fact.reading,
+                    shared_fact.meaning, %(now)s, NULL, shared_fact.suspended
+                FROM {fact_table} shared_fact
+                CROSS JOIN {deck_table} subscriber_deck
+                WHERE
+                    shared_fact.id = ANY(%(fact_ids)s)
+                    AND shared_fact.active
+                    AND subscriber_deck.id = ANY(%(subscriber_deck_ids)s)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM {fact_table} existing_fact
+                        WHERE
+                            existing_fact.deck_id = subscriber_deck.id
+                            AND existing_fact.synchronized_with_id =
+                                shared_fact.id
+                    )
+                ORDER BY shared_fact.id, subscriber_deck.id
+                RETURNING id, deck_id, synchronized_with_id
+            )
+            INSERT INTO {card_table}
+                (owner_id, deck_id, fact_id, template, active,
+                 review_count, new_card_ordinal, suspended)
+            SELECT
+                subscriber_deck.owner_id, copied_fact.deck_id,
+                copied_fact.id, shared_card.template, shared_card.active,
+                0, shared_card.new_card_ordinal, shared_card.suspended
+            FROM copied_fact
+            JOIN {deck_table} subscriber_deck
+                ON subscriber_deck.id = copied_fact.deck_id
+            JOIN {card_table} shared_card
+                ON shared_card.fact_id = copied_fact.synchronized_with_id
+            WHERE shared_card.active AND NOT shared_card.suspended
+            ORDER BY copied_fact.id, shared_card.id
+            '''.format(
+                fact_table=Fact._meta.db_table,
+                deck_table=Deck._meta.db_table,
+                card_table=Card._meta.db_table,
+            ),
+            {
+                'now': timezone.now(),
+                'fact_ids': fact_ids,
+                'subscriber_deck_ids': subscriber_deck_ids,
+            },
+        )
+
+    # Nothing here sends signals.
+    invalidate_deck_counts(subscriber_deck_ids)
+
+
+def _copy_facts_to_subscriber_decks_in_python(facts, subscriber_decks):
+    '''
+    Builds the copies as model instances and bulk-creates them. Kept as the
+    reference for `_copy_facts_to_subscriber_decks`.
     '''
     from manabi.apps.flashcards.models import Card, Fact
 
-    shared_deck = facts[0].deck
-    subscriber_decks = shared_deck.subscriber_decks.filter(
-        owner__in=subscribers,
-        active=True,
-    )
-    subscriber_decks_already_with_facts = (
-        _subscriber_decks_already_with_facts(subscriber_decks, facts)
-    )
+    subscriber_decks = list(subscriber_decks)
+    if not subscriber_decks:
+        return
 
     try:
-        facts = facts.filter(active=True).iterator()
+        facts = list(facts.filter(active=True))
     except AttributeError:
         facts = [fact for fact in facts if fact.active]
 
+    subscriber_decks_already_with_facts = (
+        _subscriber_decks_already_with_facts(subscriber_decks, facts)
+    )
+
+    shared_cards_by_fact_id = defaultdict(list)
+    for shared_card in Card.objects.filter(
+        fact__in=facts, active=True, suspended=False,
+    ).order_by('id').iterator():
+        shared_cards_by_fact_id[shared_card.fact_id].append(shared_card)
+
     copied_facts = []
     copied_cards = []
     for shared_fact in facts:
@@ -55,7 +161,7 @@ def _copy_facts_to_subscribers(facts, subscribers):
         ]
         fact_kwargs = {attr: getattr(shared_fact, attr) for attr in copy_attrs}
 
-        for subscriber_deck in subscriber_decks.iterator():
+        for subscriber_deck in subscriber_decks:
             if _subscriber_deck_already_has_fact(
                 subscriber_deck,
                 shared_fact,
@@ -71,14 +177,10 @@ def _copy_facts_to_subscribers(facts, subscribers):
             copied_facts.append(fact)
 
             # Copy the cards.
-            copied_cards_for_fact = []
-            for shared_card in (
-                shared_fact.card_set.filter(active=True, suspended=False)
-                .iterator()
-            ):
-                card = shared_card.copy(fact)
-                copied_cards_for_fact.append(card)
-            copied_cards.append(copied_cards_for_fact)
+            copied_cards.append([
+                shared_card.copy(fact)
+                for shared_card in shared_cards_by_fact_id[shared_fact.id]
+            ])
 
     # Persist everything.
     created_facts = Fact.objects.bulk_create(
@@ -90,6 +192,28 @@ def _copy_facts_to_subscribers(facts, subscribers):
         itertools.chain.from_iterable(copied_cards),
         batch_size=BULK_BATCH_SIZE)
 
+    # Bulk creation doesn't send signals.
+    invalidate_deck_counts(deck.id for deck in subscriber_decks)
+
+
+def _shared_deck_of_facts(facts):
+    if not all(fact.deck_id is not None for fact in facts):
+        raise ValueError("Facts must be saved first to copy them.")
+    if len({fact.deck_id for fact in facts}) != 1:
+        raise ValueError("Can only copy facts from the same deck.")
+
+    deck = facts[0].deck
+
+    if not deck.shared:
+        raise TypeError("Facts cannot be copied from an unshared deck.")
+
+    return deck
+
+
+def _batches(items, batch_size):
+    for start in xrange(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
 
 def copy_facts_to_subscribers(facts, subscribers=None):
     '''
@@ -100,22 +224,245 @@ def copy_facts_to_subscribers(facts, subscribers=None):
 
     If `subscribers` is `None`, it will copy to all subscribers of the facts'
     decks.
+
+    This copies right away. For many subscribers, use
+    `copy_facts_to_subscribers_in_background` instead.
     '''
     if not facts:
         return
 
-    if not all(fact.deck_id is not None for fact in facts):
-        raise ValueError("Facts must be saved first to copy them.")
-    if len({fact.deck_id for fact in facts}) != 1:
-        raise ValueError("Can only copy facts from the same deck.")
+    deck = _shared_deck_of_facts(facts)
 
-    deck = facts[0].deck
+    subscriber_decks = deck.subscriber_decks.filter(active=True)
+    if subscribers is not None:
+        subscriber_decks = subscriber_decks.filter(owner__in=subscribers)
 
-    if not deck.shared:
-        raise TypeError("Facts cannot be copied from an unshared deck.")
+    for subscriber_deck_batch in _batches(
+        list(subscriber_decks.order_by('id')), SUBSCRIBER_DECK_BATCH_SIZE,
+    ):
+        _copy_facts_to_subscriber_decks(facts, subscriber_deck_batch)
+
+
+def copy_facts_to_subscribers_in_background(facts):
+    '''
+    Like `copy_facts_to_subscribers` for all subscribers, but queues up
+    jobs to do it, each for a batch of `SUBSCRIBER_DECK_BATCH_SIZE`
+    subscriber decks. Their progress is tracked by
+    `SubscriberSyncProgress`.
 
-    if subscribers is None:
-        subscribers = get_user_model().objects.filter(
-            pk__in=deck.subscriber_decks.values_list('owner'))
+    The jobs are queued, and their progress recorded, once the current
+    transaction commits, so that they can see the facts, and so that a
+    rolled back transaction leaves no progress behind that no job would
+    ever finish.
+    '''
+    from manabi.apps.flashcards.jobs import copy_facts_to_subscriber_decks
+
+    if not facts:
+        return
+
+    deck = _shared_deck_of_facts(facts)
+
+    fact_ids = [fact.id for fact in facts]
+    subscriber_deck_ids = list(
+        deck.subscriber_decks.filter(active=True)
+        .order_by('id').values_list('id', flat=True))
+    if not subscriber_deck_ids:
+        return
+
+    def queue_copy_jobs():
+        SubscriberSyncProgress(deck.id).add(len(subscriber_deck_ids))
+
+        for subscriber_deck_id_batch in _batches(
+            subscriber_deck_ids, SUBSCRIBER_DECK_BATCH_SIZE,
+        ):
+            copy_facts_to_subscriber_decks.delay(
+                deck.id, fact_ids, subscriber_deck_id_batch)
+
+    transaction.on_commit(queue_copy_jobs)
+
+
+def _delay_after_commit(job_func, *args):
+    '''
+    Queues up a job once the current transaction commits, so that it sees
+    what the transaction wrote.
+    '''
+    transaction.on_commit(lambda: job_func.delay(*args))
+
+
+def copy_facts_to_subscriber_decks(
+    shared_deck_id, fact_ids, subscriber_deck_ids,
+):
+    '''
+    Copies a batch for `copy_facts_to_subscribers_in_background`.
+    '''
+    from manabi.apps.flashcards.models import Deck, Fact
+
+    _copy_facts_to_subscriber_decks(
+        Fact.objects.filter(id__in=fact_ids).order_by('id'),
+        Deck.objects.filter(id__in=subscriber_deck_ids, active=True),
+    )
+    SubscriberSyncProgress(shared_deck_id).mark_done(len(subscriber_deck_ids))
+
+
+class SubscriberSyncProgress(object):
+    '''
+    How far along the background copying of a shared deck's facts to its
+    subscriber decks is, counted in subscriber decks (across all of the
+    copies currently under way for the deck).
+    '''
+    def __init__(self, shared_deck_id):
+        self.key = 'subscriber_sync:deck:{}'.format(shared_deck_id)
+
+    def add(self, subscriber_deck_count):
+        pipe = redis.pipeline()
+        pipe.hincrby(self.key, 'total', subscriber_deck_count)
+        pipe.expire(self.key, SUBSCRIBER_SYNC_PROGRESS_TIMEOUT)
+        pipe.execute()
+
+    def mark_done(self, subscriber_deck_count):
+        pipe = redis.pipeline()
+        pipe.hincrby(self.key, 'done', subscriber_deck_count)
+        pipe.hget(self.key, 'total')
+        done, total = pipe.execute()
+        if total is None or done >= int(total):
+            redis.delete(self.key)
+
+    def as_dict(self):
+        '''
+        `None` if nothing's under way.
+        '''
+        progress = redis.hgetall(self.key)
+        if not progress:
+            return None
+        return {
+            'subscriber_decks_total': int(progress.get('total', 0)),
+            'subscriber_decks_done': int(progress.get('done', 0)),
+        }
+
+
+########################################################################
+# Edit propagation
+
+def _pending_fact_edits_key(deck_id):
+    return 'pending_fact_edits:deck:{}'.format(deck_id)
+
+
+def _fact_edit_propagation_queued_key(deck_id):
+    return 'fact_edit_propagation_queued:deck:{}'.format(deck_id)
+
+
+def update_facts_from_values(facts):
+    '''
+    Saves the synchronized fields, `forked` and `modified_at` of `facts`
+    with one `UPDATE ... FROM (VALUES ...)` per batch, rather than one
+    `UPDATE` per fact. Sends no signals.
+    '''
+    from manabi.apps.flashcards.models import Fact
+
+    columns = ['id'] + SYNCHRONIZED_FACT_FIELDS + ['forked', 'modified_at']
+    for fact_batch in _batches(list(facts), FACT_EDIT_BATCH_SIZE):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                UPDATE {fact_table} AS fact SET {assignments}
+                FROM (VALUES {values}) AS edit ({columns})
+                WHERE fact.id = edit.id
+                '''.format(
+                    fact_table=Fact._meta.db_table,
+                    assignments=', '.join(
+                        '{0} = edit.{0}'.format(column)
+                        for column in columns[1:]),
+                    values=', '.join(
+                        ['({})'.format(', '.join(['%s'] * len(columns)))]
+                        * len(fact_batch)),
+                    columns=', '.join(columns),
+                ),
+                [
+                    getattr(fact, column)
+                    for fact in fact_batch
+                    for column in columns
+                ],
+            )
+
+
+def propagate_fact_edits(fact_ids):
+    '''
+    Copies the synchronized fields of the facts with `fact_ids` to their
+    syncing (unforked) subscriber facts, with one
+    `UPDATE ... FROM (VALUES ...)` per batch of facts.
+    '''
+    from manabi.apps.flashcards.models import Fact
+
+    columns = ['id'] + SYNCHRONIZED_FACT_FIELDS
+    for fact_id_batch in _batches(sorted(fact_ids), FACT_EDIT_BATCH_SIZE):
+        rows = list(
+            Fact.objects.filter(id__in=fact_id_batch).values_list(*columns))
+        if not rows:
+            continue
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                UPDATE {fact_table} AS subscriber_fact SET {assignments}
+                FROM (VALUES {values}) AS edit ({columns})
+                WHERE
+                    subscriber_fact.synchronized_with_id = edit.id
+                    AND NOT subscriber_fact.forked
+                '''.format(
+                    fact_table=Fact._meta.db_table,
+                    assignments=', '.join(
+                        '{0} = edit.{0}'.format(column)
+                        for column in columns[1:]),
+                    values=', '.join(
+                        ['({})'.format(', '.join(['%s'] * len(columns)))]
+                        * len(rows)),
+                    columns=', '.join(columns),
+                ),
+                list(itertools.chain.from_iterable(rows)),
+            )
+
+
+def queue_fact_edit_propagation(facts):
+    '''
+    Queues up `propagate_fact_edits` for `facts`, coalescing edits per
+    deck: fact IDs collect in a Redis set per deck, and only one job per
+    deck is queued at a time, which takes all of the facts edited by the
+    time it runs. So a burst of edits to a deck (or the same fact) gets
+    propagated together, in batches.
+
+    Happens once the current transaction commits, so that the job sees
+    the edits.
+    '''
+    from manabi.apps.flashcards.jobs import propagate_pending_fact_edits
+
+    fact_ids_by_deck_id = defaultdict(set)
+    for fact in facts:
+        fact_ids_by_deck_id[fact.deck_id].add(fact.id)
+
+    def queue():
+        for deck_id, fact_ids in fact_ids_by_deck_id.iteritems():
+            pipe = redis.pipeline()
+            pipe.sadd(_pending_fact_edits_key(deck_id), *fact_ids)
+            pipe.set(
+                _fact_edit_propagation_queued_key(deck_id), 1,
+                nx=True, ex=FACT_EDIT_PROPAGATION_TIMEOUT)
+            _, newly_queued = pipe.execute()
+
+            if newly_queued:
+                propagate_pending_fact_edits.delay(deck_id)
+
+    transaction.on_commit(queue)
+
+
+def propagate_pending_fact_edits(deck_id):
+    '''
+    Takes the facts edited in the deck so far, and propagates them.
+    Later edits queue up another job.
+    '''
+    pipe = redis.pipeline()
+    pipe.delete(_fact_edit_propagation_queued_key(deck_id))
+    pipe.smembers(_pending_fact_edits_key(deck_id))
+    pipe.delete(_pending_fact_edits_key(deck_id))
+    _, fact_ids, _ = pipe.execute()
 
-    _copy_facts_to_subscribers(facts, subscribers=subscribers)
+    propagate_fact_edits([int(fact_id) for fact_id in fact_ids])
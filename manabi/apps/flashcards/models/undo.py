@@ -1,13 +1,16 @@
 import datetime
+import json
 import time
 
 import dateutil.parser
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import JSONField
 from django.db import (
+    connection,
     models,
     transaction,
 )
+from django.utils import timezone
 
 
 def _get_model_fields(model_instance, excluded_field_types=['AutoField', 'ForeignKey']):
@@ -41,21 +44,18 @@ class UndoCardReviewManager(models.Manager):
         '''
         self.of_user(user).delete()
 
-    @transaction.atomic
-    def add_undo(self, card_history):
+    def card_snapshot(self, card):
         '''
-        Only keeps 1 level undo for now, to simplify things.
+        Returns the fields of `card` that `undo` restores, as JSON values.
         '''
-        user = card_history.card.fact.deck.owner
-
         SKIP_FIELDS = {
             'new_card_ordinal', 'suspended', 'deck', 'fact', 'owner',
-            'template',
+            'template', 'modified_at', 'change_txid',
         }
 
         snapshot = {
-            field_name: getattr(card_history.card, field_name)
-            for field_name in _get_model_fields(card_history.card)
+            field_name: getattr(card, field_name)
+            for field_name in _get_model_fields(card)
             if field_name not in SKIP_FIELDS
         }
         for key, value in snapshot.viewitems():
@@ -65,19 +65,37 @@ class UndoCardReviewManager(models.Manager):
                 snapshot[key] = value.total_seconds()
             elif isinstance(value, datetime.datetime):
                 snapshot[key] = value.isoformat()
+        return snapshot
 
-        undo = UndoCardReview(
-            user=user,
-            card=card_history.card,
-            card_history=card_history,
-            card_snapshot=snapshot,
-        )
-
-        # Delete previous undo if it exists.
-        for user_undo in self.of_user(user):
-            user_undo.delete()
+    def add_undo(self, card_history, card_snapshot):
+        '''
+        Only keeps 1 level undo for now, to simplify things.
 
-        undo.save()
+        `card_snapshot` comes from `card_snapshot`, taken before the
+        review in `card_history` was applied to its card. Replaces the
+        user's previous undo in a single upsert.
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO {table}
+                    (timestamp, user_id, card_id, card_history_id,
+                     card_snapshot)
+                VALUES (%s, %s, %s, %s, %s::jsonb)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    timestamp = EXCLUDED.timestamp,
+                    card_id = EXCLUDED.card_id,
+                    card_history_id = EXCLUDED.card_history_id,
+                    card_snapshot = EXCLUDED.card_snapshot
+                '''.format(table=self.model._meta.db_table),
+                [
+                    timezone.now(),
+                    card_history.card.owner_id,
+                    card_history.card_id,
+                    card_history.id,
+                    json.dumps(card_snapshot),
+                ],
+            )
 
     @transaction.atomic
     def undo(self, user):
@@ -87,6 +105,8 @@ class UndoCardReviewManager(models.Manager):
         Returns the undone review's card, or None if there wasn't
         anything in the undo stack.
         '''
+        from manabi.apps.flashcards.signals import card_review_undone
+
         last_undo = self._last_undo(user)
         if not last_undo:
             return
@@ -117,6 +137,8 @@ class UndoCardReviewManager(models.Manager):
         # Delete this undo now that it's done
         last_undo.delete()
 
+        card_review_undone.send(card, instance=card)
+
         return card
 
 
@@ -124,7 +146,7 @@ class UndoCardReview(models.Model):
     objects = UndoCardReviewManager()
 
     timestamp = models.DateTimeField(auto_now_add=True, editable=False)
-    user = models.ForeignKey(User)  # Denormalization optimization
+    user = models.OneToOneField(User)  # Denormalization optimization
     card = models.ForeignKey('Card')
     card_history = models.ForeignKey('CardHistory')
 
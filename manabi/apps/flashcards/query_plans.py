@@ -0,0 +1,107 @@
+'''
+Checks that the scheduler's bucket queries can be served by the partial
+indexes made for them (see migration 0044), so that a change to a bucket's
+filters or ordering which silently stops matching its index gets caught.
+
+This only shows that the planner *can* serve each bucket from its index.
+Sorts and sequential scans are switched off while planning, so it doesn't
+show that the planner *will* choose the index given a real table's
+statistics; for that, `EXPLAIN ANALYZE` the queries against production
+data.
+
+Run it with the `check_scheduler_query_plans` management command, or via
+the test suite.
+'''
+
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from django.db import connection
+
+from manabi.apps.flashcards.models import Card
+
+# Which index each bucket (by `NextCardsBucket.name`) should be walking.
+# The "buried" bucket is drawn from the user's buried facts instead.
+SCHEDULER_BUCKET_INDEXES = OrderedDict([
+    ('failed_due', 'flashcards_card_failed_by_due_at'),
+    ('not_failed_due', 'flashcards_card_scheduled_by_interval'),
+    ('failed_not_due', 'flashcards_card_failed_by_due_at'),
+    ('new', 'flashcards_card_new_by_ordinal'),
+    ('new_buried_siblings', 'flashcards_card_new_by_ordinal'),
+    ('due_soon', 'flashcards_card_scheduled_by_due_at'),
+    ('due_soon2', 'flashcards_card_scheduled_by_due_at'),
+])
+
+QueryPlanProblem = namedtuple(
+    'QueryPlanProblem', ['bucket', 'expected_index', 'plan'])
+
+
+def _scheduler_buckets():
+    '''
+    Every bucket that `next_cards` might draw from, once each.
+    '''
+    buckets = OrderedDict()
+    for kwargs in [
+        {'early_review': True},
+        {'include_new_buried_siblings': True},
+    ]:
+        for bucket in Card.objects.all()._next_card_buckets(**kwargs):
+            buckets.setdefault(bucket.name, bucket)
+    return buckets.values()
+
+
+def explain(queryset):
+    with connection.cursor() as cursor:
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute('EXPLAIN ' + sql, params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def scheduler_query_plans(user, count=10):
+    '''
+    Returns an ordered dict of bucket names to the plans of their queries
+    for `user`, as `next_cards` would run them for `count` cards.
+
+    Sorts and sequential scans are discouraged while planning, so that the
+    plans show which indexes the planner *can* use regardless of how much
+    data there is. Otherwise with a small table (as in tests) it would
+    happily scan and sort everything instead. These aren't necessarily the
+    plans it would pick with the costs left alone.
+    '''
+    now = datetime.utcnow()
+    user_cards, buried_facts = Card.objects.all()._next_cards_initial_queries(
+        user, None, [], now)
+
+    plans = OrderedDict()
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_sort = off')
+        cursor.execute('SET enable_seqscan = off')
+        try:
+            for bucket in _scheduler_buckets():
+                cards = bucket.cards(
+                    user_cards,
+                    review_time=now,
+                    buried_facts=buried_facts,
+                    early_review_began_at=now - timedelta(hours=1),
+                )
+                plans[bucket.name] = explain(cards.values('pk')[:count])
+        finally:
+            cursor.execute('RESET enable_sort')
+            cursor.execute('RESET enable_seqscan')
+    return plans
+
+
+def check_scheduler_query_plans(user):
+    '''
+    Returns a list of `QueryPlanProblem`s, one for each bucket whose query
+    for `user` can't use the index listed in `SCHEDULER_BUCKET_INDEXES`
+    without a sort (see `scheduler_query_plans`).
+    '''
+    problems = []
+    for bucket, plan in scheduler_query_plans(user).iteritems():
+        expected_index = SCHEDULER_BUCKET_INDEXES.get(bucket)
+        if expected_index is None:
+            continue
+        if expected_index not in plan or 'Sort' in plan:
+            problems.append(QueryPlanProblem(bucket, expected_index, plan))
+    return problems
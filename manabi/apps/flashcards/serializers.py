@@ -1,4 +1,5 @@
 import logging
+from collections import OrderedDict
 from datetime import datetime
 
 from django.shortcuts import get_object_or_404
@@ -270,6 +271,111 @@ class CardSerializer(ManabiModelSerializer):
         )
 
 
+# For formatting like `CardSerializer`'s fields do.
+_datetime_field = serializers.DateTimeField()
+_duration_field = serializers.DurationField()
+
+CARD_LISTING_COLUMNS = [
+    'id',
+    'deck_id',
+    'fact_id',
+    'ease_factor',
+    'interval',
+    'due_at',
+    'last_ease_factor',
+    'last_interval',
+    'last_due_at',
+    'review_count',
+    'template',
+    'fact__expression',
+    'fact__reading',
+    'fact__meaning',
+    'last_reviewed_at',
+]
+
+
+def _format_datetime(value):
+    if value is None:
+        return None
+    return _datetime_field.to_representation(value)
+
+
+def _format_duration(value):
+    if value is None:
+        return None
+    return _duration_field.to_representation(value)
+
+
+def serialize_card_listing(cards):
+    '''
+    Gives the same data as `CardSerializer(cards, many=True).data`, much
+    faster, for listing many cards: reads rows with `values_list`, with
+    the fact's fields joined in rather than loaded per card, and builds
+    each card's dict directly instead of going through DRF's fields.
+    '''
+    return [
+        {
+            'id': id_,
+            'deck': deck_id,
+            'fact': fact_id,
+            'ease_factor': ease_factor,
+            'interval': _format_duration(interval),
+            'due_at': _format_datetime(due_at),
+            'last_ease_factor': last_ease_factor,
+            'last_interval': _format_duration(last_interval),
+            'last_due_at': _format_datetime(last_due_at),
+            'review_count': review_count,
+            'template': template,
+            'expression': expression,
+            'reading': reading,
+            'meaning': meaning,
+            'is_new': last_reviewed_at is None,
+        }
+        for (
+            id_, deck_id, fact_id, ease_factor, interval, due_at,
+            last_ease_factor, last_interval, last_due_at, review_count,
+            template, expression, reading, meaning, last_reviewed_at,
+        ) in cards.values_list(*CARD_LISTING_COLUMNS).iterator()
+    ]
+
+
+class _TombstoneMixin(object):
+    '''
+    For the changes feed: serializes deactivated (soft-deleted) objects as
+    just their ID, `active` and `modified_at`.
+    '''
+    def to_representation(self, instance):
+        if instance.active:
+            return super(_TombstoneMixin, self).to_representation(instance)
+        return OrderedDict([
+            ('id', instance.id),
+            ('active', False),
+            ('modified_at', self.fields['modified_at'].to_representation(
+                instance.modified_at)),
+        ])
+
+
+class ChangedDeckSerializer(_TombstoneMixin, DeckSerializer):
+    class Meta(DeckSerializer.Meta):
+        fields = DeckSerializer.Meta.fields + ('active',)
+
+
+class ChangedFactSerializer(_TombstoneMixin, FactWithCardsSerializer):
+    pass
+
+
+class ChangedCardSerializer(_TombstoneMixin, CardSerializer):
+    class Meta(CardSerializer.Meta):
+        fields = read_only_fields = CardSerializer.Meta.fields + (
+            'active',
+            'suspended',
+            'modified_at',
+            'last_reviewed_at',
+            'last_review_grade',
+            'new_card_ordinal',
+        )
+
+
 class DetailedCardSerializer(CardSerializer):
     deck = DeckSerializer()
     suspended = serializers.BooleanField()
@@ -350,3 +456,20 @@ class CardReviewSerializer(serializers.Serializer):
 
     next_due_at = serializers.DateTimeField(read_only=True)
     humanized_next_due_in = serializers.CharField(read_only=True)
+
+
+class BulkFactEditSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    expression = serializers.CharField(required=False, max_length=500)
+    reading = serializers.CharField(
+        required=False, allow_blank=True, max_length=1500)
+    meaning = serializers.CharField(required=False, max_length=1000)
+
+
+class BulkCardReviewSerializer(serializers.Serializer):
+    card_id = serializers.IntegerField()
+    grade = serializers.ChoiceField(choices=ALL_GRADES)
+    reviewed_at = serializers.DateTimeField()
+
+    # Like `Card.review`'s, this isn't recorded anywhere yet.
+    duration = serializers.FloatField(required=False, allow_null=True)
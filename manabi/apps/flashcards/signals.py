@@ -1,7 +1,13 @@
 import django.dispatch
 from django.dispatch import receiver
 from django.db.models.signals import post_save, post_delete, pre_delete
-from manabi.apps.flashcards.models import Card
+from manabi.apps.flashcards.models import Card, Deck
+from manabi.apps.flashcards.models.deck_counts import invalidate_deck_counts
+from manabi.apps.flashcards.models.review_queue_snapshot import (
+    invalidate_review_queue_snapshot,
+    update_review_queue_snapshot_after_review,
+    update_review_queue_snapshot_after_undo,
+)
 
 fact_suspended = django.dispatch.Signal()
 fact_unsuspended = django.dispatch.Signal()
@@ -41,9 +47,109 @@ def card_created(sender, instance, created, **kwargs):
 # Card signals
 
 pre_card_reviewed = django.dispatch.Signal(providing_args=['instance'])
-post_card_reviewed = django.dispatch.Signal(providing_args=['instance'])
+post_card_reviewed = django.dispatch.Signal(
+    providing_args=['instance', 'was_new'])
+
+# After `BulkCardReview` applies a batch of reviews, in place of
+# `post_card_reviewed` for each one.
+post_cards_reviewed = django.dispatch.Signal(providing_args=['instances'])
+
+# After `UndoCardReview.objects.undo` restores a card.
+card_review_undone = django.dispatch.Signal(providing_args=['instance'])
 
 # When a card's `active` field changes.
 # DEPRECATED.
 card_active_field_changed = django.dispatch.Signal(providing_args=['instance'])
 
+# After `FactQuerySet.change_card_templates` activates, deactivates or
+# creates cards, in place of `card_active_field_changed` for each one.
+cards_active_field_changed = django.dispatch.Signal(
+    providing_args=['instances'])
+
+
+########################################################################
+# Review queue snapshots
+
+@receiver(post_card_reviewed, dispatch_uid='review_queue_snapshot_cr')
+def card_reviewed_review_queue_snapshot(
+    sender, instance, was_new=False, **kwargs
+):
+    update_review_queue_snapshot_after_review(instance, was_new)
+
+@receiver(card_review_undone, dispatch_uid='review_queue_snapshot_cru')
+def card_review_undone_review_queue_snapshot(sender, instance, **kwargs):
+    update_review_queue_snapshot_after_undo(instance)
+
+@receiver(post_cards_reviewed, dispatch_uid='review_queue_snapshot_csr')
+@receiver(cards_active_field_changed, dispatch_uid='review_queue_snapshot_cafc_bulk')
+def cards_reviewed_review_queue_snapshot(sender, instances, **kwargs):
+    for owner_id in {card.owner_id for card in instances}:
+        invalidate_review_queue_snapshot(owner_id)
+
+@receiver(card_active_field_changed, dispatch_uid='review_queue_snapshot_cafc')
+@receiver(new_count_changed, dispatch_uid='review_queue_snapshot_ncc')
+def nuke_review_queue_snapshot_for_card(sender, instance, **kwargs):
+    invalidate_review_queue_snapshot(instance.owner_id)
+
+@receiver(fact_suspended, dispatch_uid='review_queue_snapshot_fs')
+@receiver(fact_unsuspended, dispatch_uid='review_queue_snapshot_fus')
+def nuke_review_queue_snapshot_for_fact(sender, instance, **kwargs):
+    invalidate_review_queue_snapshot(instance.deck.owner_id)
+
+
+########################################################################
+# Materialized fact burials
+
+@receiver(post_card_reviewed, dispatch_uid='buried_fact_cr')
+@receiver(card_review_undone, dispatch_uid='buried_fact_cru')
+def update_buried_fact_for_card(sender, instance, **kwargs):
+    from manabi.apps.flashcards.models import BuriedFact
+
+    BuriedFact.objects.update_for_fact(instance.fact_id, instance.owner_id)
+
+@receiver(post_cards_reviewed, dispatch_uid='buried_fact_csr')
+def update_buried_facts_for_cards(sender, instances, **kwargs):
+    from manabi.apps.flashcards.models import BuriedFact
+
+    facts = {(card.fact_id, card.owner_id) for card in instances}
+    for fact_id, owner_id in facts:
+        BuriedFact.objects.update_for_fact(fact_id, owner_id)
+
+@receiver(fact_suspended, dispatch_uid='buried_fact_fs')
+@receiver(fact_unsuspended, dispatch_uid='buried_fact_fus')
+def update_buried_fact_for_fact(sender, instance, **kwargs):
+    from manabi.apps.flashcards.models import BuriedFact
+
+    BuriedFact.objects.update_for_fact(instance.id, instance.deck.owner_id)
+
+
+########################################################################
+# Deck counts
+
+@receiver(post_save, sender=Card, dispatch_uid='deck_counts_cs')
+def card_saved_deck_counts(sender, instance, update_fields=None, **kwargs):
+    # Reviews only save the review fields.
+    if update_fields is None or (
+        set(update_fields) & {'deck', 'active', 'suspended'}
+    ):
+        invalidate_deck_counts([instance.deck_id])
+
+@receiver(post_delete, sender=Card, dispatch_uid='deck_counts_cd')
+@receiver(card_active_field_changed, dispatch_uid='deck_counts_cafc')
+def invalidate_deck_counts_for_card(sender, instance, **kwargs):
+    invalidate_deck_counts([instance.deck_id])
+
+@receiver(cards_active_field_changed, dispatch_uid='deck_counts_cafc_bulk')
+def invalidate_deck_counts_for_cards(sender, instances, **kwargs):
+    invalidate_deck_counts(card.deck_id for card in instances)
+
+@receiver(fact_suspended, dispatch_uid='deck_counts_fs')
+@receiver(fact_unsuspended, dispatch_uid='deck_counts_fus')
+@receiver(fact_deleted, dispatch_uid='deck_counts_fd')
+def invalidate_deck_counts_for_fact(sender, instance, **kwargs):
+    invalidate_deck_counts([instance.deck_id])
+
+@receiver(post_save, sender=Deck, dispatch_uid='deck_counts_ds')
+def invalidate_deck_counts_for_deck(sender, instance, **kwargs):
+    # Covers subscribing, since that creates the subscriber deck.
+    invalidate_deck_counts([instance.id, instance.synchronized_with_id])
@@ -2,26 +2,79 @@
 
 import itertools
 import json
+import random
+import threading
 import urllib
 from datetime import datetime, timedelta
 
-from django.test import Client, TestCase
+from django.db import connection, transaction
+from django.test import (
+    Client,
+    TestCase,
+    TransactionTestCase,
+)
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.conf import settings
 
 from manabi.apps.featured_decks.models import FeaturedDeck
-from manabi.apps.flashcards.models import Deck, Fact, Card
+from manabi.apps.flashcards.benchmarks import (
+    BENCHMARKS,
+    create_benchmark_fixtures,
+    delete_benchmark_redis_keys,
+    run_benchmarks,
+)
+from manabi.apps.flashcards.models import (
+    BuriedFact,
+    Card,
+    CardHistory,
+    Deck,
+    Fact,
+    KANJI_WRITING,
+    NextCardsForReview,
+    ReviewAvailabilities,
+    UndoCardReview,
+)
+from manabi.apps.flashcards.models.burying import (
+    BURIED_INDEFINITELY,
+    with_siblings_buried,
+)
+from manabi.apps.flashcards.models.card_review import BulkCardReview
 from manabi.apps.flashcards.models.constants import (
-    GRADE_NONE, GRADE_HARD, GRADE_GOOD, GRADE_EASY,
-    DEFAULT_EASE_FACTOR,
+    ALL_GRADES, GRADE_NONE, GRADE_HARD, GRADE_GOOD, GRADE_EASY,
+    DEFAULT_EASE_FACTOR, REVIEW_QUEUE_SNAPSHOT_TIMEOUT,
 )
+from manabi.apps.flashcards.models import changes, synchronization
+from manabi.apps.flashcards.models.deck_counts import reconcile_deck_counts
 from manabi.apps.flashcards.models.new_cards_limit import NewCardsLimit
+from manabi.apps.flashcards.models.redis_models import (
+    rebuild_redis,
+    remove_stale_keys,
+)
+from manabi.apps.flashcards.models.repetitionscheduler import (
+    RepetitionBatch,
+    repetition_algo_dispatcher,
+)
+from manabi.apps.flashcards.models.review_queue_snapshot import (
+    ReviewQueueSnapshot,
+    invalidate_review_queue_snapshot,
+)
+from manabi.apps.flashcards.models.synchronization import (
+    SubscriberSyncProgress,
+)
+from manabi.apps.flashcards.query_plans import check_scheduler_query_plans
+from manabi.apps.flashcards.serializers import (
+    CardSerializer,
+    serialize_card_listing,
+)
+from manabi.apps.manabi_redis.models import redis
 from manabi.test_helpers import (
     ManabiTestCase,
     create_sample_data,
     create_user,
     create_deck,
+    create_fact,
+    run_on_commit_callbacks,
 )
 
 
@@ -123,6 +176,143 @@ class ReviewsAPITest(ManabiTestCase):
         pass
 
 
+class CardReviewTest(ManabiTestCase):
+    def after_setUp(self):
+        self.user = create_user()
+        fact = create_sample_data(facts=1, user=self.user)[0]
+        self.card = fact.card_set.all()[0]
+
+    def test_review_query_count(self):
+        self.card.review(GRADE_GOOD)
+
+        # Sibling lookup; savepoint, history insert, undo upsert, card
+        # update, savepoint release; buried fact lookup and update.
+        with self.assertNumQueries(8):
+            self.card.review(GRADE_GOOD)
+
+    def test_review_keeps_one_undo(self):
+        self.card.review(GRADE_GOOD)
+        self.card.review(GRADE_EASY)
+        self.assertEqual(1, UndoCardReview.objects.of_user(self.user).count())
+
+        UndoCardReview.objects.undo(self.user)
+        card = Card.objects.get(id=self.card.id)
+        self.assertEqual(GRADE_GOOD, card.last_review_grade)
+        self.assertEqual(1, card.review_count)
+
+
+class BulkCardReviewTest(ManabiTestCase):
+    def after_setUp(self):
+        self.user = create_user()
+        self.facts = create_sample_data(facts=5, user=self.user)
+
+    def _bulk_review(self, reviews):
+        return self.post(
+            '/api/flashcards/cards/bulk_reviews/',
+            [
+                {
+                    'card_id': card.id,
+                    'grade': grade,
+                    'reviewed_at': reviewed_at.isoformat(),
+                }
+                for card, grade, reviewed_at in reviews
+            ],
+            user=self.user,
+        )
+
+    def test_matches_reviewing_one_at_a_time(self):
+        cards = [fact.card_set.order_by('id')[0] for fact in self.facts]
+        grades = itertools.cycle(
+            [GRADE_NONE, GRADE_HARD, GRADE_GOOD, GRADE_EASY])
+        reviewed_at = datetime.utcnow() - timedelta(hours=1)
+        reviews = [
+            (card, grade, reviewed_at + timedelta(minutes=i))
+            for i, (card, grade) in enumerate(zip(cards, grades))
+        ]
+
+        random.seed(7)
+        expected = [
+            repetition_algo_dispatcher(
+                card, grade, reviewed_at=review_time).next_repetition()
+            for card, grade, review_time in reviews
+        ]
+
+        random.seed(7)
+        BulkCardReview(self.user, [
+            {'card_id': card.id, 'grade': grade, 'reviewed_at': review_time}
+            for card, grade, review_time in reviews
+        ]).apply_reviews()
+
+        for (card, grade, review_time), repetition in zip(reviews, expected):
+            card = Card.objects.get(id=card.id)
+            self.assertEqual(repetition.interval, card.interval)
+            self.assertEqual(repetition.ease_factor, card.ease_factor)
+            self.assertEqual(repetition.due_at, card.due_at)
+            self.assertEqual(review_time, card.last_reviewed_at)
+            self.assertEqual(grade, card.last_review_grade)
+
+    def test_bulk_reviews_endpoint(self):
+        card = self.facts[0].card_set.order_by('id')[0]
+        other_card = self.facts[1].card_set.order_by('id')[0]
+        reviewed_at = datetime.utcnow() - timedelta(days=2)
+
+        response = self._bulk_review([
+            (card, GRADE_GOOD, reviewed_at),
+            (other_card, GRADE_GOOD, reviewed_at + timedelta(minutes=1)),
+            (card, GRADE_EASY, reviewed_at + timedelta(days=1)),
+        ])
+        self.assertEqual(200, response.status_code, response.content)
+        self.assertEqual(
+            [card.id, other_card.id],
+            [reviewed_card['id'] for reviewed_card in response.json()])
+
+        self.assertEqual(
+            3, CardHistory.objects.filter(card__owner=self.user).count())
+        self.assertEqual(2, Card.objects.get(id=card.id).review_count)
+
+        # Only the last review can be undone.
+        due_at_before_last_review = Card.objects.get(id=card.id).last_due_at
+        self.assertEqual(1, UndoCardReview.objects.of_user(self.user).count())
+        undone_card = UndoCardReview.objects.undo(self.user)
+        self.assertEqual(card.id, undone_card.id)
+        self.assertEqual(
+            due_at_before_last_review, Card.objects.get(id=card.id).due_at)
+        self.assertEqual(1, Card.objects.get(id=card.id).review_count)
+
+    def test_out_of_order_reviews_are_rejected(self):
+        card = self.facts[0].card_set.order_by('id')[0]
+        reviewed_at = datetime.utcnow() - timedelta(days=2)
+
+        response = self._bulk_review([
+            (card, GRADE_GOOD, reviewed_at),
+            (card, GRADE_GOOD, reviewed_at - timedelta(hours=1)),
+        ])
+        self.assertEqual(400, response.status_code)
+        self.assertTrue(Card.objects.get(id=card.id).is_new)
+        self.assertFalse(
+            CardHistory.objects.filter(card__owner=self.user).exists())
+
+    def test_future_reviews_are_rejected(self):
+        card = self.facts[0].card_set.order_by('id')[0]
+
+        response = self._bulk_review([
+            (card, GRADE_GOOD, datetime.utcnow() + timedelta(days=1))])
+        self.assertEqual(400, response.status_code)
+        self.assertTrue(Card.objects.get(id=card.id).is_new)
+
+        # A client clock that's only a little fast is tolerated.
+        response = self._bulk_review([
+            (card, GRADE_GOOD, datetime.utcnow() + timedelta(minutes=1))])
+        self.assertEqual(200, response.status_code, response.content)
+
+    def test_other_users_cards_are_not_found(self):
+        card = create_sample_data(facts=1)[0].card_set.all()[0]
+
+        response = self._bulk_review([
+            (card, GRADE_GOOD, datetime.utcnow())])
+        self.assertEqual(404, response.status_code)
+
+
 class SynchronizationTest(ManabiTestCase):
     def after_setUp(self):
         self.user = create_user()
@@ -178,6 +368,182 @@ class SynchronizationTest(ManabiTestCase):
         )
 
 
+    def test_resharing_copies_new_facts_to_subscribers_in_batches(self):
+        subscribed_decks = [
+            self.shared_deck.subscribe(create_user()) for _ in xrange(3)]
+        self.shared_deck.unshare()
+        new_fact = create_fact(user=self.user, deck=self.shared_deck)
+
+        batch_size = synchronization.SUBSCRIBER_DECK_BATCH_SIZE
+        synchronization.SUBSCRIBER_DECK_BATCH_SIZE = 2
+        try:
+            with run_on_commit_callbacks():
+                self.shared_deck.share()
+        finally:
+            synchronization.SUBSCRIBER_DECK_BATCH_SIZE = batch_size
+
+        for subscribed_deck in subscribed_decks:
+            copied_fact = subscribed_deck.facts.get(
+                synchronized_with=new_fact)
+            self.assertEqual(
+                new_fact.card_set.filter(active=True, suspended=False).count(),
+                copied_fact.card_set.count())
+            self.assertEqual(
+                {subscribed_deck.owner_id},
+                set(copied_fact.card_set.values_list('owner_id', flat=True)))
+        self.assertIsNone(
+            SubscriberSyncProgress(self.shared_deck.id).as_dict())
+
+    def test_background_copy_progress_waits_for_commit(self):
+        self.shared_deck.subscribe(create_user())
+        self.shared_deck.unshare()
+        new_fact = create_fact(user=self.user, deck=self.shared_deck)
+
+        with run_on_commit_callbacks():
+            self.shared_deck.share()
+
+            # Nothing's recorded or copied before the commit.
+            self.assertIsNone(
+                SubscriberSyncProgress(self.shared_deck.id).as_dict())
+            self.assertFalse(
+                Fact.objects.filter(synchronized_with=new_fact).exists())
+
+        self.assertTrue(
+            Fact.objects.filter(synchronized_with=new_fact).exists())
+
+
+    def _unsynchronized_subscriber_deck(self):
+        return Deck.objects.create(
+            owner=create_user(),
+            name=self.shared_deck.name,
+            synchronized_with=self.shared_deck,
+        )
+
+    def _subscriber_deck_contents(self, deck):
+        self.assertEqual(
+            {deck.owner_id},
+            set(Card.objects.filter(deck=deck).values_list(
+                'owner_id', flat=True)))
+        facts = sorted(deck.facts.values_list(
+            'synchronized_with_id', 'forked', 'new_fact_ordinal', 'active',
+            'expression', 'reading', 'meaning', 'modified_at', 'suspended',
+        ))
+        cards = sorted(Card.objects.filter(deck=deck).values_list(
+            'fact__synchronized_with_id', 'template', 'active', 'suspended',
+            'new_card_ordinal', 'review_count', 'ease_factor', 'interval',
+            'due_at', 'last_reviewed_at', 'last_review_grade',
+        ))
+        return facts, cards
+
+    def test_sql_copy_matches_python_copy(self):
+        shared_facts = list(self.shared_deck.facts.order_by('id'))
+        Fact.objects.filter(id=shared_facts[0].id).update(active=False)
+        Card.objects.filter(
+            id=shared_facts[1].card_set.order_by('id')[0].id,
+        ).update(active=False)
+        Card.objects.filter(
+            id=shared_facts[2].card_set.order_by('id')[0].id,
+        ).update(suspended=True)
+        shared_facts = list(self.shared_deck.facts.order_by('id'))
+
+        engines = [
+            synchronization._copy_facts_to_subscriber_decks_in_python,
+            synchronization._copy_facts_to_subscriber_decks,
+        ]
+        contents = []
+        for copy in engines:
+            subscriber_decks = [
+                self._unsynchronized_subscriber_deck() for _ in xrange(3)]
+            # One deck already has one of the facts.
+            copy(shared_facts[3:4], subscriber_decks[:1])
+
+            copy(self.shared_deck.facts.all(), subscriber_decks)
+            contents.append([
+                self._subscriber_deck_contents(deck)
+                for deck in subscriber_decks
+            ])
+
+        self.assertTrue(contents[0][0][1])
+        self.assertEqual(contents[0], contents[1])
+
+    def test_bulk_edit_propagates_to_unforked_subscriber_facts(self):
+        subscribed_deck = self._subscribe(self.shared_deck)
+        shared_facts = list(self.shared_deck.facts.order_by('id')[:3])
+
+        forked_fact = subscribed_deck.facts.get(
+            synchronized_with=shared_facts[0])
+        forked_fact.meaning = 'my own meaning'
+        forked_fact.save()
+        self.assertTrue(forked_fact.forked)
+
+        edited_facts = self.api.bulk_edit_facts([
+            {'id': shared_facts[0].id, 'meaning': 'edited 0'},
+            {'id': shared_facts[1].id, 'meaning': 'edited 1'},
+            {'id': shared_facts[1].id, 'reading': 'edited reading'},
+            {'id': shared_facts[2].id, 'expression': 'edited 2'},
+        ], self.user)
+        self.assertEqual(3, len(edited_facts))
+
+        subscriber_facts = {
+            fact.synchronized_with_id: fact
+            for fact in subscribed_deck.facts.filter(
+                synchronized_with__in=shared_facts)
+        }
+        self.assertEqual(
+            'my own meaning', subscriber_facts[shared_facts[0].id].meaning)
+        self.assertEqual(
+            'edited 1', subscriber_facts[shared_facts[1].id].meaning)
+        self.assertEqual(
+            'edited reading', subscriber_facts[shared_facts[1].id].reading)
+        self.assertEqual(
+            'edited 2', subscriber_facts[shared_facts[2].id].expression)
+
+    def test_deck_wide_card_template_change(self):
+        subscribed_deck = self._subscribe(self.shared_deck)
+        shared_facts = self.shared_deck.facts.order_by('id')
+        subscriber_facts = subscribed_deck.facts.order_by('id')
+
+        reviewed_card = Card.objects.get(
+            fact=subscriber_facts[1], template=KANJI_WRITING)
+        reviewed_card.review(GRADE_GOOD)
+        Card.objects.filter(
+            fact=subscriber_facts[0], template=KANJI_WRITING).delete()
+        Card.objects.filter(
+            fact=shared_facts[0], template=KANJI_WRITING).delete()
+
+        shared_facts.change_card_templates(deactivated=['kanji_writing'])
+        self.assertFalse(Card.objects.filter(
+            fact__in=shared_facts, template=KANJI_WRITING, active=True,
+        ).exists())
+        self.assertEqual(
+            [reviewed_card.id],
+            list(Card.objects.filter(
+                fact__in=subscriber_facts, template=KANJI_WRITING,
+                active=True,
+            ).values_list('id', flat=True)))
+
+        shared_facts.change_card_templates(activated=['kanji_writing'])
+        for facts, owner in [
+            (shared_facts, self.user),
+            (subscriber_facts, self.subscriber),
+        ]:
+            cards = Card.objects.filter(
+                fact__in=facts, template=KANJI_WRITING, active=True)
+            self.assertEqual(facts.count(), cards.count())
+            self.assertEqual(
+                {owner.id}, set(cards.values_list('owner_id', flat=True)))
+
+    def test_bulk_edit_of_other_users_facts(self):
+        fact = self.shared_deck.facts.first()
+        response = self.post(
+            '/api/flashcards/facts/bulk_edit/',
+            [{'id': fact.id, 'meaning': 'edited'}],
+            user=self.subscriber,
+        )
+        self.assertEqual(404, response.status_code)
+        self.assertNotEqual('edited', Fact.objects.get(id=fact.id).meaning)
+
+
 class SharedDecksTest(ManabiTestCase):
     def after_setUp(self):
         self.user = create_user()
@@ -199,6 +565,94 @@ class SharedDecksTest(ManabiTestCase):
         self.assertEqual(len(decks), 1)
         self.assertEqual(decks[0]['owner']['username'], self.user.username)
 
+    def _assert_deck_counts(self, decks):
+        decks = Deck.objects.filter(id__in=[deck.id for deck in decks])
+        self.assertEqual(
+            {
+                deck.id: Card.objects.available().filter(deck=deck).count()
+                for deck in decks
+            },
+            decks.card_counts())
+        self.assertEqual(
+            {
+                deck.id: deck.subscriber_decks.filter(active=True).count()
+                for deck in decks
+            },
+            decks.subscriber_counts())
+
+    def test_deck_counts_follow_changes(self):
+        subscriber_deck = self.shared_deck.subscriber_decks.get()
+        decks = [self.shared_deck, subscriber_deck]
+        self._assert_deck_counts(decks)
+        self.assertEqual(1, self.shared_deck.subscriber_count())
+
+        with run_on_commit_callbacks():
+            self.shared_deck.card_set.first().deactivate()
+            self.shared_deck.facts.first().suspend()
+        self._assert_deck_counts(decks)
+
+        with run_on_commit_callbacks():
+            self.shared_deck.subscribe(create_user())
+        self.assertEqual(2, self.shared_deck.subscriber_count())
+
+        with run_on_commit_callbacks():
+            subscriber_deck.delete()
+        self._assert_deck_counts(decks)
+        self.assertEqual(1, self.shared_deck.subscriber_count())
+
+    def test_reconcile_deck_counts(self):
+        self.shared_deck.card_count()
+        redis.hset(
+            'deck_counts:{}'.format(self.shared_deck.id), 'card_count', 999)
+
+        mismatches = reconcile_deck_counts([self.shared_deck.id])
+        self.assertEqual([self.shared_deck.id], mismatches.keys())
+        self._assert_deck_counts([self.shared_deck])
+        self.assertEqual({}, reconcile_deck_counts([self.shared_deck.id]))
+
+    def test_deck_facts_are_streamed(self):
+        for url, user in [
+            ('/api/flashcards/decks/{}/facts/', self.user),
+            ('/api/flashcards/shared_decks/{}/facts/', self.subscriber),
+        ]:
+            response = self.get(url.format(self.shared_deck.id), user=user)
+            self.assertTrue(response.streaming)
+            facts = json.loads(b''.join(response.streaming_content))
+            self.assertEqual(
+                sorted(self.shared_deck.facts.values_list('id', flat=True)),
+                [fact['id'] for fact in facts])
+
+    def test_deck_facts_in_chunks(self):
+        create_sample_data(facts=3, user=self.user)
+        facts = Fact.objects.filter(deck__owner=self.user)
+        chunks = list(facts.in_chunks(chunk_size=2))
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual(
+            sorted(facts.values_list('id', flat=True)),
+            [fact.id for chunk in chunks for fact in chunk])
+
+    def test_deck_facts_sync_pages(self):
+        for _ in xrange(3):
+            create_fact(user=self.user, deck=self.shared_deck)
+        edited_fact = self.shared_deck.facts.order_by('id').first()
+        edited_fact.meaning = 'edited'
+        edited_fact.save()
+
+        url = '/api/flashcards/decks/{}/facts/?page_size=2'.format(
+            self.shared_deck.id)
+        fact_ids = []
+        while url is not None:
+            page = self.get(url, user=self.user).json()
+            self.assertTrue(len(page['results']) <= 2)
+            fact_ids.extend(fact['id'] for fact in page['results'])
+            url = page['next']
+
+        self.assertEqual(5, len(fact_ids))
+        self.assertEqual(edited_fact.id, fact_ids[-1])
+        self.assertEqual(
+            set(self.shared_deck.facts.values_list('id', flat=True)),
+            set(fact_ids))
+
     def test_featured_decks(self):
         FeaturedDeck.objects.create(deck=self.shared_deck)
         featured_decks = self.api.suggested_shared_decks()['featured_decks']
@@ -210,6 +664,53 @@ class SharedDecksTest(ManabiTestCase):
         print subscribers
         self.assertEqual(len(subscribers), 1)
 
+    def test_deck_sync_progress(self):
+        self.assertIsNone(
+            self.api.deck_sync_progress(self.shared_deck, self.user))
+
+        progress = SubscriberSyncProgress(self.shared_deck.id)
+        progress.add(3)
+        progress.mark_done(1)
+        self.assertEqual(
+            {'subscriber_decks_total': 3, 'subscriber_decks_done': 1},
+            self.api.deck_sync_progress(self.shared_deck, self.user))
+
+        progress.mark_done(2)
+        self.assertIsNone(
+            self.api.deck_sync_progress(self.shared_deck, self.user))
+
+
+class DeckCountsCommitTest(TransactionTestCase):
+    '''
+    Commits for real, so that invalidations deferred until the commit
+    run when they would outside tests.
+    '''
+
+    def test_counts_fresh_after_commit(self):
+        user = create_user()
+        create_sample_data(facts=2, user=user)
+        deck = Deck.objects.filter(owner=user).first()
+        card_count = deck.card_count()
+
+        concurrent_card_counts = []
+
+        def count_concurrently():
+            try:
+                concurrent_card_counts.append(
+                    Deck.objects.get(id=deck.id).card_count())
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            Card.objects.available().filter(deck=deck).first().deactivate()
+
+            # Before the commit, other connections see the old count.
+            thread = threading.Thread(target=count_concurrently)
+            thread.start()
+            thread.join()
+
+        self.assertEqual([card_count], concurrent_card_counts)
+        self.assertEqual(card_count - 1, deck.card_count())
 
 class DeckTest(ManabiTestCase):
     def after_setUp(self):
@@ -228,6 +729,126 @@ class DeckTest(ManabiTestCase):
         self.assertFalse(sample_card.active)
 
 
+class ChangesTest(ManabiTestCase):
+    def after_setUp(self):
+        self.user = create_user()
+        create_sample_data(facts=3, user=self.user)
+        self.deck = Deck.objects.get(owner=self.user)
+
+        # Everything here is in the test's own transaction, which is still
+        # in progress.
+        self.settled_change_txid = changes.settled_change_txid
+        changes.settled_change_txid = lambda: 2 ** 63 - 1
+
+    def before_tearDown(self):
+        changes.settled_change_txid = self.settled_change_txid
+
+    def _sync(self, cursor=None, page_size=None):
+        synced = {kind: [] for kind in changes.CHANGE_KINDS}
+        while True:
+            page = self.api.changes(
+                self.user, cursor=cursor, page_size=page_size)
+            for kind in changes.CHANGE_KINDS:
+                synced[kind].extend(page[kind])
+            cursor = page['cursor']
+            if not page['has_more']:
+                return synced, cursor
+
+    def test_sync_in_pages(self):
+        synced, cursor = self._sync(page_size=2)
+
+        self.assertEqual(
+            [self.deck.id], [deck['id'] for deck in synced['decks']])
+        self.assertEqual(
+            sorted(self.deck.facts.values_list('id', flat=True)),
+            sorted(fact['id'] for fact in synced['facts']))
+        self.assertEqual(
+            sorted(self.deck.card_set.values_list('id', flat=True)),
+            sorted(card['id'] for card in synced['cards']))
+
+        synced, _ = self._sync(cursor=cursor)
+        for kind in changes.CHANGE_KINDS:
+            self.assertEqual([], synced[kind])
+
+    def test_bulk_updates_are_tracked(self):
+        card = self.deck.card_set.first()
+        self.assertIsNotNone(card.modified_at)
+        self.assertIsNotNone(card.change_txid)
+        self.assertEqual(
+            {self.user.id},
+            set(self.deck.facts.values_list('deck_owner_id', flat=True)))
+
+        Card.objects.filter(id=card.id).update(
+            modified_at=datetime(2000, 1, 1))
+        Card.objects.filter(id=card.id).update(suspended=True)
+        self.assertNotEqual(
+            datetime(2000, 1, 1), Card.objects.get(id=card.id).modified_at)
+
+    def test_deactivated_objects_are_tombstones(self):
+        fact = self.deck.facts.first()
+        fact.delete()
+        card = self.deck.card_set.exclude(fact=fact).first()
+        card.deactivate()
+
+        synced, _ = self._sync()
+        synced_facts = {fact['id']: fact for fact in synced['facts']}
+        synced_cards = {card['id']: card for card in synced['cards']}
+
+        self.assertEqual(
+            ['active', 'id', 'modified_at'], sorted(synced_facts[fact.id]))
+        self.assertFalse(synced_facts[fact.id]['active'])
+        self.assertFalse(synced_cards[card.id]['active'])
+        self.assertTrue(all(
+            synced_fact['active'] for synced_fact in synced_facts.values()
+            if synced_fact['id'] != fact.id))
+
+    def test_invalid_cursor(self):
+        response = self.get(
+            '/api/flashcards/changes/', {'cursor': 'nonsense'},
+            user=self.user)
+        self.assertEqual(400, response.status_code)
+
+
+class ChangesCommitOrderTest(TransactionTestCase):
+    '''
+    Commits for real, from two connections, so that transactions can
+    commit out of order.
+    '''
+
+    def test_long_transaction_not_skipped(self):
+        user = create_user()
+        create_sample_data(facts=2, user=user)
+        early_card, late_card = Card.objects.filter(owner=user)[:2]
+        _, positions, _ = changes.changes_since(user)
+
+        started, finish = threading.Event(), threading.Event()
+
+        def edit_in_long_transaction():
+            try:
+                with transaction.atomic():
+                    Card.objects.filter(id=early_card.id).update(
+                        suspended=True)
+                    started.set()
+                    finish.wait()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=edit_in_long_transaction)
+        thread.start()
+        started.wait()
+
+        # Commits before the transaction which started earlier.
+        Card.objects.filter(id=late_card.id).update(suspended=True)
+        changed, positions, _ = changes.changes_since(user, positions)
+        self.assertEqual([], changed['cards'])
+
+        finish.set()
+        thread.join()
+        changed, _, _ = changes.changes_since(user, positions)
+        self.assertEqual(
+            {early_card.id, late_card.id},
+            {card.id for card in changed['cards']})
+
 class NewCardsLimitTest(ManabiTestCase):
     def after_setUp(self):
         self.user = create_user()
@@ -252,3 +873,607 @@ class NewCardsLimitTest(ManabiTestCase):
 
         self.assertEqual(
             0, self._get_limit(user=create_user()).learned_today_count)
+
+
+class ReviewAvailabilitiesTest(ManabiTestCase):
+    def after_setUp(self):
+        self.user = create_user()
+        create_sample_data(facts=6, user=self.user)
+
+        cards = list(Card.objects.filter(owner=self.user).order_by('id'))
+        cards[0].review(GRADE_NONE)
+        for card in cards[2:6]:
+            card.review(GRADE_GOOD)
+        Card.objects.filter(id__in=[cards[0].id, cards[2].id]).update(
+            due_at=datetime.utcnow() - timedelta(days=1))
+
+    def test_counts_match_querysets(self):
+        availabilities = ReviewAvailabilities(self.user)
+        cards = availabilities.base_cards_queryset
+        buried_fact_ids = Fact.objects.buried(self.user).values_list(
+            'id', flat=True)
+
+        self.assertTrue(availabilities.ready_for_review)
+        self.assertFalse(availabilities.early_review_available)
+        self.assertEqual(
+            cards.failed().due().count(), availabilities.failed_due_count)
+        self.assertEqual(
+            cards.young().due().excluding_failed().count(),
+            availabilities.young_due_count)
+        self.assertEqual(
+            cards.mature().due().excluding_failed().count(),
+            availabilities.mature_due_count)
+        self.assertEqual(
+            cards.new_count(
+                self.user, including_buried=False,
+                buried_fact_ids=buried_fact_ids),
+            availabilities.next_new_cards_count)
+
+    def test_single_query(self):
+        availabilities = ReviewAvailabilities(
+            self.user,
+            new_cards_limit=NewCardsLimit(self.user, learned_today_count=0),
+            buried_fact_ids=[],
+        )
+        with self.assertNumQueries(1):
+            availabilities.ready_for_review
+            availabilities.early_review_available
+            availabilities.next_new_cards_count
+            availabilities.buried_new_cards_count
+            availabilities.new_cards_per_day_limit_override
+            availabilities.primary_prompt
+            availabilities.secondary_prompt
+
+
+class NextCardsParityTest(ManabiTestCase):
+    '''
+    `Card.objects.next_cards` must pick the same cards, in the same order,
+    as querying one bucket at a time.
+    '''
+    def after_setUp(self):
+        self.user = create_user()
+        self.facts = create_sample_data(facts=20, user=self.user)
+
+        rng = random.Random(1234)
+        now = datetime.utcnow()
+        for card in Card.objects.filter(owner=self.user):
+            state = rng.choice(['new', 'new', 'due', 'failed', 'not_due'])
+            if state == 'new':
+                continue
+
+            card.last_reviewed_at = now - timedelta(
+                minutes=rng.randrange(10, 60 * 24 * 30))
+            card.interval = timedelta(minutes=rng.randrange(10, 60 * 24 * 60))
+            card.ease_factor = DEFAULT_EASE_FACTOR
+            card.last_review_grade = GRADE_GOOD
+
+            due_in = timedelta(minutes=rng.randrange(5, 60 * 24 * 10))
+            if state == 'due':
+                card.due_at = now - due_in
+            elif state == 'not_due':
+                card.due_at = now + due_in
+            elif state == 'failed':
+                card.last_review_grade = GRADE_NONE
+                card.last_failed_at = card.last_reviewed_at
+                card.due_at = rng.choice([now - due_in, now + due_in])
+            card.save()
+
+        BuriedFact.objects.backfill()
+
+    def _assert_parity(self, count, **kwargs):
+        expected = [
+            card.id for card in
+            Card.objects.all()._cascading_next_cards(
+                self.user, count, **kwargs)
+        ]
+        actual = [
+            card.id for card in
+            Card.objects.next_cards(self.user, count, **kwargs)
+        ]
+        self.assertTrue(expected)
+        self.assertEqual(expected, actual)
+
+    def test_review(self):
+        for count in [1, 7, 30, 100]:
+            self._assert_parity(count, new_cards_limit=10)
+
+    def test_new_cards_limit(self):
+        self._assert_parity(100, new_cards_limit=0)
+        self._assert_parity(100, new_cards_limit=3)
+        self._assert_parity(100)
+
+    def test_excluded_ids(self):
+        excluded_ids = set(
+            Card.objects.filter(owner=self.user)
+            .order_by('?').values_list('id', flat=True)[:15])
+        self._assert_parity(30, new_cards_limit=10, excluded_ids=excluded_ids)
+
+    def test_deck(self):
+        other_deck_facts = create_sample_data(facts=3, user=self.user)
+        self._assert_parity(
+            30, new_cards_limit=10, deck=other_deck_facts[0].deck)
+
+    def test_early_review(self):
+        self._assert_parity(100, new_cards_limit=10, early_review=True)
+        self._assert_parity(
+            100, new_cards_limit=10, early_review=True,
+            early_review_began_at=datetime.utcnow() - timedelta(days=2))
+
+    def test_include_new_buried_siblings(self):
+        self._assert_parity(
+            100, new_cards_limit=30, include_new_buried_siblings=True)
+
+    def test_learn_more(self):
+        self._assert_parity(20, new_cards_limit=30, learn_more=True)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            cards = Card.objects.next_cards(
+                self.user, 30, new_cards_limit=10)
+            for card in cards:
+                card.fact.expression
+
+
+class SiblingBuryingTest(ManabiTestCase):
+    def after_setUp(self):
+        self.user = create_user()
+        create_sample_data(facts=15, user=self.user)
+
+        # Lots of ties and NULLs, to exercise the tiebreaking.
+        rng = random.Random(4321)
+        now = datetime.utcnow()
+        for card in Card.objects.filter(owner=self.user):
+            card.due_at = rng.choice(
+                [None, now - timedelta(days=1), now - timedelta(days=2)])
+            card.interval = rng.choice(
+                [None, timedelta(days=1), timedelta(days=3)])
+            card.new_card_ordinal = rng.choice([None, 1, 2])
+            card.save()
+
+    def test_keeps_first_card_of_each_fact(self):
+        cards = Card.objects.filter(owner=self.user)
+        for order_by, sort_key in [
+            ('due_at', lambda card: (
+                card.due_at is None, card.due_at, card.id)),
+            ('-interval', lambda card: (
+                card.interval is not None, -(card.interval or timedelta()),
+                -card.id)),
+            ('new_card_ordinal', lambda card: (
+                card.new_card_ordinal is None, card.new_card_ordinal,
+                card.id)),
+            (None, lambda card: card.id),
+        ]:
+            expected, seen_fact_ids = [], set()
+            for card in sorted(cards, key=sort_key):
+                if card.fact_id not in seen_fact_ids:
+                    seen_fact_ids.add(card.fact_id)
+                    expected.append(card.id)
+
+            actual = [
+                card.id for card in
+                with_siblings_buried(cards, order_by=order_by)
+            ]
+            if order_by is None:
+                actual.sort()
+            self.assertEqual(expected, actual, order_by)
+
+    def test_buckets_need_no_sort(self):
+        '''
+        The ordered buckets should be servable by walking an index in
+        order, rather than by sorting all of the user's cards.
+        '''
+        initial_query, buried_facts = (
+            Card.objects.all()._next_cards_initial_queries(
+                self.user, None, [], datetime.utcnow()))
+        buckets = [
+            Card.objects.all()._failed_due_cards(
+                initial_query, review_time=datetime.utcnow()),
+            Card.objects.all()._not_failed_due_cards(
+                initial_query, review_time=datetime.utcnow()),
+            Card.objects.all()._new_cards(
+                initial_query, buried_facts=buried_facts),
+        ]
+
+        with connection.cursor() as cursor:
+            # These make the planner avoid sorts and sequential scans
+            # wherever there's any alternative, which on this little
+            # data it otherwise wouldn't bother with.
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for bucket in buckets:
+                sql, params = bucket[:10].query.sql_with_params()
+                cursor.execute('EXPLAIN ' + sql, params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                self.assertNotIn('Sort', plan, plan)
+
+
+class SchedulerQueryPlanTest(ManabiTestCase):
+    def test_buckets_use_their_indexes(self):
+        user = create_user()
+        create_sample_data(facts=5, user=user)
+
+        problems = check_scheduler_query_plans(user)
+        self.assertEqual(
+            [], problems,
+            '\n\n'.join(
+                '{}: expected {}\n{}'.format(*problem)
+                for problem in problems))
+
+
+class RepetitionBatchTest(ManabiTestCase):
+    '''
+    Scheduling with what `RepetitionBatch` supplies must agree with each
+    card's `next_repetition_per_grade`, fuzzing included.
+    '''
+    def after_setUp(self):
+        self.user = create_user()
+        create_sample_data(facts=15, user=self.user)
+
+        rng = random.Random(4321)
+        now = datetime.utcnow()
+        for card in Card.objects.filter(owner=self.user):
+            state = rng.choice(['new', 'failed', 'young', 'mature'])
+            if state == 'new':
+                continue
+
+            card.last_reviewed_at = now - timedelta(
+                minutes=rng.randrange(10, 60 * 24 * 60))
+            card.ease_factor = rng.uniform(1.3, 3.0)
+            card.last_review_grade = rng.choice(
+                [GRADE_HARD, GRADE_GOOD, GRADE_EASY])
+            if state == 'failed':
+                card.last_review_grade = GRADE_NONE
+                card.interval = timedelta(minutes=10)
+            elif state == 'young':
+                card.interval = timedelta(minutes=rng.randrange(10, 60 * 24 * 19))
+            else:
+                card.interval = timedelta(days=rng.randrange(20, 200))
+            # Both early and late reviews.
+            card.due_at = card.last_reviewed_at + timedelta(
+                seconds=card.interval.total_seconds() * rng.uniform(0.2, 1.8))
+            card.save()
+
+    def test_matches_scalar_algorithms(self):
+        cards = list(Card.objects.filter(owner=self.user).order_by('id'))
+        reviewed_at = datetime.utcnow()
+
+        batch = RepetitionBatch(
+            Card.objects.filter(owner=self.user)
+            .values_list('id', 'fact_id', 'last_reviewed_at'))
+
+        random.seed(99)
+        batched = {}
+        for card in cards:
+            kwargs = batch.repetition_algo_kwargs(card, reviewed_at)
+            batched[card.id] = {
+                grade: repetition_algo_dispatcher(
+                    card, grade, **kwargs)._next_repetition()
+                for grade in ALL_GRADES
+            }
+
+        random.seed(99)
+        for card in cards:
+            expected = card.next_repetition_per_grade(reviewed_at=reviewed_at)
+            for grade, repetition in expected.items():
+                actual = batched[card.id][grade]
+                self.assertEqual(repetition.interval, actual.interval)
+                self.assertEqual(repetition.ease_factor, actual.ease_factor)
+                self.assertEqual(repetition.due_at, actual.due_at)
+
+
+class ReviewQueueSnapshotTest(ManabiTestCase):
+    def after_setUp(self):
+        self.user = create_user()
+        create_sample_data(facts=20, user=self.user)
+        self.snapshot = ReviewQueueSnapshot(
+            self.user, new_cards_per_day_limit_override=30)
+        with run_on_commit_callbacks():
+            invalidate_review_queue_snapshot(self.user.id)
+
+    def _next_cards(self, excluded_card_ids=()):
+        return NextCardsForReview(
+            self.user,
+            7,
+            excluded_card_ids=set(excluded_card_ids),
+            new_cards_per_day_limit_override=30,
+        ).cards
+
+    def _stored_snapshot(self):
+        data = redis.get(self.snapshot.key)
+        if data is None:
+            return None
+        return json.loads(data)
+
+    def _queued_card_ids(self):
+        return [entry[0] for entry in self._stored_snapshot()['queue']]
+
+    def test_follow_up_page_comes_from_snapshot(self):
+        first_page = self._next_cards()
+        first_page_ids = {card.id for card in first_page}
+
+        with self.assertNumQueries(1):
+            second_page = self._next_cards(excluded_card_ids=first_page_ids)
+
+        self.assertEqual(7, len(second_page))
+        self.assertFalse(first_page_ids & {card.id for card in second_page})
+
+    def test_review_updates_snapshot(self):
+        card = self._next_cards()[0]
+        with run_on_commit_callbacks():
+            card.review(GRADE_GOOD)
+
+        snapshot = self._stored_snapshot()
+        self.assertNotIn(card.id, self._queued_card_ids())
+        self.assertIn(card.fact_id, snapshot['buried_fact_ids'])
+        self.assertEqual(1, snapshot['new_cards_learned_since_built'])
+
+    def test_failed_review_invalidates_snapshot(self):
+        card = self._next_cards()[0]
+        with run_on_commit_callbacks():
+            card.review(GRADE_NONE)
+        self.assertIsNone(self._stored_snapshot())
+
+    def test_rolled_back_review_leaves_snapshot(self):
+        card = self._next_cards()[0]
+        snapshot_before_review = self._stored_snapshot()
+
+        with run_on_commit_callbacks():
+            with transaction.atomic():
+                card.review(GRADE_NONE)
+                self.assertEqual(
+                    snapshot_before_review, self._stored_snapshot())
+                transaction.set_rollback(True)
+
+        self.assertEqual(snapshot_before_review, self._stored_snapshot())
+
+    def test_undo_restores_snapshot(self):
+        card = self._next_cards()[0]
+        snapshot_before_review = self._stored_snapshot()
+
+        with run_on_commit_callbacks():
+            card.review(GRADE_GOOD)
+            UndoCardReview.objects.undo(self.user)
+
+        snapshot = self._stored_snapshot()
+        for field in [
+            'queue', 'reviewed_card_ids', 'new_cards_learned_since_built',
+        ]:
+            self.assertEqual(snapshot_before_review[field], snapshot[field])
+        self.assertEqual(
+            set(snapshot_before_review['buried_fact_ids']),
+            set(snapshot['buried_fact_ids']))
+
+    def test_stale_after_timeout(self):
+        self._next_cards()
+        self.assertIsNotNone(self.snapshot.page(7))
+
+        snapshot = self._stored_snapshot()
+        snapshot['built_at'] -= int(
+            REVIEW_QUEUE_SNAPSHOT_TIMEOUT.total_seconds())
+        redis.set(self.snapshot.key, json.dumps(snapshot))
+        self.assertIsNone(self.snapshot.page(7))
+
+    def test_stale_after_end_of_day(self):
+        self._next_cards()
+
+        snapshot = self._stored_snapshot()
+        snapshot['day_ends_at'] = snapshot['built_at'] - 1
+        redis.set(self.snapshot.key, json.dumps(snapshot))
+        self.assertIsNone(self.snapshot.page(7))
+
+    def test_stale_with_different_filters(self):
+        self._next_cards()
+        self.assertIsNone(
+            ReviewQueueSnapshot(
+                self.user, new_cards_per_day_limit_override=5).page(7))
+
+    def test_stale_with_unknown_excluded_cards(self):
+        self._next_cards()
+        unknown_card = create_sample_data(facts=1, user=create_user())[0]
+        self.assertIsNone(self.snapshot.page(
+            7, excluded_card_ids={unknown_card.card_set.first().id}))
+
+    def test_stale_when_exhausted(self):
+        self._next_cards()
+        self.assertIsNone(self.snapshot.page(len(self._queued_card_ids()) + 1))
+
+    def test_suspension_invalidates_snapshot(self):
+        card = self._next_cards()[0]
+        with run_on_commit_callbacks():
+            card.fact.suspend()
+        self.assertIsNone(self._stored_snapshot())
+
+
+class BuriedFactTest(ManabiTestCase):
+    def after_setUp(self):
+        self.user = create_user()
+        self.facts = create_sample_data(facts=4, user=self.user)
+
+    def _buried_fact_ids(self, **kwargs):
+        return set(
+            Fact.objects.buried(self.user, **kwargs)
+            .values_list('id', flat=True))
+
+    def _assert_consistent(self):
+        self.assertEqual(
+            (set(), set()), BuriedFact.objects.inconsistencies(self.user))
+
+    def test_review_buries_fact(self):
+        card = self.facts[0].card_set.first()
+        card.review(GRADE_GOOD)
+
+        self.assertEqual({card.fact_id}, self._buried_fact_ids())
+        self._assert_consistent()
+
+    def test_failed_review_buries_fact_indefinitely(self):
+        card = self.facts[0].card_set.first()
+        card.review(GRADE_NONE)
+
+        self.assertEqual(
+            BURIED_INDEFINITELY,
+            BuriedFact.objects.get(fact_id=card.fact_id).buried_until)
+        self._assert_consistent()
+
+    def test_undo_unburies_fact(self):
+        card = self.facts[0].card_set.first()
+        card.review(GRADE_GOOD)
+        UndoCardReview.objects.undo(self.user)
+
+        self.assertEqual(set(), self._buried_fact_ids())
+        self._assert_consistent()
+
+    def test_excluded_cards_bury_their_facts(self):
+        card = self.facts[1].card_set.first()
+        self.assertEqual(
+            {card.fact_id},
+            self._buried_fact_ids(excluded_card_ids=[card.id]))
+
+    def test_backfill(self):
+        now = datetime.utcnow()
+        for fact, grade in zip(self.facts, [GRADE_NONE, GRADE_GOOD]):
+            card = fact.card_set.first()
+            card.last_reviewed_at = now - timedelta(hours=1)
+            card.last_review_grade = grade
+            card.interval = timedelta(days=3)
+            card.due_at = now + timedelta(days=3)
+            card.save()
+
+        # Rows which bulk updates left wrong or stale.
+        wrong_burial = BuriedFact.objects.create(
+            fact=self.facts[0], owner=self.user, buried_until=now)
+        BuriedFact.objects.create(
+            fact=self.facts[2], owner=self.user,
+            buried_until=now + timedelta(days=1))
+        other_user = create_user()
+        other_fact = create_sample_data(facts=1, user=other_user)[0]
+        BuriedFact.objects.create(
+            fact=other_fact, owner=other_user,
+            buried_until=now + timedelta(days=1))
+
+        self.assertEqual(2, BuriedFact.objects.backfill(user=self.user))
+        self._assert_consistent()
+        self.assertEqual(
+            BURIED_INDEFINITELY,
+            BuriedFact.objects.get(id=wrong_burial.id).buried_until)
+        self.assertTrue(BuriedFact.objects.filter(fact=other_fact).exists())
+
+        self.assertEqual(2, BuriedFact.objects.backfill())
+        self.assertFalse(BuriedFact.objects.filter(fact=other_fact).exists())
+
+
+class RedisRebuildTest(ManabiTestCase):
+    def after_setUp(self):
+        self.user = create_user()
+        create_sample_data(facts=4, user=self.user)
+        self.deck = Deck.objects.get(owner=self.user)
+        self.cards = list(Card.objects.filter(owner=self.user).order_by('id'))
+
+    def _card_ids(self, key):
+        return {int(card_id) for card_id in redis.smembers(key)}
+
+    def _card_ids_in_db(self, **kwargs):
+        return set(Card.objects.filter(**kwargs).values_list('id', flat=True))
+
+    def test_rebuild(self):
+        self.cards[0].deactivate()
+        rebuild_redis(owner_ids=[self.user.id])
+
+        self.assertEqual(
+            self._card_ids_in_db(owner=self.user),
+            self._card_ids('cards:owner:{}'.format(self.user.id)))
+        self.assertEqual(
+            self._card_ids_in_db(deck=self.deck),
+            self._card_ids('cards:deck:{}'.format(self.deck.id)))
+        self.assertEqual(
+            self._card_ids_in_db(deck=self.deck, active=True),
+            {int(card_id) for card_id in redis.zrange(
+                'ease_factor:deck:{}'.format(self.deck.id), 0, -1)})
+
+    def test_chunked_rebuild_of_owner_range(self):
+        other_user = create_user()
+        create_sample_data(facts=2, user=other_user)
+
+        rebuilt_owners = []
+        rebuild_redis(
+            min_owner_id=self.user.id - 1,
+            max_owner_id=max(self.user.id, other_user.id),
+            chunk_size=5,
+            owner_rebuilt=lambda owner_id, card_count: (
+                rebuilt_owners.append((owner_id, card_count))),
+        )
+
+        self.assertEqual(
+            [
+                (self.user.id, len(self.cards)),
+                (other_user.id,
+                 Card.objects.filter(owner=other_user).count()),
+            ],
+            rebuilt_owners)
+        for user in [self.user, other_user]:
+            self.assertEqual(
+                self._card_ids_in_db(owner=user),
+                self._card_ids('cards:owner:{}'.format(user.id)))
+
+    def test_stale_keys_removed(self):
+        create_sample_data(facts=1, user=self.user)
+        other_user = create_user()
+        create_sample_data(facts=1, user=other_user)
+        rebuild_redis(owner_ids=[self.user.id, other_user.id])
+
+        # Rebuilding only reaches the decks and users which still have
+        # cards.
+        Card.objects.filter(deck=self.deck).delete()
+        Card.objects.filter(owner=other_user).delete()
+        rebuild_redis(owner_ids=[self.user.id, other_user.id])
+        emptied_deck_key = 'cards:deck:{}'.format(self.deck.id)
+        other_user_key = 'cards:owner:{}'.format(other_user.id)
+        self.assertTrue(redis.exists(emptied_deck_key))
+        self.assertTrue(redis.exists(other_user_key))
+
+        self.assertTrue(remove_stale_keys())
+        self.assertFalse(redis.exists(emptied_deck_key))
+        self.assertFalse(redis.exists(other_user_key))
+        self.assertEqual(
+            self._card_ids_in_db(owner=self.user),
+            self._card_ids('cards:owner:{}'.format(self.user.id)))
+
+
+class CardListingTest(ManabiTestCase):
+    def test_fast_path_matches_serializer(self):
+        fixtures = create_benchmark_fixtures(card_count=40)
+        cards = Card.objects.of_user(fixtures.reviewer).order_by('id')
+        self.assertTrue(cards.filter(due_at__isnull=False).exists())
+
+        self.assertEqual(
+            [dict(card) for card in CardSerializer(cards, many=True).data],
+            serialize_card_listing(cards))
+
+    def test_cards_endpoint(self):
+        user = create_user()
+        create_sample_data(facts=2, user=user)
+        cards = self.get('/api/flashcards/cards/', user=user).json()
+        self.assertEqual(
+            sorted(Card.objects.of_user(user).values_list('id', flat=True)),
+            [card['id'] for card in cards])
+
+
+class BenchmarkTest(ManabiTestCase):
+    def test_benchmarks_run(self):
+        fixtures = create_benchmark_fixtures(card_count=80)
+        self.assertEqual(
+            80, Card.objects.of_user(fixtures.reviewer).count())
+
+        results = run_benchmarks(fixtures, rounds=2, warmup_rounds=0)
+        self.assertEqual(list(BENCHMARKS), list(results))
+        for result in results.values():
+            self.assertEqual(2, len(result['queries']))
+            self.assertTrue(result['min'] <= result['max'])
+        json.dumps(results)
+
+        snapshot_key = ReviewQueueSnapshot(fixtures.reviewer).key
+        self.assertTrue(redis.exists(snapshot_key))
+        delete_benchmark_redis_keys()
+        self.assertFalse(redis.exists(snapshot_key))
+        for deck in Deck.objects.filter(owner=fixtures.reviewer):
+            self.assertFalse(redis.exists('deck_counts:{}'.format(deck.id)))
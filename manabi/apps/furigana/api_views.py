@@ -2,7 +2,20 @@ from rest_framework.decorators import api_view
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from manabi.apps.furigana import inject
+from manabi.apps.furigana.cache import (
+    cached_inject_furigana,
+    cached_inject_furigana_batch,
+)
+
+MAX_BATCH_TEXTS = 1000
+
+
+def _furigana_result(text_with_furigana, furigana_positions):
+    return {
+        'text_with_furigana': text_with_furigana,
+        'furigana_positions': furigana_positions,
+    }
+
 
 @api_view(['POST'])
 def inject_furigana(request):
@@ -11,9 +24,33 @@ def inject_furigana(request):
     except KeyError:
         raise ValidationError("Must supply text parameter.")
 
-    text_with_furigana, furigana_positions = inject.inject_furigana(text)
+    return Response(_furigana_result(*cached_inject_furigana(text)))
+
+
+@api_view(['POST'])
+def inject_furigana_batch(request):
+    '''
+    Like `inject_furigana`, for a list of `texts` at once. Returns the
+    results in the same order, under `results`.
+    '''
+    try:
+        texts = request.data['texts']
+    except KeyError:
+        raise ValidationError("Must supply texts parameter.")
+
+    if (
+        not isinstance(texts, list)
+        or not all(isinstance(text, basestring) for text in texts)
+    ):
+        raise ValidationError("texts must be a list of strings.")
+    if len(texts) > MAX_BATCH_TEXTS:
+        raise ValidationError(
+            "Can't inject furigana into more than {} texts at once.".format(
+                MAX_BATCH_TEXTS))
 
     return Response({
-        'text_with_furigana': text_with_furigana,
-        'furigana_positions': furigana_positions,
+        'results': [
+            _furigana_result(*result)
+            for result in cached_inject_furigana_batch(texts)
+        ],
     })
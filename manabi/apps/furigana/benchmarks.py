@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+'''
+Throughput of furigana injection through the API, one text per request
+versus a batch of texts per request, and of injecting furigana into
+documents of increasing size.
+
+Run them with the `benchmark_furigana` management command, which prints
+the results as JSON so that runs can be compared across commits.
+'''
+
+import random
+import threading
+from collections import OrderedDict
+
+from rest_framework.test import APIRequestFactory
+
+from manabi.apps.furigana import inject
+from manabi.apps.furigana.api_views import (
+    inject_furigana,
+    inject_furigana_batch,
+)
+from manabi.apps.utils.benchmarking import Benchmarks, time_rounds
+
+_SAMPLE_WORDS = [
+    u'背を寄せる', u'学び', u'日本語', u'勉強', u'漢字', u'読み方', u'食べる',
+    u'図書館', u'電車', u'新しい', u'友達', u'ゆっくり', u'話す', u'天気',
+    u'今日', u'明日', u'静か', u'foobar', u'東京', u'旅行',
+]
+
+# Document sizes in bytes of UTF-8, by label.
+DOCUMENT_SIZES = OrderedDict([
+    ('1kb', 1000),
+    ('100kb', 100000),
+    ('1mb', 1000000),
+])
+
+
+def create_benchmark_texts(count=200, seed=0):
+    '''
+    Returns `count` expressions of a few sample words each, like the
+    facts of a deck.
+    '''
+    rng = random.Random(seed)
+    return [
+        u''.join(
+            rng.choice(_SAMPLE_WORDS) for _ in xrange(rng.randint(1, 5)))
+        for _ in xrange(count)
+    ]
+
+
+def create_benchmark_document(size, seed=0):
+    '''
+    Returns a document of about `size` bytes of UTF-8, in lines of a few
+    sentences each, like an article pasted in for reading practice.
+    '''
+    rng = random.Random(seed)
+    lines = []
+    length = 0
+    while length < size:
+        line = u'。'.join(
+            u''.join(
+                rng.choice(_SAMPLE_WORDS) for _ in xrange(rng.randint(3, 8)))
+            for _ in xrange(rng.randint(1, 4))
+        ) + u'。'
+        lines.append(line)
+        length += len(line.encode('utf8')) + 1
+    return u'\n'.join(lines)
+
+
+# Benchmarks
+#
+# Each takes the texts and returns a function which injects furigana into
+# all of them once.
+
+BENCHMARKS = Benchmarks()
+benchmark = BENCHMARKS.register
+
+
+@benchmark
+def single_requests(texts):
+    request_factory = APIRequestFactory()
+
+    def run():
+        for text in texts:
+            request = request_factory.post(
+                '/api/furigana/inject/', {'text': text}, format='json')
+            inject_furigana(request).render()
+    return run
+
+
+@benchmark
+def batch_request(texts):
+    request_factory = APIRequestFactory()
+
+    def run():
+        request = request_factory.post(
+            '/api/furigana/inject/batch/', {'texts': texts}, format='json')
+        inject_furigana_batch(request).render()
+    return run
+
+
+# Document benchmarks
+#
+# Each takes a document and returns a function which injects furigana
+# into it once.
+
+DOCUMENT_BENCHMARKS = Benchmarks()
+document_benchmark = DOCUMENT_BENCHMARKS.register
+
+
+@document_benchmark
+def inject_document(document):
+    def run():
+        inject.inject_furigana(document)
+    return run
+
+
+@document_benchmark
+def stream_document_positions(document):
+    def run():
+        for _ in inject.iter_furigana_positions(document):
+            pass
+    return run
+
+
+def _concurrently(run, threads):
+    '''
+    Returns a function which calls `run` in `threads` threads at once.
+    '''
+    if threads == 1:
+        return run
+
+    def run_concurrently():
+        workers = [threading.Thread(target=run) for _ in xrange(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    return run_concurrently
+
+
+def run_benchmarks(texts, names=None, rounds=5, warmup_rounds=1, threads=1):
+    '''
+    Runs the benchmarks named in `names` (or all of them), in `threads`
+    threads at once. Returns an ordered dict of benchmark names to their
+    timings (in seconds) per round, and texts injected per second.
+    '''
+    results = OrderedDict()
+    for name, benchmark_func in BENCHMARKS.selected(names):
+        result = time_rounds(
+            _concurrently(benchmark_func(texts), threads),
+            rounds=rounds,
+            warmup_rounds=warmup_rounds,
+        )
+        result['texts_per_second'] = len(texts) * threads / result['median']
+        results[name] = result
+    return results
+
+
+def run_document_benchmarks(
+    sizes=DOCUMENT_SIZES, names=None, rounds=5, warmup_rounds=1, seed=0,
+):
+    '''
+    Runs the document benchmarks named in `names` (or all of them) on a
+    document of each of `sizes`. Returns an ordered dict of benchmark
+    names to ordered dicts of size labels to their timings (in seconds)
+    per round, and bytes injected per second.
+    '''
+    documents = OrderedDict(
+        (label, create_benchmark_document(size, seed=seed))
+        for label, size in sizes.iteritems()
+    )
+
+    results = OrderedDict()
+    for name, benchmark_func in DOCUMENT_BENCHMARKS.selected(names):
+        results[name] = OrderedDict()
+        for label, document in documents.iteritems():
+            result = time_rounds(
+                benchmark_func(document),
+                rounds=rounds,
+                warmup_rounds=warmup_rounds,
+            )
+            result['bytes_per_second'] = (
+                len(document.encode('utf8')) / result['median'])
+            results[name][label] = result
+    return results
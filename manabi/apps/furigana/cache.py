@@ -0,0 +1,137 @@
+'''
+Caches `inject_furigana` results by text, in memory per process and in
+the Django cache, since the same expressions are injected over and over
+(every subscriber's copy of a shared fact has the same text).
+
+Keys are content hashes which include the MeCab dictionary's version and
+charset (not its path, so that hosts with it installed in different places
+share results). There's nothing to invalidate: results from another
+dictionary just stop being looked up.
+'''
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.core.cache import cache
+
+from manabi.apps.furigana.inject import (
+    get_tagger,
+    inject_furigana,
+    inject_furigana_batch,
+)
+
+FURIGANA_CACHE_SIZE = 10000
+FURIGANA_CACHE_TIMEOUT = int(timedelta(days=30).total_seconds())
+
+
+class _LRUCache(object):
+    '''
+    A dict bounded to `size` items, which evicts the least recently used.
+    Safe to share between threads.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return None
+            self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_results = _LRUCache(FURIGANA_CACHE_SIZE)
+
+_dictionary_version = None
+
+
+def _get_dictionary_version():
+    global _dictionary_version
+    if _dictionary_version is None:
+        dictionary_info = get_tagger().dictionary_info()
+        _dictionary_version = '{}:{}'.format(
+            dictionary_info.version, dictionary_info.charset)
+    return _dictionary_version
+
+
+def _cache_key(text):
+    content_hash = hashlib.sha1(_get_dictionary_version())
+    content_hash.update('\0')
+    content_hash.update(text.encode('utf8'))
+    return 'furigana:{}'.format(content_hash.hexdigest())
+
+
+def cached_inject_furigana_batch(texts):
+    '''
+    Returns a list of `inject_furigana` results, one for each of `texts`,
+    from the in-memory cache or else the Django cache where they're
+    there. Only the rest get parsed, and the results are cached in both.
+    '''
+    keys = [_cache_key(text) for text in texts]
+    results = {key: _results.get(key) for key in keys}
+
+    missing_keys = [key for key in set(keys) if results[key] is None]
+    if missing_keys:
+        cached_results = cache.get_many(missing_keys)
+        for key, result in cached_results.iteritems():
+            _results.set(key, result)
+        results.update(cached_results)
+
+    uncached_texts = OrderedDict(
+        (key, text) for key, text in zip(keys, texts)
+        if results[key] is None
+    )
+    if uncached_texts:
+        injected = dict(zip(
+            uncached_texts,
+            inject_furigana_batch(uncached_texts.values()),
+        ))
+        for key, result in injected.iteritems():
+            _results.set(key, result)
+        cache.set_many(injected, FURIGANA_CACHE_TIMEOUT)
+        results.update(injected)
+
+    return [results[key] for key in keys]
+
+
+def cached_inject_furigana(text):
+    '''
+    `inject_furigana`, through the caches.
+    '''
+    key = _cache_key(text)
+
+    result = _results.get(key)
+    if result is None:
+        result = cache.get(key)
+        if result is None:
+            result = inject_furigana(text)
+            cache.set(key, result, FURIGANA_CACHE_TIMEOUT)
+        _results.set(key, result)
+
+    return result
+
+
+def precompute_furigana(texts):
+    '''
+    Caches the `inject_furigana` results for `texts` ahead of when
+    they're requested.
+    '''
+    cached_inject_furigana_batch(texts)
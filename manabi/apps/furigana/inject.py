@@ -1,14 +1,37 @@
 # -*- coding: utf-8 -*-
 
+import threading
+
 import MeCab
 import jcconv
 from django.conf import settings
 
-tagger = MeCab.Tagger('-Ochasen')
+# Texts get parsed in pieces of about this many characters, ending at
+# line breaks (see `_chunks`).
+FURIGANA_CHUNK_SIZE = 10000
+
+_taggers = threading.local()
+
+
+def get_tagger(arguments='-Ochasen'):
+    '''
+    Returns this thread's MeCab tagger for `arguments`, creating it on
+    first use.
+
+    Taggers aren't safe to share between threads, so each thread of a
+    threaded worker gets its own instead of serializing on a global one.
+    '''
+    taggers = getattr(_taggers, 'taggers', None)
+    if taggers is None:
+        taggers = _taggers.taggers = {}
+
+    tagger = taggers.get(arguments)
+    if tagger is None:
+        tagger = taggers[arguments] = MeCab.Tagger(arguments)
+    return tagger
 
 
 def _reading(node):
-    surface = node.surface.decode('utf8')
     reading = node.feature.decode('utf8').split(',')[-2]
     if reading == '*':
         return None
@@ -17,61 +40,153 @@ def _reading(node):
     return reading
 
 
+def parse_to_node(tagger, text):
+    '''
+    Returns the first node of `tagger`'s parse of `text` (encoded).
+    '''
+    # https://runble1.com/python-mecab-morphological-analysis/
+    tagger.parse('')
+    return tagger.parseToNode(text)
+
+
+def _chunks(text):
+    '''
+    Yields `(offset, chunk)` for pieces of `text` of about
+    `FURIGANA_CHUNK_SIZE` characters, ending at line breaks. A line longer
+    than that is a chunk on its own.
+
+    MeCab's parse of a chunk can differ from its parse of the whole text
+    near the ends of the chunk, so everything which parses text for
+    furigana goes through these same chunks, and agrees.
+    '''
+    start = 0
+    while start < len(text):
+        end = text.find(u'\n', start + FURIGANA_CHUNK_SIZE)
+        end = len(text) if end == -1 else end + 1
+        yield start, text[start:end]
+        start = end
+
+
+def _chunk_words(tagger, chunk):
+    '''
+    Yields `(offset, surface, reading)` for each word MeCab splits `chunk`
+    into, where `offset` is the index of `surface` in `chunk`.
+
+    Follows the byte lengths of the nodes (with and without the
+    whitespace MeCab skipped before them) instead of searching the rest of
+    the text for each surface, so it takes linear time.
+    '''
+    encoded_chunk = chunk.encode('utf8')
+    byte_offset = 0
+    offset = 0
+
+    node = parse_to_node(tagger, encoded_chunk)
+    while node:
+        if node.stat not in (MeCab.MECAB_BOS_NODE, MeCab.MECAB_EOS_NODE):
+            surface_start = byte_offset + node.rlength - node.length
+            surface_end = byte_offset + node.rlength
+
+            offset += len(
+                encoded_chunk[byte_offset:surface_start].decode('utf8'))
+            surface = encoded_chunk[surface_start:surface_end].decode('utf8')
+            yield offset, surface, _reading(node)
+
+            offset += len(surface)
+            byte_offset = surface_end
+        node = node.next
+
+
+def _words(tagger, text):
+    '''
+    Yields `(offset, surface, reading)` for each word of `text`, parsed in
+    `_chunks`, where `offset` is the index of `surface` in `text`.
+    '''
+    for chunk_offset, chunk in _chunks(text):
+        for offset, surface, reading in _chunk_words(tagger, chunk):
+            yield chunk_offset + offset, surface, reading
+
+
+def _furigana(surface, reading):
+    '''
+    Returns `(surface, reading, suffix)` with the kana that `surface` ends
+    with moved from it and `reading` to `suffix`, or `None` if `surface`
+    needs no furigana.
+    '''
+    if (reading is None
+            or reading == surface
+            or jcconv.hira2kata(reading) == surface):
+        return None
+
+    suffix = ''
+    redundant_length = 0
+    for surface_char, reading_char in zip(
+        reversed(surface), reversed(reading),
+    ):
+        if surface_char != reading_char:
+            break
+        redundant_length += 1
+    if redundant_length > 0:
+        reading = reading[:-redundant_length]
+        suffix = surface[-redundant_length:]
+        surface = surface[:-redundant_length]
+
+    return surface, reading, suffix
+
+
 def inject_furigana(text):
     '''
     Returns 2-tuple of (text_with_furigana, furigana_positions).
     '''
-    furigana_positions = []
+    return _inject_furigana(get_tagger(), text)
 
-    injected_text = []
-    remaining_text = text
-    current_offset = 0
 
-    # https://runble1.com/python-mecab-morphological-analysis/
-    tagger.parse('')
+def inject_furigana_batch(texts):
+    '''
+    Returns a list of `inject_furigana` results, one for each of `texts`.
+    '''
+    tagger = get_tagger()
+    return [_inject_furigana(tagger, text) for text in texts]
 
-    node = tagger.parseToNode(text.encode('utf8'))
-    while node:
-        surface = node.surface.decode('utf8')
 
-        # Add any skipped text.
-        node_index_in_remaining_text = remaining_text.find(surface)
-        injected_text.append(remaining_text[:node_index_in_remaining_text])
-        remaining_text = (
-            remaining_text[node_index_in_remaining_text + len(surface):])
+def _inject_furigana(tagger, text):
+    furigana_positions = []
+    injected_text = []
+    end = 0
 
-        reading = _reading(node)
+    for offset, surface, reading in _words(tagger, text):
+        # Add any skipped text.
+        injected_text.append(text[end:offset])
+        end = offset + len(surface)
 
-        # Skip text?
-        if (reading is None
-                or reading == surface
-                or jcconv.hira2kata(reading) == surface):
+        furigana = _furigana(surface, reading)
+        if furigana is None:
             injected_text.append(surface)
-            current_offset += node_index_in_remaining_text + len(surface)
-            node = node.next
             continue
 
-        suffix = ''
-        redundant_length = 0
-        for surface_char, reading_char in zip(
-            reversed(surface), reversed(reading),
-        ):
-            if surface_char != reading_char:
-                break
-            redundant_length += 1
-        if redundant_length > 0:
-            reading = reading[:-redundant_length]
-            suffix = surface[-redundant_length:]
-            surface = surface[:-redundant_length]
-
+        surface, reading, suffix = furigana
         injected_text.append(u'｜{}《{}》{}'.format(surface, reading, suffix))
+        furigana_positions.append((offset, offset + len(surface), reading))
 
-        current_offset += node_index_in_remaining_text
-        furigana_positions.append((current_offset, current_offset + len(surface), reading))
-        current_offset += len(surface) + len(suffix)
+    injected_text.append(text[end:])
 
-        node = node.next
+    return (u''.join(injected_text), furigana_positions)
 
-    injected_text.append(remaining_text)
 
-    return (u''.join(injected_text), furigana_positions)
+def iter_furigana_positions(text):
+    '''
+    Yields the `furigana_positions` of `inject_furigana(text)`, in a list
+    for each chunk of `text` (see `_chunks`), for documents too long to
+    hold all the positions of at once.
+    '''
+    tagger = get_tagger()
+
+    for chunk_offset, chunk in _chunks(text):
+        furigana_positions = []
+        for offset, surface, reading in _chunk_words(tagger, chunk):
+            furigana = _furigana(surface, reading)
+            if furigana is not None:
+                surface, reading, _ = furigana
+                start = chunk_offset + offset
+                furigana_positions.append(
+                    (start, start + len(surface), reading))
+        yield furigana_positions
@@ -0,0 +1,8 @@
+from django_rq import job
+
+from manabi.apps.furigana import cache
+
+
+@job
+def precompute_furigana(texts):
+    cache.precompute_furigana(texts)
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+from django.core.management.base import CommandError
+
+from manabi.apps.furigana.benchmarks import (
+    BENCHMARKS,
+    DOCUMENT_BENCHMARKS,
+    DOCUMENT_SIZES,
+    create_benchmark_texts,
+    run_benchmarks,
+    run_document_benchmarks,
+)
+from manabi.apps.utils.benchmarking import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Times furigana injection through the API, one text per request '
+        'versus batches, and into documents of increasing size, and prints '
+        'the results as JSON.'
+    )
+    benchmarks = list(BENCHMARKS) + list(DOCUMENT_BENCHMARKS)
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--texts', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument(
+            '--document-sizes', nargs='*', choices=list(DOCUMENT_SIZES),
+            default=list(DOCUMENT_SIZES))
+
+    def run_benchmarks(self, names, **options):
+        if options['threads'] < 1:
+            raise CommandError("Need at least one thread.")
+
+        if names and not set(names) & set(BENCHMARKS):
+            results = {}
+        else:
+            texts = create_benchmark_texts(
+                count=options['texts'], seed=options['seed'])
+            results = run_benchmarks(
+                texts,
+                names=names,
+                rounds=options['rounds'],
+                warmup_rounds=options['warmup_rounds'],
+                threads=options['threads'],
+            )
+
+        if names and not set(names) & set(DOCUMENT_BENCHMARKS):
+            document_results = {}
+        else:
+            document_results = run_document_benchmarks(
+                sizes=OrderedDict(
+                    (label, DOCUMENT_SIZES[label])
+                    for label in options['document_sizes']
+                ),
+                names=names,
+                rounds=options['rounds'],
+                warmup_rounds=options['warmup_rounds'],
+                seed=options['seed'],
+            )
+
+        return OrderedDict([
+            ('texts', options['texts']),
+            ('threads', options['threads']),
+            ('seed', options['seed']),
+            ('results', results),
+            ('document_results', document_results),
+        ])
@@ -1,9 +1,33 @@
 # -*- coding: utf-8 -*-
 
+import json
+import threading
+
+from django.core.cache import cache
+
 from manabi.test_helpers import (
     ManabiTestCase,
+    create_deck,
+    create_fact,
+    create_user,
+    run_on_commit_callbacks,
+)
+from manabi.apps.furigana import cache as furigana_cache
+from manabi.apps.furigana.api_views import MAX_BATCH_TEXTS
+from manabi.apps.furigana.benchmarks import (
+    BENCHMARKS,
+    DOCUMENT_BENCHMARKS,
+    create_benchmark_document,
+    create_benchmark_texts,
+    run_benchmarks,
+    run_document_benchmarks,
+)
+from manabi.apps.furigana.inject import (
+    get_tagger,
+    inject_furigana,
+    inject_furigana_batch,
+    iter_furigana_positions,
 )
-from manabi.apps.furigana.inject import inject_furigana
 
 
 FURIGANA_POSITION_START = 0
@@ -21,6 +45,23 @@ class FuriganaInjectionAPITest(ManabiTestCase):
         text_with_furigana = self.api.inject_furigana(u"背を寄せる")
         self.assertEqual(u"｜背《せ》を｜寄《よ》せる", text_with_furigana)
 
+    def test_batch(self):
+        texts_with_furigana = self.api.inject_furigana_batch(
+            [u"背を寄せる", u'foo bar', u"学び"])
+        self.assertEqual(
+            [u"｜背《せ》を｜寄《よ》せる", u'foo bar', u"｜学《まな》び"],
+            texts_with_furigana)
+
+    def test_batch_limit(self):
+        response = self.post(
+            '/api/furigana/inject/batch/',
+            {'texts': [u'foo'] * (MAX_BATCH_TEXTS + 1)})
+        self.assertEqual(400, response.status_code)
+
+    def test_batch_requires_list_of_strings(self):
+        response = self.post('/api/furigana/inject/batch/', {'texts': u'foo'})
+        self.assertEqual(400, response.status_code)
+
 
 class FuriganaInjectionTest(ManabiTestCase):
     def test_plain_ascii_text(self):
@@ -77,3 +118,124 @@ class FuriganaInjectionTest(ManabiTestCase):
         self.assertEqual(furigana_positions[0][FURIGANA_POSITION_START], 7)
         self.assertEqual(furigana_positions[0][FURIGANA_POSITION_END], 8)
         self.assertEqual(furigana_positions[0][FURIGANA_POSITION_FURIGANA], u"せ")
+
+    def test_whitespace_and_line_breaks_kept(self):
+        text_with_furigana, furigana_positions = inject_furigana(
+            u"  背を\n\n寄せる 学び  ")
+        self.assertEqual(
+            u"  ｜背《せ》を\n\n｜寄《よ》せる ｜学《まな》び  ",
+            text_with_furigana)
+        self.assertEqual(
+            [(2, 3, u"せ"), (6, 7, u"よ"), (10, 11, u"まな")],
+            furigana_positions)
+
+    def test_streamed_positions_match(self):
+        # Line breaks in the middle of sentences, where parsing chunks
+        # can differ from parsing the whole text.
+        document = create_benchmark_document(60000).replace(u'。\n', u'\n')
+        _, furigana_positions = inject_furigana(document)
+
+        chunks = list(iter_furigana_positions(document))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(
+            furigana_positions,
+            [position for chunk in chunks for position in chunk])
+
+    def test_batch_matches_single(self):
+        texts = [u"背を寄せる", u"学びfoobar学び", u'foo bar']
+        self.assertEqual(
+            [inject_furigana(text) for text in texts],
+            inject_furigana_batch(texts))
+
+    def test_tagger_per_thread(self):
+        taggers = []
+        thread = threading.Thread(target=lambda: taggers.append(get_tagger()))
+        thread.start()
+        thread.join()
+
+        self.assertIs(get_tagger(), get_tagger())
+        self.assertIsNot(get_tagger(), taggers[0])
+
+
+class FuriganaCacheTest(ManabiTestCase):
+    def after_setUp(self):
+        cache.clear()
+        furigana_cache._results.clear()
+
+        self.injected_texts = []
+        self._inject_furigana_batch = furigana_cache.inject_furigana_batch
+
+        def recording_inject_furigana_batch(texts):
+            self.injected_texts.extend(texts)
+            return self._inject_furigana_batch(texts)
+        furigana_cache.inject_furigana_batch = recording_inject_furigana_batch
+
+    def before_tearDown(self):
+        furigana_cache.inject_furigana_batch = self._inject_furigana_batch
+
+    def test_cached_results_match(self):
+        texts = [u"背を寄せる", u"学びfoobar学び", u"背を寄せる"]
+        self.assertEqual(
+            [inject_furigana(text) for text in texts],
+            furigana_cache.cached_inject_furigana_batch(texts))
+        self.assertEqual(
+            inject_furigana(u"学び"),
+            furigana_cache.cached_inject_furigana(u"学び"))
+
+    def test_parses_each_text_once(self):
+        furigana_cache.cached_inject_furigana_batch([u"背を寄せる"] * 2)
+        furigana_cache.cached_inject_furigana_batch([u"背を寄せる", u"学び"])
+        self.assertEqual([u"背を寄せる", u"学び"], self.injected_texts)
+
+    def test_falls_back_to_django_cache(self):
+        furigana_cache.precompute_furigana([u"背を寄せる"])
+        furigana_cache._results.clear()
+
+        furigana_cache.cached_inject_furigana_batch([u"背を寄せる"])
+        self.assertEqual([u"背を寄せる"], self.injected_texts)
+
+    def test_least_recently_used_evicted(self):
+        results = furigana_cache._LRUCache(2)
+        results.set('a', 1)
+        results.set('b', 2)
+        results.get('a')
+        results.set('c', 3)
+
+        self.assertEqual(1, results.get('a'))
+        self.assertIsNone(results.get('b'))
+        self.assertEqual(3, results.get('c'))
+
+    def test_precomputed_on_fact_save(self):
+        deck = create_deck(user=create_user())
+        fact = create_fact(deck=deck)
+        with run_on_commit_callbacks():
+            fact.expression = u"背を寄せる"
+            fact.save()
+            # It's left to a job queued once the save commits.
+            self.assertNotIn(u"背を寄せる", self.injected_texts)
+        self.assertIn(u"背を寄せる", self.injected_texts)
+
+        del self.injected_texts[:]
+        with run_on_commit_callbacks():
+            fact.meaning = u'to lean back'
+            fact.save()
+        self.assertEqual([], self.injected_texts)
+
+
+class FuriganaBenchmarkTest(ManabiTestCase):
+    def test_benchmarks_run(self):
+        texts = create_benchmark_texts(count=10)
+        results = run_benchmarks(
+            texts, rounds=2, warmup_rounds=0, threads=2)
+        self.assertEqual(list(BENCHMARKS), list(results))
+        for result in results.values():
+            self.assertTrue(result['min'] <= result['max'])
+        json.dumps(results)
+
+    def test_document_benchmarks_run(self):
+        results = run_document_benchmarks(
+            sizes={'1kb': 1000}, rounds=2, warmup_rounds=0)
+        self.assertEqual(list(DOCUMENT_BENCHMARKS), list(results))
+        for result in results.values():
+            self.assertTrue(result['1kb']['min'] <= result['1kb']['max'])
+        json.dumps(results)
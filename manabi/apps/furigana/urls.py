@@ -4,4 +4,5 @@ from manabi.apps.furigana import api_views
 
 urlpatterns = [
     url(r'^inject/$', api_views.inject_furigana),
+    url(r'^inject/batch/$', api_views.inject_furigana_batch),
 ]
@@ -0,0 +1,117 @@
+'''
+Read-only tables of frequencies by word (or kanji), stored in a compact
+sorted binary file which gets memory-mapped rather than loaded. Importing
+one costs nothing, and every worker process shares the same pages of the
+file instead of building its own dict.
+
+The file is laid out as:
+
+- a header of `MAGIC` and the number of words,
+- an index entry per word, in order of the word's UTF-8: the offset of
+  the word in the words section, and its frequency, followed by one more
+  offset for the end of the last word,
+- the words section, the UTF-8 of each word back to back.
+
+Words are found by binary search over the index.
+'''
+
+import mmap
+import struct
+import threading
+
+MAGIC = 'MNBFRQ01'
+
+_HEADER = struct.Struct('<8sI')
+_ENTRY = struct.Struct('<II')
+
+
+def write_frequency_table(frequencies, f):
+    '''
+    Writes `frequencies`, a dict of words to frequencies, to the file `f`
+    in the format `FrequencyTable` reads.
+    '''
+    words = sorted(
+        (word.encode('utf8'), frequency)
+        for word, frequency in frequencies.iteritems()
+    )
+
+    f.write(_HEADER.pack(MAGIC, len(words)))
+    offset = 0
+    for word, frequency in words:
+        f.write(_ENTRY.pack(offset, frequency))
+        offset += len(word)
+    f.write(_ENTRY.pack(offset, 0))
+
+    for word, _ in words:
+        f.write(word)
+
+
+class FrequencyTable(object):
+    '''
+    Looks up frequencies by word in a file from `write_frequency_table`,
+    like a read-only dict. The file is mapped on the first lookup.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._data is not None:
+                return
+
+            with open(self.path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, self._length = _HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError(
+                    "{} isn't a frequency table.".format(self.path))
+            self._words_start = (
+                _HEADER.size + _ENTRY.size * (self._length + 1))
+            self._data = data
+
+    def _entry(self, index):
+        return _ENTRY.unpack_from(
+            self._data, _HEADER.size + _ENTRY.size * index)
+
+    def _word(self, index):
+        start, _ = self._entry(index)
+        end, _ = self._entry(index + 1)
+        return self._data[
+            self._words_start + start:self._words_start + end]
+
+    def get(self, word, default=None):
+        if self._data is None:
+            self._load()
+
+        if isinstance(word, unicode):
+            word = word.encode('utf8')
+
+        low, high = 0, self._length
+        while low < high:
+            middle = (low + high) // 2
+            if self._word(middle) < word:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self._length and self._word(low) == word:
+            return self._entry(low)[1]
+        return default
+
+    def __getitem__(self, word):
+        frequency = self.get(word)
+        if frequency is None:
+            raise KeyError(word)
+        return frequency
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __len__(self):
+        if self._data is None:
+            self._load()
+        return self._length
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import codecs
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from manabi.apps.reading_level.frequency_tables import write_frequency_table
+from manabi.apps.reading_level.word_frequencies import (
+    KANJI_FREQUENCIES_PATH,
+    WORD_FREQUENCIES_PATH,
+)
+
+# Too common to say anything about a text's reading level.
+EXCLUDED_WORDS = [
+    u'の',
+    u'た',
+    u'に',
+    u'は',
+    u'て',
+    u'を',
+    u'だ',
+    u'が',
+    u'と',
+    u'も',
+    u'よ',
+    u'ね',
+    u'へ',
+    u'で',
+    u'じゃ',
+    u'さん',
+    u'・',
+]
+
+
+def _read_report(path):
+    '''
+    Returns a dict of the words in the second column of the report at
+    `path` to their frequencies in the first.
+    '''
+    frequencies = {}
+    with codecs.open(path, encoding='utf-8-sig') as f:
+        for line in f:
+            fields = line.split(u'\t')
+            if len(fields) < 2:
+                continue
+            frequencies[fields[1]] = int(fields[0])
+    return frequencies
+
+
+def _write(frequencies, path):
+    # Replaces the file instead of overwriting it, since running workers
+    # could have the old one mapped.
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        write_frequency_table(frequencies, f)
+    os.rename(temporary_path, path)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compiles the word and kanji frequency reports into the files '
+        'which reading_level.word_frequencies maps.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reports',
+            default=os.path.join(
+                os.path.dirname(settings.PROJECT_ROOT), 'word_frequencies'),
+            help='Directory with base_aggregates.txt and '
+                 'kanji_freq_report.txt.')
+
+    def handle(self, *args, **options):
+        word_frequencies = _read_report(
+            os.path.join(options['reports'], 'base_aggregates.txt'))
+        for word in EXCLUDED_WORDS:
+            word_frequencies.pop(word, None)
+        _write(word_frequencies, WORD_FREQUENCIES_PATH)
+
+        kanji_frequencies = _read_report(
+            os.path.join(options['reports'], 'kanji_freq_report.txt'))
+        _write(kanji_frequencies, KANJI_FREQUENCIES_PATH)
+
+        self.stdout.write('Wrote {} words and {} kanji.'.format(
+            len(word_frequencies), len(kanji_frequencies)))
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from manabi.apps.reading_level.frequency_tables import (
+    FrequencyTable,
+    write_frequency_table,
+)
+
+
+class FrequencyTableTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _table(self, frequencies):
+        path = os.path.join(self.directory, 'frequencies.bin')
+        with open(path, 'wb') as f:
+            write_frequency_table(frequencies, f)
+        return FrequencyTable(path)
+
+    def test_lookup(self):
+        frequencies = {
+            u'人': 2639442,
+            u'下落合': 1,
+            u'ミリタリスト': 1,
+            u'奥羽山脈': 3,
+            u'foo': 42,
+        }
+        table = self._table(frequencies)
+
+        self.assertEqual(len(frequencies), len(table))
+        for word, frequency in frequencies.iteritems():
+            self.assertEqual(frequency, table.get(word))
+            self.assertEqual(frequency, table[word])
+            self.assertEqual(frequency, table.get(word.encode('utf8')))
+
+    def test_missing_words(self):
+        table = self._table({u'下落合': 1, u'人': 5})
+
+        for word in [u'', u'下', u'下落合い', u'一', u'zzz']:
+            self.assertNotIn(word, table)
+            self.assertIsNone(table.get(word))
+        self.assertEqual(0, table.get(u'一', 0))
+        with self.assertRaises(KeyError):
+            table[u'一']
+
+    def test_empty(self):
+        table = self._table({})
+        self.assertEqual(0, len(table))
+        self.assertIsNone(table.get(u'人'))
@@ -0,0 +1,17 @@
+'''
+Word and kanji frequencies from the reports in the `word_frequencies`
+directory, as `FrequencyTable`s. Build their files with the
+`build_word_frequencies` management command.
+'''
+
+import os
+
+from manabi.apps.reading_level.frequency_tables import FrequencyTable
+
+WORD_FREQUENCIES_PATH = os.path.join(
+    os.path.dirname(__file__), 'word_frequencies.bin')
+KANJI_FREQUENCIES_PATH = os.path.join(
+    os.path.dirname(__file__), 'kanji_frequencies.bin')
+
+WORD_FREQUENCIES = FrequencyTable(WORD_FREQUENCIES_PATH)
+KANJI_FREQUENCIES = FrequencyTable(KANJI_FREQUENCIES_PATH)
@@ -0,0 +1,128 @@
+'''
+A harness for benchmarks: registering them, timing their rounds, and
+management commands which print the results as JSON so that runs can be
+compared across commits.
+'''
+
+import json
+import subprocess
+from collections import OrderedDict
+from datetime import datetime
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class Benchmarks(OrderedDict):
+    '''
+    Benchmark functions by name, in the order they're registered with
+    `register` (as a decorator).
+    '''
+
+    def register(self, func):
+        self[func.__name__] = func
+        return func
+
+    def selected(self, names=None):
+        '''
+        Yields `(name, func)` for the benchmarks in `names`, or all of
+        them.
+        '''
+        for name, func in self.iteritems():
+            if not names or name in names:
+                yield name, func
+
+
+def time_rounds(run_round, rounds=5, warmup_rounds=1, count_queries=False):
+    '''
+    Calls `run_round` `warmup_rounds` times, then times it for `rounds`.
+    Returns an ordered dict of the timings (in seconds), and of the query
+    counts per round if `count_queries`.
+    '''
+    def timed_round():
+        started_at = default_timer()
+        run_round()
+        return default_timer() - started_at
+
+    for _ in xrange(warmup_rounds):
+        run_round()
+
+    timings, query_counts = [], []
+    for _ in xrange(rounds):
+        if count_queries:
+            with CaptureQueriesContext(connection) as queries:
+                timings.append(timed_round())
+            query_counts.append(len(queries))
+        else:
+            timings.append(timed_round())
+
+    timings.sort()
+    result = OrderedDict([
+        ('rounds', rounds),
+        ('min', timings[0]),
+        ('median', timings[len(timings) // 2]),
+        ('mean', sum(timings) / len(timings)),
+        ('max', timings[-1]),
+    ])
+    if count_queries:
+        result['queries'] = query_counts
+    return result
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkCommand(BaseCommand):
+    '''
+    Runs benchmarks named on the command line (or all of them), and
+    prints a JSON report of the results along with the commit and time.
+
+    Subclasses set `benchmarks` to the names of the benchmarks they run,
+    and implement `run_benchmarks`.
+    '''
+    benchmarks = ()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmarks', nargs='*',
+            help='Benchmarks to run (default: all of {}).'.format(
+                ', '.join(self.benchmarks)))
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--warmup-rounds', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Write the JSON here instead of to stdout.')
+
+    def run_benchmarks(self, names, **options):
+        '''
+        Returns an ordered dict of what to report, including the results.
+        '''
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        unknown_benchmarks = set(options['benchmarks']) - set(self.benchmarks)
+        if unknown_benchmarks:
+            raise CommandError("Unknown benchmarks: {}".format(
+                ', '.join(sorted(unknown_benchmarks))))
+        if options['rounds'] < 1:
+            raise CommandError("Need at least one round.")
+
+        report = OrderedDict([
+            ('commit', current_commit()),
+            ('ran_at', datetime.utcnow().isoformat()),
+        ])
+        report.update(self.run_benchmarks(options['benchmarks'], **options))
+        report_json = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report_json + '\n')
+        else:
+            self.stdout.write(report_json)
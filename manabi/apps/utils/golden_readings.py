@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+'''
+A golden corpus of readings generated by the `mecab` command, as
+`generate_reading` did before it parsed in-process, for checking that the
+in-process version still generates the same ones.
+
+Capture it with the `capture_golden_readings` management command, on a
+host with the `mecab` command and the production dictionary installed.
+'''
+
+import json
+import os
+import subprocess
+
+from django.conf import settings
+
+from manabi.apps.utils.japanese import _reading_from_mecab_lines
+
+GOLDEN_READINGS_PATH = os.path.join(
+    os.path.dirname(__file__), 'golden_readings.json')
+
+# Captured alongside expressions from facts, for the cases facts are less
+# likely to cover.
+EDGE_CASE_EXPRESSIONS = [
+    u'',
+    u'\n',
+    u'foo',
+    u'Hello, world!',
+    u'ＡＢＣ１２３',
+    u'ｶﾀｶﾅ',
+    u'学び',
+    u'学び\n',
+    u'学び\n学び',
+    u'学び\n\n学び',
+    u'背を寄せる',
+    u'貸し出して',
+    u'曲がり角',
+    u'「はい」と言った。',
+    u'え、本当？！',
+    u'行く・来る',
+    u'一、二、三',
+    u'彼は、学生です',
+    u'（笑）',
+    u'〜について',
+    u'ｗｗｗ',
+    u'1,000円',
+    u'3時',
+    u'東京 大阪',
+    u'東京\t大阪',
+    u'ググる',
+    u'ぴえん',
+    u'𠮷野家',
+    u'魑魅魍魎',
+]
+
+
+def generate_reading_with_mecab_command(expression):
+    '''
+    Returns the reading of `expression` as `generate_reading` used to
+    generate it, by running the `mecab` command.
+    '''
+    expression = expression.encode(settings.MECAB_ENCODING)
+    proc = subprocess.Popen(
+        'mecab', shell=False, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    mecab_output = proc.communicate(expression)[0].decode(
+        settings.MECAB_ENCODING)
+    lines = mecab_output.split(u'\n')[:-2] #skip the \nEOS\n
+    return _reading_from_mecab_lines(lines)
+
+
+def mecab_command_version():
+    return subprocess.check_output(['mecab', '--version']).strip()
+
+
+def capture_golden_readings(expressions):
+    '''
+    Returns the golden corpus for `expressions`, with the readings the
+    `mecab` command gives for them, and the number of expressions it
+    couldn't generate a reading for (which are left out).
+    '''
+    readings, failure_count = [], 0
+    for expression in expressions:
+        try:
+            reading = generate_reading_with_mecab_command(expression)
+        except (IndexError, ValueError):
+            failure_count += 1
+            continue
+        readings.append([expression, reading])
+    corpus = {
+        'mecab_version': mecab_command_version(),
+        'readings': readings,
+    }
+    return corpus, failure_count
+
+
+def load_golden_readings(path=GOLDEN_READINGS_PATH):
+    '''
+    Returns a list of (expression, reading) pairs from the golden corpus,
+    or `None` if it hasn't been captured.
+    '''
+    if not os.path.exists(path):
+        return None
+    with open(path) as corpus_file:
+        corpus = json.load(corpus_file)
+    return [tuple(pair) for pair in corpus['readings']]
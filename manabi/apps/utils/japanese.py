@@ -1,9 +1,11 @@
-import subprocess
 import jcconv
 from itertools import takewhile
 
+import MeCab
 from django.conf import settings
 
+from manabi.apps.furigana.inject import get_tagger, parse_to_node
+
 
 CODE_PAGES = {
     'ascii'   : (2, 126), #todo: full-width roman
@@ -112,12 +114,30 @@ def _furiganaize(word, reading, is_at_beginning_of_transliteration=False):
 
 
 
-def generate_reading(expression):
-    expression = expression.encode(settings.MECAB_ENCODING)
-    proc = subprocess.Popen('mecab', shell=False, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-    mecab_output = proc.communicate(expression)[0].decode(settings.MECAB_ENCODING)
-    lines = mecab_output.split(u'\n')[:-2] #skip the \nEOS\n
+def _mecab_lines(tagger, expression):
+    '''
+    Returns the lines the `mecab` command prints for `expression`, except
+    for the last EOS: "surface\tfeatures" for each word, and EOS after
+    each line of input.
+    '''
+    input_lines = expression.encode(settings.MECAB_ENCODING).split('\n')
+    if input_lines[-1] == '':
+        input_lines.pop()
 
+    lines = []
+    for input_line in input_lines:
+        node = parse_to_node(tagger, input_line)
+        while node:
+            if node.stat not in (MeCab.MECAB_BOS_NODE, MeCab.MECAB_EOS_NODE):
+                lines.append('{}\t{}'.format(node.surface, node.feature))
+            node = node.next
+        lines.append('EOS')
+
+    return [
+        line.decode(settings.MECAB_ENCODING) for line in lines[:-1]]
+
+
+def _reading_from_mecab_lines(lines):
     ret = u''
     for line in lines:
         if line[0] == u',':
@@ -153,6 +173,27 @@ def generate_reading(expression):
     return ret
 
 
+def generate_readings(expressions):
+    '''
+    Returns the readings of `expressions`, in the format of
+    `generate_reading`, parsing them all with this thread's tagger.
+    '''
+    # The default output format, as from the `mecab` command.
+    tagger = get_tagger('')
+    return [
+        _reading_from_mecab_lines(_mecab_lines(tagger, expression))
+        for expression in expressions
+    ]
+
+
+def generate_reading(expression):
+    '''
+    Returns `expression` with the hiragana readings of its words in
+    brackets after their kanji.
+    '''
+    return generate_readings([expression])[0]
+
+
 if __name__ == '__main__':
     expression = u'\u8cb8\u3057\u51fa\u3057\u3066'
     print generate_reading(expression)
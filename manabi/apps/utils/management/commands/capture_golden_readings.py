@@ -0,0 +1,49 @@
+import io
+import json
+
+from django.core.management.base import BaseCommand
+
+from manabi.apps.flashcards.models import Fact
+from manabi.apps.utils.golden_readings import (
+    EDGE_CASE_EXPRESSIONS,
+    GOLDEN_READINGS_PATH,
+    capture_golden_readings,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Captures the readings the `mecab` command generates for the "
+        "expressions of existing facts and for some edge cases, as the "
+        "golden corpus the reading generation tests check against. Needs "
+        "the `mecab` command and the production dictionary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--facts', type=int, default=2000,
+            help="How many distinct fact expressions to include.")
+        parser.add_argument('--output', default=GOLDEN_READINGS_PATH)
+
+    def handle(self, *args, **options):
+        fact_expressions = list(
+            Fact.objects.order_by('expression')
+            .values_list('expression', flat=True)
+            .distinct()[:options['facts']]
+        )
+        expressions = list(EDGE_CASE_EXPRESSIONS) + [
+            expression for expression in fact_expressions
+            if expression not in EDGE_CASE_EXPRESSIONS
+        ]
+
+        corpus, failure_count = capture_golden_readings(expressions)
+
+        with io.open(options['output'], 'w', encoding='utf8') as output:
+            output.write(json.dumps(
+                corpus, ensure_ascii=False, indent=1, sort_keys=True))
+            output.write(u'\n')
+
+        self.stdout.write(
+            "Captured {} readings to {}, skipping {} the `mecab` command "
+            "couldn't read.".format(
+                len(corpus['readings']), options['output'], failure_count))
@@ -3,7 +3,58 @@
 from django.test import TestCase
 
 from japanese import (
-        generate_reading, _furiganaize, _furiganaize_complex_compound_word)
+        generate_reading, generate_readings,
+        _furiganaize, _furiganaize_complex_compound_word)
+from manabi.apps.utils.golden_readings import (
+    GOLDEN_READINGS_PATH,
+    load_golden_readings,
+)
+
+
+# Hand-written spot checks. The golden corpus (see `golden_readings`) is
+# what shows that readings match the ones the `mecab` command gave.
+READING_EXAMPLES = [
+    (u'', u''),
+    (u'foo', u'foo'),
+    (u'学び', u'学[まな]び'),
+    (u'背を寄せる', u'背[せ]を　寄[よ]せる'),
+    (u'貸し出して', u'貸[か]し　出[だ]して'),
+    (u'学び\n学び', u'学[まな]び\n　学[まな]び'),
+    (u'学び\n', u'学[まな]び'),
+]
+
+
+class ReadingGenerationTest(TestCase):
+    def test_examples(self):
+        for expression, reading in READING_EXAMPLES:
+            self.assertEqual(reading, generate_reading(expression))
+
+    def test_batch(self):
+        expressions = [expression for expression, _ in READING_EXAMPLES]
+        self.assertEqual(
+            [reading for _, reading in READING_EXAMPLES],
+            generate_readings(expressions))
+
+
+class GoldenReadingGenerationTest(TestCase):
+    def setUp(self):
+        self.golden_readings = load_golden_readings()
+        if self.golden_readings is None:
+            self.skipTest(
+                "No golden corpus at {}; capture one with the "
+                "capture_golden_readings command.".format(
+                    GOLDEN_READINGS_PATH))
+
+    def test_golden_readings(self):
+        for expression, reading in self.golden_readings:
+            self.assertEqual(
+                reading, generate_reading(expression), repr(expression))
+
+    def test_batch(self):
+        self.assertEqual(
+            [reading for _, reading in self.golden_readings],
+            generate_readings(
+                [expression for expression, _ in self.golden_readings]))
 
 
 # class ReadingGenerationTest(TestCase):
@@ -250,6 +250,7 @@ INSTALLED_APPS = (
     'manabi.apps.flashcards',
     'manabi.apps.featured_decks',
     'manabi.apps.books',
+    'manabi.apps.furigana',
     'manabi.apps.utils',
     'manabi.apps.jdic',
     'manabi.apps.manabi_auth',
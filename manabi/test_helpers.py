@@ -2,10 +2,12 @@ import json
 import random
 import string
 import sys
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.http import HttpResponse
 from rest_framework.test import APITestCase, APIClient
 
@@ -25,6 +27,24 @@ from manabi.apps.flashcards.models.constants import (
 PASSWORD = 'whatever'
 
 
+@contextmanager
+def run_on_commit_callbacks():
+    '''
+    Runs the `transaction.on_commit` callbacks registered within the block
+    when it exits, as if its transaction had committed. Test transactions
+    never commit, so they'd never run otherwise. Callbacks registered in
+    savepoints that were rolled back are already discarded.
+    '''
+    start_count = len(connection.run_on_commit)
+    yield
+    # Callbacks (or the jobs they run synchronously) can register more.
+    while len(connection.run_on_commit) > start_count:
+        callbacks = connection.run_on_commit[start_count:]
+        del connection.run_on_commit[start_count:]
+        for _, callback in callbacks:
+            callback()
+
+
 class ManabiTestCase(APITestCase):
     longMessage = True
 
@@ -57,18 +77,22 @@ class ManabiTestCase(APITestCase):
     def _http_verb(self, verb, url, *args, **kwargs):
         '''
         Defaults to being logged-in with a newly created user.
+
+        Runs what the request deferred until its transaction commits, as
+        outside tests.
         '''
         user = kwargs.pop('user')
         if user is None:
             user = create_user()
         self.client.login(username=user.username, password=PASSWORD)
-        resp = getattr(self.client, verb)(
-            url,
-            user=user,
-            HTTP_ACCEPT='application/json',
-            HTTP_ACCEPT_CHARSET='utf-8',
-            format='json',
-            *args, **kwargs)
+        with run_on_commit_callbacks():
+            resp = getattr(self.client, verb)(
+                url,
+                user=user,
+                HTTP_ACCEPT='application/json',
+                HTTP_ACCEPT_CHARSET='utf-8',
+                format='json',
+                *args, **kwargs)
         headers = dict(resp.items())
         #  if 'json' in headers.get('Content-Type', ''):
         #      resp.json = json.loads(resp.content)
@@ -175,6 +199,12 @@ class APIShortcuts(object):
             '/api/flashcards/shared_decks/{}/subscribers/'.format(deck.id),
         ).json()
 
+    def deck_sync_progress(self, deck, user):
+        return self.get(
+            '/api/flashcards/decks/{}/sync_progress/'.format(deck.id),
+            user=user,
+        ).json()['sync_progress']
+
     def move_fact_to_deck(self, fact, deck, user):
         return self.patch(
             '/api/flashcards/facts/{}/'.format(fact.id),
@@ -182,6 +212,19 @@ class APIShortcuts(object):
             user=user,
         ).json()
 
+    def bulk_edit_facts(self, edits, user):
+        return self.post(
+            '/api/flashcards/facts/bulk_edit/', edits, user=user).json()
+
+    def changes(self, user, cursor=None, page_size=None):
+        params = {}
+        if cursor is not None:
+            params['cursor'] = cursor
+        if page_size is not None:
+            params['page_size'] = page_size
+        return self.get(
+            '/api/flashcards/changes/', params, user=user).json()
+
     def next_cards_for_review(self, user):
         return self.get(
             '/api/flashcards/next_cards_for_review/', user=user).json()
@@ -206,6 +249,13 @@ class APIShortcuts(object):
     def inject_furigana(self, expression):
         return self.post('/api/furigana/inject/', {'text': expression}).json()['text_with_furigana']
 
+    def inject_furigana_batch(self, expressions):
+        return [
+            result['text_with_furigana'] for result in self.post(
+                '/api/furigana/inject/batch/', {'texts': expressions},
+            ).json()['results']
+        ]
+
 
 def random_name():
     return ''.join(random.choice(string.ascii_lowercase) for _ in xrange(5))